@@ -12,7 +12,9 @@ import datetime
 import geometry
 import db_controller
 import rocket_renderer
-import rocket_simulator
+from background_simulation import BackgroundSimulation
+from flight_summary import get_simulator_summary
+from trajectory import DEFAULT_RECORDING_TOLERANCE, TrajectoryIndex
 from rocket_parts import *
 
 
@@ -197,7 +199,7 @@ class RocketLoader():
 
         self.bg_colour = (36, 36, 36)
 
-        self.rockets = db_controller.get_all_saved_rockets()
+        self.rockets = db_controller.get_all_saved_rockets(ROCKET_PARTS)
         self.rockets = sort_rockets(self.rockets)
 
         self.create_window()
@@ -329,7 +331,7 @@ class RocketLoader():
     def delete_selected_rocket(self):
         if self.selected_index != None:
             db_controller.delete_rocket(self.rockets[self.selected_index])
-            self.rockets = db_controller.get_all_saved_rockets()
+            self.rockets = db_controller.get_all_saved_rockets(ROCKET_PARTS)
             self.selected_index = None
     
     def load_selected_rocket(self):
@@ -894,6 +896,18 @@ class Editor():
         self.open_info_panel()
 
 
+def get_flight_info(summary):  # Text of the statistics shown once a flight is over, from a flight summary
+    return {
+        'Total Flight Time': f"{round(summary['flight time'], 3)} s",
+        'Motor Burnout Time': f"{round(summary['burnout time'], 3)} s",
+        'Maximum Altitude': f"{round(summary['apoapsis'], 3)} m",
+        'Maximum Speed': f"{round(summary['max speed'], 3)} m/s",
+        'Maximum Acceleration': f"{round(summary['max acceleration'], 3)} m/s^2",
+        'Maximum G-Force': f"{round(summary['max g-force'], 3)} G's",
+        'Maximum Dynamic Pressure': f"{round(summary['max dynamic pressure'], 3)} Pa"
+    }
+
+
 class SimulationData():
     def __init__(self, rocket, simulator):
         self.alive = True
@@ -965,27 +979,9 @@ class SimulationData():
         plt.close('all')
     
     def get_flight_data(self):
-        burnout_time = self.simulator.flight_data['time'][-1]
-        for i, fuel in enumerate(self.simulator.flight_data['fuel']):
-            if fuel == 0:
-                burnout_time = self.simulator.flight_data['time'][i]
-                break
-        
         self.length_of_data = len(self.simulator.flight_data['time'])
 
-        # Convert negative values to postive so an absolute maximum value can be found
-        speed = [abs(x) for x in self.simulator.flight_data['velocity']]
-        proper_acceleration = [abs(x) for x in self.simulator.flight_data['acceleration']]
-        proper_g_force = [abs(x) for x in self.simulator.flight_data['g-force']]
-
-        self.flight_info = {
-            'Total Flight Time': f"{round(self.simulator.flight_data['time'][-1], 3)} s",
-            'Motor Burnout Time': f"{round(burnout_time, 3)} s",
-            'Maximum Altitude': f"{round(max(self.simulator.flight_data['altitude']), 3)} m",
-            'Maximum Speed': f"{round(max(speed), 3)} m/s",
-            'Maximum Acceleration': f"{round(max(proper_acceleration), 3)} m/s^2",
-            'Maximum G-Force': f"{round(max(proper_g_force), 3)} G's"
-        }
+        self.flight_info = get_flight_info(get_simulator_summary(self.simulator))
     
     def create_graphs(self):
         self.fig = plt.figure('Simulation Data', figsize=(10, 8), tight_layout=True)
@@ -1007,7 +1003,10 @@ class SimulationData():
                 unit = 'kg'
             if key != 'time':
                 ax = self.fig.add_subplot(math.ceil(len(self.simulator.flight_data)/2), 2, i)
-                ax.plot(self.simulator.flight_data['time'], self.simulator.flight_data[key])
+                if key != 'stage':  # Lines between the recorded rows are the interpolation they were recorded for
+                    ax.plot(self.simulator.flight_data['time'], self.simulator.flight_data[key])
+                else:
+                    ax.plot(self.simulator.flight_data['time'], self.simulator.flight_data[key], drawstyle='steps-post')
                 ax.set_xlabel('Time (s)')
                 if key != 'stage':  # Stage number has no units
                     ax.set_ylabel(f'{key.capitalize()} ({unit})')
@@ -1034,6 +1033,7 @@ class SimulationPlayer():
         self.rocket_zoom_increment = 0.1
 
         self.current_stage = 0
+        self.state = None  # Flight data row at the time being shown, interpolated from the recorded rows
 
         self.rocket_angle = -math.pi / 2
         self.paused = True
@@ -1049,13 +1049,14 @@ class SimulationPlayer():
         settings_window = SimulationSettings(self.original_rocket)
         self.settings = settings_window.settings
 
+        self.simulation = None  # BackgroundSimulation of the flight, see start_simulation
         self.simulator = None
 
         self.create_window()
     
     def create_window(self):
-        if self.simulator is None:
-            self.get_flight_data()
+        if self.simulation is None:
+            self.start_simulation()
 
         self.window_dimensions = (1500, 700)
         self.monitor_dimensions = (1920, 1080)
@@ -1102,12 +1103,16 @@ class SimulationPlayer():
         self.zoom_out_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(1000, 630, 60, 60), text='', manager=self.ui_manager, object_id=zoom_out_button_object_id)
 
         self.show_graphs_button = pygame_gui.elements.UIButton(relative_rect=pygame.Rect(1310, 630, 180, 60), text='Graphs', manager=self.ui_manager)
+        if self.flight_info is None:  # Enabled once the whole flight has been simulated
+            self.show_graphs_button.disable()
 
         self.clock = pygame.time.Clock()
 
         while self.alive:
             self.time_delta = self.clock.tick(60)/1000
 
+            self.update_flight_data()
+
             # Time slider logic
             mouse_pos = pygame.mouse.get_pos()
             if self.slider_dimensions[0][0] <= mouse_pos[0] <= self.slider_dimensions[1][0] and self.slider_button_pressed:
@@ -1120,19 +1125,22 @@ class SimulationPlayer():
                 self.actual_time = self.time_step * self.simulator.settings['time increment']
 
             # Time incrementing
+            time_increment = self.simulator.settings['time increment']
             if not self.paused and not self.slider_button_pressed:
                 self.actual_time = self.actual_time + self.time_delta * self.time_multiplier * 0.78  # Constant is needed otherwise the simulation runs too fast
 
-                time_per_step = self.simulator.flight_data['time'][-1] / self.length_of_data
-                self.time_step = round(self.actual_time / time_per_step)
+                self.time_step = round(self.actual_time / time_increment)
 
-            # Time bounds
-            if self.time_step >= self.length_of_data:
-                self.time_step = self.length_of_data - 1
-            elif self.time_step < 0:
+            # Time bounds, playback waits at the last simulated step until more of the flight has been simulated
+            if self.time_step >= self.computed_steps:
+                self.time_step = self.computed_steps - 1
+                if self.flight_info is None:
+                    self.actual_time = self.time_step * time_increment
+            if self.time_step < 0:
                 self.time_step = 0
 
-            self.update_rocket_state()
+            if self.computed_steps > 0:
+                self.update_rocket_state()
 
             self.handle_events()
 
@@ -1194,41 +1202,68 @@ class SimulationPlayer():
     def render(self):
         self.root.fill(self.bg_colour)
 
-        rocket_renderer.render_rocket_simulation(current_rocket=self.simulator.rocket_at_stage[self.current_stage], flight_data=self.simulator.flight_data, time_step=self.time_step, root=self.root, angle=self.rocket_angle, container=self.rocket_container, font=self.font, zoom_multiplier=self.rocket_zoom)
+        if self.state is not None:  # Nothing is shown until the first step has been simulated
+            rocket_renderer.render_rocket_simulation(current_rocket=self.simulator.get_rocket_at_stage(self.current_stage), state=self.state, apoapsis=self.apoapsis, root=self.root, angle=self.rocket_angle, container=self.rocket_container, font=self.font, zoom_multiplier=self.rocket_zoom)
 
         self.ui_manager.draw_ui(self.root)
-        self.slider_button_pos = rocket_renderer.draw_slider(self.root, self.slider_dimensions[0], self.slider_dimensions[1], self.time_step/self.length_of_data, button_radius=self.slider_button_radius)
+        self.slider_button_pos = rocket_renderer.draw_slider(self.root, self.slider_dimensions[0], self.slider_dimensions[1], self.time_step/self.length_of_data, button_radius=self.slider_button_radius, computed=self.computed_steps/self.length_of_data)
 
         pygame.display.update()
 
-    def get_flight_data(self):
-        self.simulator = rocket_simulator.Simulator(self.original_rocket, self.settings)
-        self.simulator.simulate()
+    def start_simulation(self):
+        # Only the rows needed to interpolate the flight to within the default tolerance are recorded, the player steps through
+        # it at the time increment by interpolating between them
+        # The flight is simulated in the background, so playback starts straight away and can go as far as has been simulated
+        self.simulation = BackgroundSimulation(self.original_rocket, self.settings, recording_tolerance=DEFAULT_RECORDING_TOLERANCE)
+        self.simulator = self.simulation.simulator
+        self.simulation.start()
 
-        burnout_time = self.simulator.flight_data['time'][-1]
-        for i, fuel in enumerate(self.simulator.flight_data['fuel']):
-            if fuel == 0:
-                burnout_time = self.simulator.flight_data['time'][i]
-                break
-        
-        self.length_of_data = len(self.simulator.flight_data['time'])
+        self.flight_data = None
+        self.trajectory_index = None  # TrajectoryIndex of the rows simulated so far
+        self.flight_info = None  # Statistics of the whole flight, worked out once it has all been simulated
 
-        # Convert negative values to postive so an absolute maximum value can be found
-        speed = [abs(x) for x in self.simulator.flight_data['velocity']]
-        proper_acceleration = [abs(x) for x in self.simulator.flight_data['acceleration']]
-        proper_g_force = [abs(x) for x in self.simulator.flight_data['g-force']]
-
-        self.flight_info = {
-            'Total Flight Time': f"{round(self.simulator.flight_data['time'][-1], 3)} s",
-            'Motor Burnout Time': f"{round(burnout_time, 3)} s",
-            'Maximum Altitude': f"{round(max(self.simulator.flight_data['altitude']), 3)} m",
-            'Maximum Speed': f"{round(max(speed), 3)} m/s",
-            'Maximum Acceleration': f"{round(max(proper_acceleration), 3)} m/s^2",
-            'Maximum G-Force': f"{round(max(proper_g_force), 3)} G's"
-        }
+    def update_flight_data(self):  # Takes the rows simulated since the last frame
+        if self.flight_info is not None:
+            return None
+        if self.simulation.error is not None:
+            raise self.simulation.error
+
+        finished = self.simulation.finished
+        self.flight_data = self.simulation.get_flight_data()
+
+        time_increment = self.simulator.settings['time increment']
+        times = self.flight_data['time']
+        if len(times) == 0:
+            self.computed_steps = 0
+            self.end_time = self.simulator.settings['time cutoff']
+            self.length_of_data = round(self.end_time / time_increment) + 1
+            self.apoapsis = 0
+            self.apoapsis_time_step = 0
+            return None
+
+        # Until the flight is over the slider covers the longest flight the time cutoff allows
+        self.computed_steps = round(times[-1] / time_increment) + 1
+        self.end_time = times[-1] if finished else max(times[-1], self.simulator.settings['time cutoff'])
+        self.length_of_data = round(self.end_time / time_increment) + 1
+
+        if self.trajectory_index is None:
+            self.trajectory_index = TrajectoryIndex(self.flight_data)
+        else:
+            self.trajectory_index.update(self.flight_data)
+
+        self.apoapsis, apoapsis_time = self.trajectory_index.get_max('altitude')
+        self.apoapsis_time_step = round(apoapsis_time / time_increment)
+
+        if finished:
+            self.get_flight_info()
+            self.show_graphs_button.enable()
+
+    def get_flight_info(self):
+        self.flight_info = get_flight_info(get_simulator_summary(self.simulator))
     
     def update_rocket_state(self):
-        self.current_stage = self.simulator.flight_data['stage'][self.time_step]
+        self.state = self.trajectory_index.interpolate(self.time_step * self.simulator.settings['time increment'])
+        self.current_stage = int(self.state['stage'])
         
         # Update info labels
         for label_variable in self.info_labels:
@@ -1244,11 +1279,11 @@ class SimulationPlayer():
             if label_variable == 'stage':
                 new_value = self.current_stage
             elif label_variable == 'altitude':
-                new_value = round(self.simulator.flight_data['altitude'][self.time_step], significant_figures)
+                new_value = round(float(self.state['altitude']), significant_figures)
             elif label_variable == 'velocity':
-                new_value = round(self.simulator.flight_data['velocity'][self.time_step], significant_figures)
+                new_value = round(float(self.state['velocity']), significant_figures)
             elif label_variable == 'acceleration':
-                new_value = round(self.simulator.flight_data['acceleration'][self.time_step], significant_figures)
+                new_value = round(float(self.state['acceleration']), significant_figures)
             elif label_variable == 'simulation speed':
                 new_value = self.time_multiplier
             elif label_variable == 'zoom':
@@ -1259,7 +1294,7 @@ class SimulationPlayer():
         self.update_rocket_angle()
 
     def update_rocket_angle(self):
-        apoapsis_time_step = self.simulator.flight_events['apoapsis']
+        apoapsis_time_step = self.apoapsis_time_step
         apoapsis_curve_steps = 0.1 *  self.length_of_data  # Number of time steps before and after apoapsis that the rocket should rotate
         min_segment = min((apoapsis_time_step, self.length_of_data - apoapsis_time_step))
         if min_segment < apoapsis_curve_steps:  # If curve starts before the simulation starts, adjust the curve length
@@ -1413,6 +1448,7 @@ if __name__ == "__main__":
     logging.info('Program started')
 
     try:
+        db_controller.init_db()
         MainMenu()
     except:
         dt = datetime.datetime.now().strftime("%d/%m/%Y %H:%M:%S")
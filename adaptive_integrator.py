@@ -0,0 +1,81 @@
+# Embedded Runge-Kutta (Dormand-Prince 5(4)) integration with error control, for systems with no explicit time dependency
+# States are plain lists of floats, as the systems integrated here are only a handful of variables
+
+C = [0, 1/5, 3/10, 4/5, 8/9, 1]
+A = [
+    [],
+    [1/5],
+    [3/40, 9/40],
+    [44/45, -56/15, 32/9],
+    [19372/6561, -25360/2187, 64448/6561, -212/729],
+    [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656]
+]
+B = [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]  # 5th order weights
+E = [71/57600, 0, -71/16695, 71/1920, -17253/339200, 22/525, -1/40]  # Difference between the 5th and embedded 4th order weights
+
+SAFETY_FACTOR = 0.9
+MIN_STEP_CHANGE = 0.2
+MAX_STEP_CHANGE = 5
+MAX_EVENT_ITERATIONS = 100
+
+
+def dormand_prince_step(derivatives, y, h):  # Returns the new state and an estimate of its local error
+    k = [derivatives(y)]
+    for i in range(1, 6):
+        y_stage = [y[j] + h * sum(A[i][m] * k[m][j] for m in range(i)) for j in range(len(y))]
+        k.append(derivatives(y_stage))
+
+    y_new = [y[j] + h * sum(B[m] * k[m][j] for m in range(6)) for j in range(len(y))]
+    k.append(derivatives(y_new))
+
+    error = [h * sum(E[m] * k[m][j] for m in range(7)) for j in range(len(y))]
+
+    return y_new, error
+
+
+def get_error_ratio(y, y_new, error, relative_tolerance, absolute_tolerance):  # Step is accepted when this is at most 1
+    error_ratio = 0
+    for j in range(len(y)):
+        scale = absolute_tolerance[j] + relative_tolerance * max(abs(y[j]), abs(y_new[j]))
+        error_ratio = max(error_ratio, abs(error[j]) / scale)
+
+    return error_ratio
+
+
+def get_step_change(error_ratio):  # Factor to multiply the step size by for the next attempt
+    if error_ratio == 0:
+        return MAX_STEP_CHANGE
+
+    return min(MAX_STEP_CHANGE, max(MIN_STEP_CHANGE, SAFETY_FACTOR * error_ratio ** -0.2))
+
+
+def locate_event(get_value, h, value_start, value_end, time_tolerance):  # Root of get_value(s) for s in [0, h], given a sign change between the ends
+    # Illinois variant of regula falsi, which keeps the bracket like bisection but converges superlinearly
+    low, high = 0, h
+    value_low, value_high = value_start, value_end
+    side = 0
+
+    for _ in range(MAX_EVENT_ITERATIONS):
+        if high - low <= time_tolerance:
+            break
+
+        s = (low * value_high - high * value_low) / (value_high - value_low)
+        if not low < s < high:
+            s = (low + high) / 2
+
+        value = get_value(s)
+        if value == 0:
+            return s
+
+        if (value > 0) == (value_low > 0):
+            low, value_low = s, value
+            if side == -1:
+                value_high /= 2
+            side = -1
+        else:
+            high, value_high = s, value
+            if side == 1:
+                value_low /= 2
+            side = 1
+
+    return high  # End of the bracket that is past the event, so the event condition holds at the returned time
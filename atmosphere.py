@@ -0,0 +1,95 @@
+import functools
+import math
+
+import numpy as np
+
+from tables import get_table_value, get_table_values
+
+# International Standard Atmosphere up to 86 km, tabulated once per process so a lookup is an index and one linear interpolation
+# Above and below the table the values at its ends are used
+
+ATMOSPHERES = ['constant', 'standard']
+
+SEA_LEVEL_TEMPERATURE = 288.15  # K
+SEA_LEVEL_PRESSURE = 101325  # Pa
+SEA_LEVEL_DENSITY = 1.225  # kg/m^3
+STANDARD_GRAVITY = 9.80665  # m/s^2
+GAS_CONSTANT = 287.05287  # J/(kg K), for dry air
+HEAT_CAPACITY_RATIO = 1.4
+EARTH_RADIUS = 6356766  # m, used to convert to geopotential altitude
+SEA_LEVEL_SPEED_OF_SOUND = math.sqrt(HEAT_CAPACITY_RATIO * GAS_CONSTANT * SEA_LEVEL_TEMPERATURE)  # m/s, used at every altitude in a constant atmosphere
+
+# (base geopotential altitude in m, temperature lapse rate in K/m) of each layer
+LAYERS = [
+    (0, -0.0065),
+    (11000, 0),
+    (20000, 0.001),
+    (32000, 0.0028),
+    (47000, 0),
+    (51000, -0.0028),
+    (71000, -0.002)
+]
+
+TABLE_BOTTOM = -2000  # m
+TABLE_TOP = 86000  # m
+TABLE_SPACING = 10  # m
+TABLE_SIZE = (TABLE_TOP - TABLE_BOTTOM) // TABLE_SPACING  # Intervals in the table
+
+
+def get_standard_values(altitude):  # (temperature, pressure) at a geometric altitude in m, computed layer by layer
+    geopotential_altitude = EARTH_RADIUS * altitude / (EARTH_RADIUS + altitude)
+
+    temperature = SEA_LEVEL_TEMPERATURE
+    pressure = SEA_LEVEL_PRESSURE
+    for layer, (base, lapse_rate) in enumerate(LAYERS):
+        top = LAYERS[layer + 1][0] if layer + 1 < len(LAYERS) else math.inf
+        height = min(geopotential_altitude, top) - base
+        if layer > 0 and height <= 0:
+            break
+
+        if lapse_rate == 0:
+            pressure *= math.exp(-STANDARD_GRAVITY * height / (GAS_CONSTANT * temperature))
+        else:
+            new_temperature = temperature + lapse_rate * height
+            pressure *= (new_temperature / temperature) ** (-STANDARD_GRAVITY / (lapse_rate * GAS_CONSTANT))
+            temperature = new_temperature
+
+        if geopotential_altitude <= top:
+            break
+
+    return temperature, pressure
+
+
+class AtmosphereTable():
+    # Temperature, pressure, density and speed of sound every TABLE_SPACING m from TABLE_BOTTOM to TABLE_TOP
+    def __init__(self):
+        self.altitudes = TABLE_BOTTOM + TABLE_SPACING * np.arange(TABLE_SIZE + 1)
+
+        values = np.array([get_standard_values(altitude) for altitude in self.altitudes.tolist()])
+        self.temperature = values[:, 0]
+        self.pressure = values[:, 1]
+        self.density = self.pressure / (GAS_CONSTANT * self.temperature)
+        self.speed_of_sound = np.sqrt(HEAT_CAPACITY_RATIO * GAS_CONSTANT * self.temperature)
+
+        # Density relative to sea level, so a simulation's air density setting still sets the density at sea level
+        self.density_ratio = self.density / self.density[-TABLE_BOTTOM // TABLE_SPACING]
+
+        self.density_ratio_list = self.density_ratio.tolist()
+        self.speed_of_sound_list = self.speed_of_sound.tolist()
+
+    def get_density_ratio(self, altitude):
+        return get_table_value(self.density_ratio_list, TABLE_BOTTOM, TABLE_SPACING, TABLE_SIZE, altitude)
+
+    def get_speed_of_sound(self, altitude):
+        return get_table_value(self.speed_of_sound_list, TABLE_BOTTOM, TABLE_SPACING, TABLE_SIZE, altitude)
+
+    def get_density_ratios(self, altitudes):  # As get_density_ratio for an array of altitudes
+        return get_table_values(self.density_ratio, TABLE_BOTTOM, TABLE_SPACING, TABLE_SIZE, altitudes)
+
+    def get_speeds_of_sound(self, altitudes):
+        return get_table_values(self.speed_of_sound, TABLE_BOTTOM, TABLE_SPACING, TABLE_SIZE, altitudes)
+
+
+@functools.lru_cache(maxsize=None)
+def get_standard_atmosphere():  # The table is built the first time it is needed, then shared by every simulation in the process
+    return AtmosphereTable()
@@ -0,0 +1,106 @@
+import collections
+import copy
+import threading
+
+import rocket_simulator
+import simulation_cache
+from trajectory import Trajectory
+
+# A simulation run by a worker thread, so a window can open and play the flight back while it is still being simulated
+# The worker records rows into the simulator's flight data as usual. Rows are only ever appended to it, and a row is written
+# before the length is increased past it, so the rows recorded so far can be read at any time without waiting, see get_flight_data
+# Each flight keeps checkpoints, so the next simulation of a rocket after an edit carries on from the last point the edit cannot
+# have changed instead of starting again, see rocket_simulator.Simulator.resimulate
+
+CHECKPOINT_INTERVAL = 1000  # Rows between checkpoints
+MAX_PREVIOUS_FLIGHTS = 4  # Rockets whose last flight is kept to carry on from
+
+
+class PreviousFlights():
+    # rocket_simulator.FlightCheckpoints of the last flight to finish for each rocket name, least recently used rockets forgotten first
+    # The name only picks which flight to try carrying on from, the simulator checks the rockets are the same up to the checkpoint it
+    # carries on from
+    def __init__(self, max_flights=MAX_PREVIOUS_FLIGHTS):
+        self.max_flights = max_flights
+        self.flights = collections.OrderedDict()
+        self.lock = threading.Lock()  # Flights are put from the worker threads
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.flights:
+                return None
+
+            self.flights.move_to_end(name)
+            return self.flights[name]
+
+    def put(self, name, flight_checkpoints):
+        with self.lock:
+            self.flights[name] = flight_checkpoints
+            self.flights.move_to_end(name)
+            while len(self.flights) > self.max_flights:
+                self.flights.popitem(last=False)
+
+
+previous_flights = PreviousFlights()
+
+
+class BackgroundSimulation():
+    # Results are looked up in and added to cache, a simulation_cache.SimulationCache, the default cache if it is None
+    # Flights are always recorded in memory, so their rows can be read while they are being simulated
+    # previous is the rocket_simulator.FlightCheckpoints or finished simulator of an earlier version of the flight to carry on from,
+    # the last flight of a rocket with the same name if it is None. Only euler flights keep checkpoints, every checkpoint_interval rows, and carry on from them
+    # The rocket and settings are copied, so editing them while the flight is simulated changes neither the flight nor its cache key
+    def __init__(self, rocket, settings, cache=None, previous=None, checkpoint_interval=CHECKPOINT_INTERVAL, **options):
+        rocket = copy.deepcopy(rocket)
+        settings = dict(settings)
+
+        self.cache = cache if cache is not None else simulation_cache.get_default_cache()
+        self.key = simulation_cache.get_cache_key(rocket, settings, **options)  # Checkpoints never change the results
+
+        if options.get('integrator', 'euler') != 'euler':
+            checkpoint_interval = None
+        self.simulator = rocket_simulator.Simulator(rocket, settings, checkpoint_interval=checkpoint_interval, **options)
+        self.name = rocket.name
+        self.reused_steps = 0  # Steps taken from previous rather than simulated again
+
+        self.thread = None
+        self.error = None  # Exception raised by the simulation, if it failed
+        self.finished = self.cache.load_results(self.key, self.simulator)
+        self.previous = None
+        if not self.finished:
+            self.previous = previous if previous is not None else previous_flights.get(self.name)
+
+    def start(self):
+        if not self.finished and self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)  # Never keeps the program open once the windows are closed
+            self.thread.start()
+
+    def run(self):
+        try:
+            if self.previous is not None:
+                self.reused_steps = self.simulator.resimulate(self.previous)
+            else:
+                self.simulator.simulate()
+            self.cache.put_results(self.key, self.simulator)
+
+            flight_checkpoints = self.simulator.get_flight_checkpoints()
+            if flight_checkpoints is not None:
+                previous_flights.put(self.name, flight_checkpoints)
+        except Exception as error:
+            self.error = error
+        self.previous = None  # Its flight data is no longer needed
+
+        self.finished = True  # Only set once the flight data and flight events are final
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def get_flight_data(self):  # Trajectory of the rows recorded so far, which is the simulator's own flight data once finished
+        if self.finished:
+            return self.simulator.flight_data
+
+        flight_data = self.simulator.flight_data
+        length = flight_data.length  # Read before the rows, which may be moved to a larger buffer but never lose a recorded row
+
+        return Trajectory.from_array(flight_data.data[:length])
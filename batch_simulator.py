@@ -0,0 +1,384 @@
+import numpy as np
+
+import thrust_curves
+import drag_tables
+from tables import get_table_values
+from rocket_simulator import *
+
+FLIGHT_DATA_KEYS = ['time', 'altitude', 'velocity', 'acceleration', 'g-force', 'thrust', 'drag', 'fuel', 'mass', 'stage']
+
+# Arrays with a value for each active member, which are compacted as members finish
+MEMBER_ATTRIBUTES = ['gravity_acc', 'air_density', 'time_increment', 'altitude_cutoff', 'time_cutoff', 'drag_coefficient_area_total', 'drag_table_index',
+                     'mass', 'fuel', 'average_thrust', 'burn_time', 'propellant_mass', 'curve_index', 'impulse_fraction', 'current_stage', 'max_stage',
+                     'time', 'altitude', 'velocity', 'acceleration', 'g_force', 'thrust', 'drag']
+
+
+def broadcast_members(rockets, settings):  # Pairs up rockets and settings, a single rocket or settings dict is shared by every member
+    if not isinstance(rockets, (list, tuple)):
+        rockets = [rockets]
+    if not isinstance(settings, (list, tuple)):
+        settings = [settings]
+
+    size = max(len(rockets), len(settings))
+    if len(rockets) not in (1, size) or len(settings) not in (1, size):
+        raise Exception('Number of rockets and number of settings do not match')
+
+    if len(rockets) == 1:
+        rockets = list(rockets) * size
+    if len(settings) == 1:
+        settings = list(settings) * size
+
+    return list(rockets), list(settings)
+
+
+class BatchSimulator():
+    # Runs the same flight model as Simulator for many members at once, each member being a (rocket, settings) pair
+    # All state is held in arrays of the members still flying, which are advanced together each step
+    # atmosphere and drag_model are shared by every member, as for Simulator
+    flight_data_keys = FLIGHT_DATA_KEYS
+    member_attributes = MEMBER_ATTRIBUTES
+
+    def __init__(self, rockets, settings, record=True, atmosphere='constant', drag_model='constant'):
+        if atmosphere not in ATMOSPHERES:
+            raise Exception(f'Invalid atmosphere: {atmosphere}')
+        if drag_model not in DRAG_MODELS:
+            raise Exception(f'Invalid drag model: {drag_model}')
+
+        self.rockets, self.settings = broadcast_members(rockets, settings)
+        self.size = len(self.rockets)
+        self.record = record  # Without recording, only flight events and the final state are kept, for large studies
+        self.atmosphere_table = get_standard_atmosphere() if atmosphere == 'standard' else None
+        self.drag_model = drag_model
+
+        self.gravity_acc = np.array([member_settings['gravity acc'] for member_settings in self.settings], dtype=float)
+        self.air_density = np.array([member_settings['air density'] for member_settings in self.settings], dtype=float)
+        self.time_increment = np.array([member_settings['time increment'] for member_settings in self.settings], dtype=float)
+        self.altitude_cutoff = np.array([member_settings['altitude cutoff'] for member_settings in self.settings], dtype=float)
+        self.time_cutoff = np.array([member_settings['time cutoff'] for member_settings in self.settings], dtype=float)
+
+        self.drag_coefficient_area_total = np.zeros(self.size)
+        self.mass = np.zeros(self.size)
+        self.fuel = np.ones(self.size)
+        self.average_thrust = np.zeros(self.size)
+        self.burn_time = np.zeros(self.size)
+        self.propellant_mass = np.zeros(self.size)
+        self.current_stage = np.zeros(self.size, dtype=int)
+        self.max_stage = np.zeros(self.size, dtype=int)
+
+        # Tables of every thrust curve in the batch, one row per curve, and the row each member's engine uses, -1 for constant thrust
+        self.thrust_curves = []
+        self.curve_index = np.full(self.size, -1)
+        self.impulse_fraction = np.zeros(self.size)  # Fraction of the thrust curve's impulse delivered so far
+
+        # With 'mach' drag, the drag coefficient x area tables of every set of attached parts in the batch, and the one each member uses
+        self.drag_coefficient_area_table_list = []
+        self.drag_table_indices = {}  # id of a table: its index in drag_coefficient_area_table_list
+        self.drag_table_index = np.full(self.size, -1)
+
+        # Stage tables, padded to the largest number of stages. NaN means the stage leaves that value unchanged
+        stage_plans = [get_stage_plan(rocket) for rocket in self.rockets]
+        stage_count = max([len(stage_plan) for stage_plan in stage_plans] + [1])
+
+        self.next_stage = np.zeros((self.size, stage_count), dtype=int)
+        self.mass_at_stage = np.full((self.size, stage_count), np.nan)
+        self.drag_coefficient_area_total_at_stage = np.full((self.size, stage_count), np.nan)
+        self.average_thrust_at_stage = np.full((self.size, stage_count), np.nan)
+        self.burn_time_at_stage = np.full((self.size, stage_count), np.nan)
+        self.propellant_mass_at_stage = np.full((self.size, stage_count), np.nan)
+        self.curve_index_at_stage = np.full((self.size, stage_count), -1)
+        self.drag_table_index_at_stage = np.full((self.size, stage_count), -1)
+
+        aerodynamic_caches = {}  # Members sharing a rocket share its cache, and so its drag tables
+        for member, (rocket, stage_plan) in enumerate(zip(self.rockets, stage_plans)):
+            if id(rocket) not in aerodynamic_caches:
+                aerodynamic_caches[id(rocket)] = AerodynamicCache(rocket)
+            aerodynamic_cache = aerodynamic_caches[id(rocket)]
+
+            properties = aerodynamic_cache.get(stage_plan[get_first_stage(rocket)].part_ids)
+            self.drag_coefficient_area_total[member] = properties.drag_coefficient_area_total
+            self.drag_table_index[member] = self.get_drag_table_index(properties)
+
+            mass = 0
+            engine = None
+            for part in rocket.parts:
+                mass += part.mass
+                if isinstance(part, Engine):
+                    engine = part
+            self.mass[member] = mass
+
+            if engine is None:  # No engine found
+                self.fuel[member] = 0
+            else:
+                self.average_thrust[member] = engine.average_thrust
+                self.burn_time[member] = engine.burn_time
+                self.propellant_mass[member] = engine.propellant_mass
+                self.curve_index[member] = self.get_curve_index(engine)
+
+            self.max_stage[member] = len(stage_plan) - 1
+            self.current_stage[member] = get_first_stage(rocket)
+
+            for stage_number, stage in enumerate(stage_plan):
+                next_stage = min(stage_number + 1, self.max_stage[member])
+                while next_stage < self.max_stage[member] and len(rocket.stages[next_stage]) == 0:
+                    next_stage += 1
+                self.next_stage[member, stage_number] = next_stage
+
+                if stage.mass is not None:
+                    self.mass_at_stage[member, stage_number] = stage.mass
+                    properties = aerodynamic_cache.get(stage.part_ids)
+                    self.drag_coefficient_area_total_at_stage[member, stage_number] = properties.drag_coefficient_area_total
+                    self.drag_table_index_at_stage[member, stage_number] = self.get_drag_table_index(properties)
+                if stage.engine is not None:
+                    self.average_thrust_at_stage[member, stage_number] = stage.engine.average_thrust
+                    self.burn_time_at_stage[member, stage_number] = stage.engine.burn_time
+                    self.propellant_mass_at_stage[member, stage_number] = stage.engine.propellant_mass
+                    self.curve_index_at_stage[member, stage_number] = self.get_curve_index(stage.engine)
+
+        self.impulse_fraction_tables = np.concatenate([curve.impulse_fractions for curve in self.thrust_curves] + [np.zeros(0)])
+        self.drag_coefficient_area_tables = np.concatenate(self.drag_coefficient_area_table_list + [np.zeros(0)])
+
+        self.time = np.zeros(self.size)
+        self.altitude = np.zeros(self.size)
+        self.velocity = np.zeros(self.size)
+        self.acceleration = np.zeros(self.size)
+        self.g_force = np.zeros(self.size)
+        self.thrust = self.average_thrust.copy()
+        self.drag = np.zeros(self.size)
+
+        self.active = np.arange(self.size)  # Members still flying, the state arrays above are compacted to only these members as the batch runs
+        self.step_count = 0
+        self.length_of_data = np.zeros(self.size, dtype=int)
+
+        self.apoapsis_altitude = np.full(self.size, -np.inf)
+        self.apoapsis_step = np.zeros(self.size, dtype=int)
+        self.propellant_depletion_step = np.zeros(self.size, dtype=int)
+        self.last_fuel = np.zeros(self.size)
+        self.max_velocity = np.full(self.size, -np.inf)
+        self.burnout_time = np.full(self.size, np.nan)  # Time of the first step with no fuel left, or the end of the flight if it never burns out
+
+        # Recorded values of the active members, one array per step, which are regrouped by member at the end
+        self.recorded_members = []
+        self.recorded_values = {key: [] for key in self.flight_data_keys}
+
+        self.flight_data = [None] * self.size
+        self.flight_events = [None] * self.size
+
+        # Final state of each member, filled in as members finish
+        self.final_state = {key: np.zeros(self.size, dtype=int if key == 'stage' else float) for key in self.flight_data_keys}
+
+    def get_curve_index(self, engine):  # Row of the engine's thrust curve in the tables, -1 for constant thrust
+        curve = engine.get_thrust_curve()
+        if curve is None:
+            return -1
+
+        for index, other_curve in enumerate(self.thrust_curves):
+            if other_curve is curve:
+                return index
+
+        self.thrust_curves.append(curve)
+        return len(self.thrust_curves) - 1
+
+    def get_drag_table_index(self, properties):  # Index of the drag coefficient x area table of a set of attached parts, -1 without 'mach' drag
+        if self.drag_model != 'mach':
+            return -1
+
+        table = properties.drag_coefficient_area_table
+        if id(table) not in self.drag_table_indices:
+            self.drag_table_indices[id(table)] = len(self.drag_coefficient_area_table_list)
+            self.drag_coefficient_area_table_list.append(table)
+
+        return self.drag_table_indices[id(table)]
+
+    def simulate(self):
+        while len(self.active) > 0:
+            self.step()
+
+            self.update_flight_data()
+
+            # Cutoff logic
+            self.step_count += 1
+            elapsed_time = self.step_count * self.time_increment
+
+            finished = (self.altitude < self.altitude_cutoff) | (elapsed_time > self.time_cutoff)
+            if finished.any():
+                self.end_members(finished)
+
+            self.time += self.time_increment
+
+        self.end_simulation()
+
+    def step(self):
+        burning = self.burn_time != 0
+        fuel_decrease = np.full(len(self.active), float(LARGE_NUMBER))  # Large number to represent dividing by zero
+        np.divide(self.time_increment, self.burn_time, out=fuel_decrease, where=burning)
+
+        partial_burn = (self.fuel < fuel_decrease) & (self.fuel > 0)  # Engine burning partway during the time step
+        no_burn = self.fuel <= 0  # Engine not burning at all during the time step
+        full_burn = ~(partial_burn | no_burn)  # Engine burning all the way during the time step
+
+        new_fuel = np.where(full_burn, self.fuel - fuel_decrease, 0.0)
+
+        # Engines with a thrust curve deliver the impulse the curve gives between the old and new fuel, as in Simulator.burn_thrust_curve
+        # Once burnt out the impulse fraction stays put, so no thrust or mass change comes from it
+        curved = self.curve_index >= 0
+        if len(self.thrust_curves) > 0 and curved.all():
+            new_impulse_fraction = get_table_values(self.impulse_fraction_tables, 0, thrust_curves.TABLE_SPACING, thrust_curves.TABLE_SIZE, 1 - new_fuel, self.curve_index)
+            impulse_fraction = new_impulse_fraction - self.impulse_fraction
+            self.impulse_fraction = new_impulse_fraction
+
+            self.thrust = self.average_thrust * self.burn_time * impulse_fraction / self.time_increment
+            new_mass = self.mass - impulse_fraction * self.propellant_mass
+        else:
+            self.thrust = np.where(full_burn, self.average_thrust, 0.0)
+            self.thrust[partial_burn] = self.average_thrust[partial_burn] * self.fuel[partial_burn] / fuel_decrease[partial_burn]
+            new_mass = np.where(full_burn, self.mass - fuel_decrease * self.propellant_mass, self.mass)
+
+            if len(self.thrust_curves) > 0 and curved.any():
+                curved = np.nonzero(curved)[0]
+                new_impulse_fraction = get_table_values(self.impulse_fraction_tables, 0, thrust_curves.TABLE_SPACING, thrust_curves.TABLE_SIZE, 1 - new_fuel[curved], self.curve_index[curved])
+                impulse_fraction = new_impulse_fraction - self.impulse_fraction[curved]
+                self.impulse_fraction[curved] = new_impulse_fraction
+
+                self.thrust[curved] = self.average_thrust[curved] * self.burn_time[curved] * impulse_fraction / self.time_increment[curved]
+                new_mass[curved] = self.mass[curved] - impulse_fraction * self.propellant_mass[curved]
+
+        self.fuel = new_fuel
+        self.mass = new_mass
+
+        staging = no_burn & (self.current_stage != self.max_stage)
+        if staging.any():
+            self.stage(np.nonzero(staging)[0])
+
+        self.move()
+
+    def move(self):  # Moves every member through a time increment under the thrust worked out by step
+        self.drag = self.get_drag(self.velocity, self.altitude)
+
+        has_mass = self.mass != 0
+        self.acceleration = np.full(len(self.active), float(LARGE_NUMBER))
+        np.divide(self.thrust + self.drag, self.mass, out=self.acceleration, where=has_mass)
+        self.acceleration[has_mass] -= self.gravity_acc[has_mass]
+
+        self.velocity = self.velocity + self.acceleration * self.time_increment
+        self.altitude = self.altitude + self.velocity * self.time_increment
+
+        self.g_force = self.acceleration / self.gravity_acc
+
+    def get_drag(self, velocity, altitude):  # Drag of every member at a speed along its direction of travel, opposing it
+        air_density = self.air_density
+        if self.atmosphere_table is not None:
+            air_density = air_density * self.atmosphere_table.get_density_ratios(altitude)
+
+        drag_coefficient_area_total = self.drag_coefficient_area_total
+        if self.drag_model == 'mach':
+            speed_of_sound = SEA_LEVEL_SPEED_OF_SOUND
+            if self.atmosphere_table is not None:
+                speed_of_sound = self.atmosphere_table.get_speeds_of_sound(altitude)
+            drag_coefficient_area_total = get_table_values(self.drag_coefficient_area_tables, 0, drag_tables.TABLE_SPACING, drag_tables.TABLE_SIZE, np.abs(velocity) / speed_of_sound, self.drag_table_index)
+
+        drag = 0.5 * air_density * np.float_power(velocity, 2) * drag_coefficient_area_total  # float_power rounds the same way as the scalar ** operator
+        drag[velocity >= 0] *= -1
+
+        return drag
+
+    def stage(self, staging):  # staging is the positions in the active arrays of members that are staging this step
+        members = self.active[staging]
+        new_stages = self.next_stage[members, self.current_stage[staging]]
+        self.current_stage[staging] = new_stages
+
+        new_mass = self.mass_at_stage[members, new_stages]
+        decoupled = ~np.isnan(new_mass)
+        self.mass[staging[decoupled]] = new_mass[decoupled]
+        self.drag_coefficient_area_total[staging[decoupled]] = self.drag_coefficient_area_total_at_stage[members[decoupled], new_stages[decoupled]]
+        self.drag_table_index[staging[decoupled]] = self.drag_table_index_at_stage[members[decoupled], new_stages[decoupled]]
+
+        new_thrust = self.average_thrust_at_stage[members, new_stages]
+        ignited = ~np.isnan(new_thrust)
+        ignited_positions = staging[ignited]
+        self.average_thrust[ignited_positions] = new_thrust[ignited]
+        self.burn_time[ignited_positions] = self.burn_time_at_stage[members[ignited], new_stages[ignited]]
+        self.propellant_mass[ignited_positions] = self.propellant_mass_at_stage[members[ignited], new_stages[ignited]]
+        self.curve_index[ignited_positions] = self.curve_index_at_stage[members[ignited], new_stages[ignited]]
+        self.impulse_fraction[ignited_positions] = 0
+        self.fuel[ignited_positions] = 1
+        self.thrust[ignited_positions] = new_thrust[ignited]
+
+    def update_flight_data(self):
+        members = self.active
+        step = self.step_count
+
+        # Flight events are tracked as the batch runs so they are available without recording
+        new_apoapsis = self.altitude > self.apoapsis_altitude[members]
+        self.apoapsis_altitude[members[new_apoapsis]] = self.altitude[new_apoapsis]
+        self.apoapsis_step[members[new_apoapsis]] = step
+
+        depleted = (self.fuel == 0) & (self.last_fuel[members] != 0)
+        self.propellant_depletion_step[members[depleted]] = step
+        self.last_fuel[members] = self.fuel
+
+        self.max_velocity[members] = np.maximum(self.max_velocity[members], self.velocity)
+
+        burnt_out = (self.fuel == 0) & np.isnan(self.burnout_time[members])
+        self.burnout_time[members[burnt_out]] = self.time[burnt_out]
+
+        if not self.record:
+            return None
+
+        self.recorded_members.append(members)
+        for key, values in self.get_state().items():
+            self.recorded_values[key].append(values.copy())
+
+    def get_state(self):
+        return {
+            'time': self.time,
+            'altitude': self.altitude,
+            'velocity': self.velocity,
+            'acceleration': self.acceleration,
+            'g-force': self.g_force,
+            'thrust': self.thrust,
+            'drag': self.drag,
+            'fuel': self.fuel,
+            'mass': self.mass,
+            'stage': self.current_stage
+        }
+
+    def end_members(self, finished):
+        members = self.active[finished]
+        self.length_of_data[members] = self.step_count
+
+        for key, values in self.get_state().items():
+            self.final_state[key][members] = values[finished]
+
+        # Compact every per-member array down to the members that are still flying
+        still_active = ~finished
+        self.active = self.active[still_active]
+        for attr in self.member_attributes:
+            setattr(self, attr, getattr(self, attr)[still_active])
+
+    def end_simulation(self):
+        never_burnt_out = np.isnan(self.burnout_time)
+        self.burnout_time[never_burnt_out] = self.final_state['time'][never_burnt_out]
+
+        for member in range(self.size):
+            self.flight_events[member] = {
+                'propellant depletion': int(self.propellant_depletion_step[member]),
+                'apoapsis': int(self.apoapsis_step[member])
+            }
+
+        if self.record:
+            # Each member's samples are stored contiguously, so every member's flight data is a set of views into one array per key
+            start = np.concatenate(([0], np.cumsum(self.length_of_data)[:-1]))
+            recorded_steps = np.repeat(np.arange(len(self.recorded_members)), [len(members) for members in self.recorded_members])
+            positions = start[np.concatenate(self.recorded_members)] + recorded_steps
+            self.recorded_members = []
+
+            self.flight_data = [{} for _ in range(self.size)]
+            for key in self.flight_data_keys:
+                values = np.concatenate(self.recorded_values[key])
+                self.recorded_values[key] = []
+
+                flight_data_values = np.empty_like(values)
+                flight_data_values[positions] = values
+
+                for member in range(self.size):
+                    self.flight_data[member][key] = flight_data_values[start[member]:start[member] + self.length_of_data[member]]
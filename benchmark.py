@@ -0,0 +1,285 @@
+import os
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')  # Renders off screen, so the benchmarks run without a display
+
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pygame
+
+import db_controller
+import rocket_renderer
+import rocket_simulator
+from rocket_parts import *
+
+# Times the simulator, the database and the renderers, and compares the times with a baseline written by an earlier run
+# Results are JSON of the form {"benchmarks": {name: {"seconds": median seconds per call, "min": ..., "calls": ..., "repeat": ...}}, ...}
+# with the frames per second of the render benchmarks as "fps". A benchmark has regressed when its median is slower than the
+# baseline's by more than its threshold, a fraction of the baseline time
+
+DEFAULT_TIME_INCREMENTS = [0.01, 0.001]
+DEFAULT_REPEAT = 5
+DEFAULT_THRESHOLD = 0.1
+MIN_RUN_TIME = 0.2  # s, each repeat makes enough calls to take at least this long so short calls are timed accurately
+WINDOW_DIMENSIONS = (1500, 700)  # As the editor and the simulation player
+EDITOR_CONTAINER = (300, 0, 900, 700)
+SIMULATION_CONTAINER = (0, 0, 1500, 570)
+FONT_PATH = 'data/fonts/Rubik-Regular.ttf'
+
+
+def get_example_rockets():  # Used when the database has no rockets, a single stage rocket and a two stage rocket
+    single_stage = Rocket(name='Example Single Stage', parts=[
+        NoseCone(local_part_id=0, length=0.3, diameter=0.3),
+        BodyTube(local_part_id=1, length=1, diameter=0.3),
+        Engine(parent_id=1, local_part_id=2, average_thrust=100, burn_time=10),
+        Fins(parent_id=1, local_part_id=3)
+    ], new_part_id=4)
+    single_stage.stages = [[2]]
+
+    two_stage = Rocket(name='Example Two Stage', parts=[
+        NoseCone(local_part_id=0, length=0.3, diameter=0.1),
+        BodyTube(local_part_id=1, length=0.6, diameter=0.1),
+        Engine(parent_id=1, local_part_id=2, mass=0.6, propellant_mass=0.4, average_thrust=150, burn_time=4, diameter=0.05),
+        Decoupler(local_part_id=3, diameter=0.1),
+        BodyTube(local_part_id=4, length=0.8, diameter=0.1),
+        Engine(parent_id=4, local_part_id=5, mass=1.2, propellant_mass=0.8, average_thrust=400, burn_time=3, diameter=0.05),
+        Fins(parent_id=4, local_part_id=6)
+    ], new_part_id=7)
+    two_stage.stages = [[5], [3], [2]]
+
+    return [single_stage, two_stage]
+
+
+def load_rockets(database):  # Every rocket saved in the database, or the example rockets if there are none
+    rockets = []
+    if os.path.exists(database):
+        with_database(database, lambda: rockets.extend(db_controller.get_all_saved_rockets(ROCKET_PARTS)))
+
+    if len(rockets) == 0:
+        rockets = get_example_rockets()
+
+    for rocket in rockets:
+        rocket.new_part_id = max([part.local_part_id for part in rocket.parts] + [-1]) + 1  # get_rocket gives the database rows
+        for part in rocket.parts:  # Engines and fins are drawn on their parent, which the editor links up as it updates the parts
+            if hasattr(part, 'parent_id'):
+                part.parent = rocket.get_part_with_part_id(part.parent_id)
+
+    return rockets
+
+
+def with_database(database, function):  # Calls function with db_controller using database, then puts the database back
+    old_database = db_controller.DATABASE
+    db_controller.DATABASE = database
+    try:
+        return function()
+    finally:
+        db_controller.DATABASE = old_database
+
+
+def time_function(function, repeat):  # Median and fastest seconds per call over repeat runs
+    calls = 1
+    while True:  # Finds the number of calls per run, the run taking long enough being the first
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= MIN_RUN_TIME:
+            break
+        calls *= 2
+
+    times = [elapsed / calls]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        times.append((time.perf_counter() - start) / calls)
+
+    return {'seconds': statistics.median(times), 'min': min(times), 'calls': calls, 'repeat': repeat}
+
+
+def get_simulation_benchmarks(rockets, time_increments):  # [(name, function)]
+    benchmarks = []
+    for rocket in rockets:
+        for time_increment in time_increments:
+            settings = dict(rocket_simulator.DEFAULT_SETTINGS, **{'time increment': time_increment})
+            benchmarks.append((f'simulate/{rocket.name}/{time_increment:g}', lambda rocket=rocket, settings=settings: rocket_simulator.Simulator(rocket, settings).simulate()))
+
+    return benchmarks
+
+
+def get_database_benchmarks(rockets, database):  # database is a copy of the saved rockets, or a new database
+    benchmarks = []
+    for rocket in rockets:
+        benchmarks.append((f'db/save_rocket/{rocket.name}', lambda rocket=rocket: with_database(database, lambda: db_controller.save_rocket(rocket))))
+        benchmarks.append((f'db/get_rocket/{rocket.name}', lambda rocket=rocket: with_database(database, lambda: db_controller.get_rocket(rocket.name, ROCKET_PARTS))))
+    benchmarks.append(('db/get_all_saved_rockets', lambda: with_database(database, lambda: db_controller.get_all_saved_rockets(ROCKET_PARTS))))
+
+    return benchmarks
+
+
+def get_render_benchmarks(rockets, root, font):
+    benchmarks = []
+    for rocket in rockets:
+        benchmarks.append((f'render/editor/{rocket.name}', lambda rocket=rocket: render_editor_frame(rocket, root, font)))
+
+        # A frame part way through the first stage's burn, when the engine flame is drawn
+        simulator = rocket_simulator.Simulator(rocket, rocket_simulator.DEFAULT_SETTINGS)
+        simulator.simulate()
+        apoapsis = float(np.max(simulator.flight_data['altitude']))
+        state = simulator.flight_data.interpolate(simulator.flight_data['time'][simulator.flight_events.get('propellant depletion', 0)] / 2)
+        current_rocket = simulator.get_rocket_at_stage(int(state['stage']))
+        benchmarks.append((f'render/simulation/{rocket.name}', lambda current_rocket=current_rocket, state=state, apoapsis=apoapsis: render_simulation_frame(current_rocket, state, apoapsis, root, font)))
+
+    return benchmarks
+
+
+def render_editor_frame(rocket, root, font):
+    root.fill((0, 0, 0))
+    rocket_renderer.render_rocket_editor(rocket, root, EDITOR_CONTAINER, font, show_stages=True)
+    pygame.display.update()
+
+
+def render_simulation_frame(current_rocket, state, apoapsis, root, font):
+    root.fill((0, 0, 0))
+    rocket_renderer.render_rocket_simulation(current_rocket=current_rocket, state=state, apoapsis=apoapsis, angle=0, root=root, container=SIMULATION_CONTAINER, font=font)
+    pygame.display.update()
+
+
+def run_benchmarks(rockets, database, time_increments, repeat, filters, log=sys.stderr):
+    temporary_directory = tempfile.mkdtemp()
+    try:
+        # The database benchmarks save rockets, so they use a copy rather than the database itself
+        database_copy = os.path.join(temporary_directory, 'rockets.db')
+        if os.path.exists(database):
+            shutil.copyfile(database, database_copy)
+        with_database(database_copy, db_controller.init_db)
+
+        pygame.init()
+        root = pygame.display.set_mode(WINDOW_DIMENSIONS)
+        font = pygame.font.Font(FONT_PATH, 20) if os.path.exists(FONT_PATH) else None
+
+        benchmarks = get_simulation_benchmarks(rockets, time_increments) + get_database_benchmarks(rockets, database_copy) + get_render_benchmarks(rockets, root, font)
+
+        results = {}
+        for name, function in benchmarks:
+            if len(filters) > 0 and not any(text in name for text in filters):
+                continue
+
+            results[name] = time_function(function, repeat)
+            if name.startswith('render/'):
+                results[name]['fps'] = 1 / results[name]['seconds']
+            log.write(f'{name}: {format_result(results[name])}\n')
+    finally:
+        pygame.quit()
+        shutil.rmtree(temporary_directory, ignore_errors=True)
+
+    return results
+
+
+def format_result(result):
+    text = f'{result["seconds"] * 1000:.3f} ms'
+    if 'fps' in result:
+        text += f' ({result["fps"]:.1f} fps)'
+
+    return text
+
+
+def parse_thresholds(texts):  # (default threshold, {name prefix: threshold}) from VALUE and PREFIX=VALUE texts
+    default = DEFAULT_THRESHOLD
+    thresholds = {}
+    for text in texts:
+        try:
+            if '=' in text:
+                prefix, value = text.rsplit('=', 1)
+                thresholds[prefix] = float(value)
+            else:
+                default = float(text)
+        except ValueError:
+            raise Exception(f'Invalid threshold {text}, expected VALUE or PREFIX=VALUE')
+
+    return default, thresholds
+
+
+def get_threshold(name, default, thresholds):  # The threshold with the longest prefix of name
+    prefixes = [prefix for prefix in thresholds if name.startswith(prefix)]
+    if len(prefixes) == 0:
+        return default
+
+    return thresholds[max(prefixes, key=len)]
+
+
+def compare_results(results, baseline, default_threshold, thresholds):  # [(name, baseline seconds, seconds, change, regressed)]
+    comparison = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        change = result['seconds'] / baseline[name]['seconds'] - 1
+        comparison.append((name, baseline[name]['seconds'], result['seconds'], change, change > get_threshold(name, default_threshold, thresholds)))
+
+    return comparison
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Time the simulator, the database and the renderers without a display')
+    parser.add_argument('-o', '--output', help='JSON file to write the results to, stdout by default')
+    parser.add_argument('--database', default=db_controller.DATABASE, help='database to take the rockets from, it is never changed')
+    parser.add_argument('--time-increment', type=float, action='append', default=[], help=f'time increment to simulate with, {" and ".join(map(str, DEFAULT_TIME_INCREMENTS))} by default')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='runs of each benchmark, the median of which is reported')
+    parser.add_argument('--filter', action='append', default=[], metavar='TEXT', help='only run the benchmarks with names containing the text')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with, exiting with status 1 if a benchmark has regressed')
+    parser.add_argument('--threshold', action='append', default=[], metavar='[PREFIX=]VALUE', help=f'slowdown from the baseline, as a fraction, counted as a regression for the benchmarks with names starting with the prefix, or every benchmark, {DEFAULT_THRESHOLD} by default')
+    args = parser.parse_args(args)
+
+    try:
+        if args.repeat < 1:
+            raise Exception('--repeat must be at least 1')
+        default_threshold, thresholds = parse_thresholds(args.threshold)
+
+        baseline = None
+        if args.baseline is not None:
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)['benchmarks']
+    except Exception as error:
+        parser.error(str(error))
+
+    time_increments = args.time_increment if len(args.time_increment) > 0 else DEFAULT_TIME_INCREMENTS
+    results = run_benchmarks(load_rockets(args.database), args.database, time_increments, args.repeat, args.filter)
+
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        json.dump({
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'benchmarks': results
+        }, output, indent=4)
+        output.write('\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if baseline is None:
+        return 0
+
+    regressions = 0
+    for name, baseline_seconds, seconds, change, regressed in compare_results(results, baseline, default_threshold, thresholds):
+        sys.stderr.write(f'{name}: {baseline_seconds * 1000:.3f} ms -> {seconds * 1000:.3f} ms ({change:+.1%}){" REGRESSION" if regressed else ""}\n')
+        regressions += regressed
+
+    if regressions > 0:
+        sys.stderr.write(f'{regressions} benchmark{"s" if regressions != 1 else ""} regressed\n')
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
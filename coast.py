@@ -0,0 +1,113 @@
+import math
+
+import numpy as np
+
+# Closed form solutions for unpowered vertical flight with constant mass, gravity, air density and quadratic drag
+# Going up, both gravity and drag slow the rocket: dv/dt = -g - k*v^2
+# Coming down, drag opposes gravity: dv/dt = -g + k*v^2, which tends to a terminal velocity of sqrt(g/k)
+# where k = 0.5 * air density * drag coefficient area / mass
+
+
+def log_cosh(x):
+    x = np.abs(x)
+    return x + np.log1p(np.exp(-2 * x)) - math.log(2)
+
+
+def log_sinh(x):  # Only valid for x > 0
+    return x + np.log1p(-np.exp(-2 * x)) - math.log(2)
+
+
+class CoastPhase():
+    def __init__(self, altitude, velocity, mass, gravity_acc, air_density, drag_coefficient_area_total):
+        self.altitude = altitude
+        self.velocity = velocity
+        self.mass = mass
+        self.gravity_acc = gravity_acc
+        self.air_density = air_density
+        self.drag_coefficient_area_total = drag_coefficient_area_total
+
+        self.k = 0.5 * air_density * drag_coefficient_area_total / mass
+        g = gravity_acc
+
+        if self.k > 0:
+            self.rate = math.sqrt(g * self.k)
+            self.terminal_velocity = math.sqrt(g / self.k)
+        else:
+            self.rate = 0
+            self.terminal_velocity = math.inf
+
+        # Ascent, which ends at apoapsis
+        if velocity > 0:
+            if self.k > 0:
+                self.ascent_angle = math.atan(velocity / self.terminal_velocity)
+                self.apoapsis_time = self.ascent_angle / self.rate
+                self.apoapsis_altitude = altitude + math.log1p((velocity / self.terminal_velocity)**2) / (2 * self.k)
+            else:
+                self.apoapsis_time = velocity / g
+                self.apoapsis_altitude = altitude + velocity**2 / (2 * g)
+        else:
+            self.apoapsis_time = 0
+            self.apoapsis_altitude = altitude
+
+        # Descent, starting at apoapsis or straight away if already falling. The falling speed is written as
+        # terminal_velocity * tanh(rate * t + descent_offset) below terminal velocity, or coth(...) above it
+        self.descent_speed = max(-velocity, 0)
+        self.above_terminal_velocity = self.descent_speed > self.terminal_velocity
+        if self.k > 0:
+            if self.above_terminal_velocity:
+                self.descent_offset = math.atanh(self.terminal_velocity / self.descent_speed)
+            else:
+                self.descent_offset = math.atanh(self.descent_speed / self.terminal_velocity)
+
+    def get_state(self, t):  # Altitude and velocity t seconds after the coast phase started, t can be an array
+        t = np.asarray(t, dtype=float)
+        g = self.gravity_acc
+
+        ascending = t < self.apoapsis_time
+        t_ascent = np.minimum(t, self.apoapsis_time)
+        t_descent = np.maximum(t - self.apoapsis_time, 0)
+
+        if self.k > 0:
+            angle = self.ascent_angle - self.rate * t_ascent if self.velocity > 0 else np.zeros_like(t)
+            ascent_velocity = self.terminal_velocity * np.tan(angle)
+            ascent_altitude = self.altitude + (np.log(np.cos(angle)) - math.log(math.cos(self.ascent_angle))) / self.k if self.velocity > 0 else np.full_like(t, self.altitude)
+
+            x = self.rate * t_descent + self.descent_offset
+            if self.above_terminal_velocity:
+                descent_speed = self.terminal_velocity / np.tanh(x)
+                fallen = (log_sinh(x) - log_sinh(self.descent_offset)) / self.k
+            else:
+                descent_speed = self.terminal_velocity * np.tanh(x)
+                fallen = (log_cosh(x) - log_cosh(self.descent_offset)) / self.k
+        else:
+            ascent_velocity = self.velocity - g * t_ascent
+            ascent_altitude = self.altitude + self.velocity * t_ascent - g * t_ascent**2 / 2
+            descent_speed = self.descent_speed + g * t_descent
+            fallen = self.descent_speed * t_descent + g * t_descent**2 / 2
+
+        altitude = np.where(ascending, ascent_altitude, self.apoapsis_altitude - fallen)
+        velocity = np.where(ascending, ascent_velocity, -descent_speed)
+
+        return altitude, velocity
+
+    def get_drag(self, velocity):
+        return -np.sign(velocity) * 0.5 * self.air_density * velocity**2 * self.drag_coefficient_area_total
+
+    def get_time_at_altitude(self, altitude):  # Time after the coast phase started when the rocket falls through altitude
+        fallen = self.apoapsis_altitude - altitude
+        if fallen <= 0:
+            return self.apoapsis_time
+
+        if self.k > 0:
+            if self.above_terminal_velocity:
+                # sinh(x) = sinh(offset) * exp(k * fallen), solved in log space to avoid overflow
+                log_value = log_sinh(self.descent_offset) + self.k * fallen
+                x = log_value + math.log1p(math.sqrt(1 + math.exp(-2 * log_value)))
+            else:
+                log_value = log_cosh(self.descent_offset) + self.k * fallen
+                x = log_value + math.log1p(math.sqrt(max(1 - math.exp(-2 * log_value), 0)))
+
+            return self.apoapsis_time + (x - self.descent_offset) / self.rate
+        else:
+            g = self.gravity_acc
+            return self.apoapsis_time + (math.sqrt(self.descent_speed**2 + 2 * g * fallen) - self.descent_speed) / g
@@ -1,11 +1,12 @@
+import os
+import pathlib
 import sqlite3
 
-from rocket_parts import *
+from part_model import *
 
 DATABASE = 'rockets.db'
-BLACKLISTED_ATTRIBUTES = ['being_dragged', 'selected', 'mass_override', 'hit_box', 'unrotated_hit_box', 'vertices', 'colour', 'parent']
 INT_ATTRIBUTES = ['local_part_id', 'parent_id', 'fin_count']
-TEXT_ATTRIBUTES = ['cone_shape', 'fin_shape']
+TEXT_ATTRIBUTES = ['cone_shape', 'fin_shape', 'thrust_curve']
 
 
 def get_attributes(object):
@@ -16,11 +17,15 @@ def connect(db_path):
     return(sqlite3.connect(db_path))
 
 
-def execute_sql(conn, sql):
+def connect_read_only(db_path):  # Fails rather than creating the database if there is none
+    return(sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + '?mode=ro', uri=True))
+
+
+def execute_sql(conn, sql, parameters=()):  # Values that come from outside, such as rocket names, are passed as parameters for the ? placeholders
     c = conn.cursor()
     command = sql.split(' ')[0].upper()
 
-    c.execute(sql)
+    c.execute(sql, parameters)
     if command == 'INSERT':
         conn.commit()
     elif command == 'DELETE':
@@ -45,22 +50,27 @@ def init_db():
     execute_sql(conn, sql)
 
     for rocket_part in ROCKET_PARTS:
-        attributes = vars(rocket_part()).keys()
         attributes_to_save = []
-        for attr in attributes:
-            if attr not in BLACKLISTED_ATTRIBUTES:
-                if attr in INT_ATTRIBUTES:
-                    attr += ' INTEGER'
-                elif attr in TEXT_ATTRIBUTES:
-                    attr += ' TEXT'
-                else:
-                    attr += ' REAL'
+        for attr in rocket_part.FIELDS:
+            if attr in INT_ATTRIBUTES:
+                attr += ' INTEGER'
+            elif attr in TEXT_ATTRIBUTES:
+                attr += ' TEXT'
+            else:
+                attr += ' REAL'
 
-                attributes_to_save.append(attr)
+            attributes_to_save.append(attr)
 
         sql = f"CREATE TABLE IF NOT EXISTS {rocket_part.__name__} (global_part_id INTEGER PRIMARY KEY, {', '.join(attributes_to_save)});"
         execute_sql(conn, sql)
 
+        # Databases made before a field was added are given its column, which goes last as new fields are always added at the end of FIELDS
+        existing_columns = [column[1] for column in conn.execute(f"PRAGMA table_info({rocket_part.__name__})").fetchall()]
+        for attr, column in zip(rocket_part.FIELDS, attributes_to_save):
+            if attr not in existing_columns:
+                conn.execute(f"ALTER TABLE {rocket_part.__name__} ADD COLUMN {column}")
+        conn.commit()
+
         sql = f"""CREATE TABLE IF NOT EXISTS {rocket_part.__name__}_line (
                 global_part_id INTEGER,
                 rocket_id INTEGER,
@@ -72,6 +82,25 @@ def init_db():
         execute_sql(conn, sql)
 
 
+def get_db_status():  # 'missing' or 'empty' if there are no saved rockets to read, 'outdated' if init_db needs to add columns, otherwise 'current'
+    if not os.path.exists(DATABASE):
+        return 'missing'
+
+    conn = connect_read_only(DATABASE)
+    try:
+        if len(conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'Rocket'").fetchall()) == 0:
+            return 'empty'
+
+        for rocket_part in ROCKET_PARTS:
+            existing_columns = [column[1] for column in conn.execute(f"PRAGMA table_info({rocket_part.__name__})").fetchall()]
+            if any(attr not in existing_columns for attr in rocket_part.FIELDS):
+                return 'outdated'
+    finally:
+        conn.close()
+
+    return 'current'
+
+
 def reset_db():
     try:
         conn = connect(DATABASE)
@@ -96,14 +125,14 @@ def save_rocket(rocket):
 
     # Check if rocket already exists
 
-    sql = f"SELECT name FROM Rocket WHERE Rocket.name = '{rocket.name}'"
-    existing_rockets = execute_sql(conn, sql)
+    sql = "SELECT name FROM Rocket WHERE Rocket.name = ?"
+    existing_rockets = execute_sql(conn, sql, (rocket.name,))
 
     if len(existing_rockets) > 0:
         delete_rocket(Rocket(name=rocket.name))
 
-    sql = f"INSERT INTO Rocket (rocket_id, name, new_part_id) VALUES((SELECT MAX(rocket_id) FROM Rocket) + 1, '{rocket.name}', {rocket.new_part_id})"
-    execute_sql(conn, sql)
+    sql = f"INSERT INTO Rocket (rocket_id, name, new_part_id) VALUES((SELECT MAX(rocket_id) FROM Rocket) + 1, ?, {rocket.new_part_id})"
+    execute_sql(conn, sql, (rocket.name,))
 
     for stage_number, stage in enumerate(rocket.stages):
         for part_id in stage:
@@ -112,12 +141,13 @@ def save_rocket(rocket):
 
     for index, part in enumerate(rocket.parts):
         part_data = []
-        for key in vars(part).keys():
-            if key not in BLACKLISTED_ATTRIBUTES:
-                if key in TEXT_ATTRIBUTES:
-                    part_data.append(f"'{vars(part)[key]}'")
-                else:
-                    part_data.append(str(("%.17f" % vars(part)[key]).rstrip('0').rstrip('.'))) # Convert scientific notation to decimal
+        for key, value in part.get_fields().items():
+            if value is None:
+                part_data.append('NULL')
+            elif key in TEXT_ATTRIBUTES:
+                part_data.append("'" + value.replace("'", "''") + "'")
+            else:
+                part_data.append(str(("%.17f" % value).rstrip('0').rstrip('.'))) # Convert scientific notation to decimal
 
         sql = f"INSERT INTO {part.__class__.__name__} VALUES((SELECT MAX(global_part_id) FROM {part.__class__.__name__}) + 1, {', '.join(part_data)})"
         execute_sql(conn, sql)
@@ -129,15 +159,15 @@ def save_rocket(rocket):
 def delete_rocket(rocket):
     conn = connect(DATABASE)
 
-    sql = f"SELECT rocket_id FROM Rocket WHERE name = '{rocket.name}'"
+    sql = "SELECT rocket_id FROM Rocket WHERE name = ?"
     c = conn.cursor()
-    c.execute(sql)
+    c.execute(sql, (rocket.name,))
     rocket_id = c.fetchall()
 
     if len(rocket_id) > 0:
         rocket_id = rocket_id[0][0]
-        sql = f"DELETE FROM Rocket WHERE name = '{rocket.name}'"
-        execute_sql(conn, sql)
+        sql = "DELETE FROM Rocket WHERE name = ?"
+        execute_sql(conn, sql, (rocket.name,))
 
         sql = f"DELETE FROM Stages WHERE rocket_id = {rocket_id}"
         execute_sql(conn, sql)
@@ -150,13 +180,20 @@ def delete_rocket(rocket):
             execute_sql(conn, sql)
 
 
-def get_rocket(name):
+def check_rocket_exists(name):
+    conn = connect(DATABASE)
+
+    sql = "SELECT name FROM Rocket WHERE name = ?"
+    return len(execute_sql(conn, sql, (name,))) > 0
+
+
+def get_rocket(name, part_classes=ROCKET_PARTS):  # part_classes are the classes to build parts with, such as the editor's
     conn = connect(DATABASE)
 
     # ROCKET
 
-    sql = f"SELECT new_part_id FROM Rocket WHERE name = '{name}'"
-    new_part_id = execute_sql(conn, sql)
+    sql = "SELECT new_part_id FROM Rocket WHERE name = ?"
+    new_part_id = execute_sql(conn, sql, (name,))
 
     rocket = Rocket(name=name, new_part_id=new_part_id)
 
@@ -165,22 +202,21 @@ def get_rocket(name):
     all_args = []
 
     # Construct an SQL statement for each part type to get all instances of that part type in the database
-    for part in ROCKET_PARTS:
+    for part in part_classes:
         column_names = []
         table_names = ["Rocket"]
-        conditions = [f"Rocket.name = '{name}'"]
+        conditions = ["Rocket.name = ?"]
     
         table_names.append(part.__name__)
         table_names.append(part.__name__ + "_line")
         conditions.append(f"{part.__name__}.global_part_id = {part.__name__}_line.global_part_id")
         conditions.append(f"{part.__name__}_line.rocket_id = Rocket.rocket_id")
         column_names.append(f"{part.__name__}_line.location")
-        for key in vars(part()).keys():  # Get variables from part class
-            if key not in BLACKLISTED_ATTRIBUTES:
-                column_names.append(f"{part.__name__}.{key}")
+        for key in part.FIELDS:  # Get saved variables from part class
+            column_names.append(f"{part.__name__}.{key}")
 
         sql = f"SELECT DISTINCT {', '.join(column_names)} FROM {', '.join(table_names)} WHERE {' AND '.join(conditions)}"
-        part_data = execute_sql(conn, sql)
+        part_data = execute_sql(conn, sql, (name,))
         part_data = [list(data) for data in part_data]
 
         if len(part_data) > 0:  # Check if there are no parts of that type
@@ -194,9 +230,6 @@ def get_rocket(name):
     
     rocket.parts = [None] * len(all_args)
 
-    for part in ROCKET_PARTS:
-        column_names = []
-
     for args in all_args:
         location = args.pop('location')
         part = args.pop('part')
@@ -204,8 +237,8 @@ def get_rocket(name):
     
     # STAGES
 
-    sql = f"SELECT stage, local_part_id FROM Stages, Rocket WHERE Rocket.rocket_id = Stages.rocket_id AND Rocket.name = '{name}'"
-    stages_data = execute_sql(conn, sql)
+    sql = "SELECT stage, local_part_id FROM Stages, Rocket WHERE Rocket.rocket_id = Stages.rocket_id AND Rocket.name = ?"
+    stages_data = execute_sql(conn, sql, (name,))
     stages_data = [list(stage) for stage in stages_data]
     max_stage = max([stage[0] for stage in stages_data])
     rocket.stages = [[] for _ in range(max_stage+1)]
@@ -217,7 +250,7 @@ def get_rocket(name):
     return rocket
 
 
-def get_all_saved_rockets():
+def get_all_saved_rockets(part_classes=ROCKET_PARTS):
     conn = connect(DATABASE)
 
     sql = "SELECT name FROM Rocket"
@@ -228,6 +261,6 @@ def get_all_saved_rockets():
 
     rockets = []
     for name in names:
-        rockets.append(get_rocket(name[0]))
+        rockets.append(get_rocket(name[0], part_classes))
     
     return rockets
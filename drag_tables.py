@@ -0,0 +1,54 @@
+import functools
+import math
+
+import numpy as np
+
+from part_model import BodyTube, NoseCone, Fins
+
+# Drag coefficients over Mach number, as multiples of the subsonic drag coefficient of each part. A table is made once for each
+# part geometry, and the tables of the parts exposed to the airflow are added up once per stage, so a step only interpolates
+# in one table
+# The rise through the transonic region follows the stagnation pressure on a blunt face, which a pointed nose cone or a thin fin
+# only partly feels
+
+DRAG_MODELS = ['constant', 'mach']
+
+TABLE_MAX_MACH = 5  # Above this the drag coefficient at TABLE_MAX_MACH is used
+TABLE_SPACING = 0.01
+TABLE_SIZE = round(TABLE_MAX_MACH / TABLE_SPACING)  # Intervals in the tables
+
+
+def get_stagnation_pressure_ratios(mach):  # Stagnation pressure on a blunt face over the dynamic pressure, relative to its value at rest
+    subsonic = 1 + mach**2 / 4 + mach**4 / 40
+    supersonic_mach = np.maximum(mach, 1)
+    supersonic = 1.84 - 0.76 / supersonic_mach**2 + 0.166 / supersonic_mach**4 + 0.035 / supersonic_mach**6
+
+    return np.where(mach <= 1, subsonic, supersonic)
+
+
+@functools.lru_cache(maxsize=None)
+def get_mach_factors(part_type, length, diameter):  # Drag coefficient at each Mach number of the table over the subsonic drag coefficient
+    # For fins, diameter is the thickness
+    mach = TABLE_SPACING * np.arange(TABLE_SIZE + 1)
+    rise = get_stagnation_pressure_ratios(mach) - 1
+
+    if part_type is NoseCone:
+        bluntness = math.sin(math.atan((diameter/2)/length))  # 1 for a flat face, nearly 0 for a long pointed cone
+    elif part_type is Fins:
+        bluntness = min(diameter / length, 1)
+    else:
+        bluntness = 1
+
+    factors = 1 + rise * bluntness
+    factors.flags.writeable = False  # Shared by every part with the same geometry
+
+    return factors
+
+
+def get_part_mach_factors(part):
+    if isinstance(part, Fins):
+        return get_mach_factors(Fins, part.length, part.thickness)
+    elif isinstance(part, NoseCone):
+        return get_mach_factors(NoseCone, part.length, part.diameter)
+    elif isinstance(part, BodyTube):
+        return get_mach_factors(BodyTube, part.length, part.diameter)
@@ -0,0 +1,74 @@
+import numpy as np
+
+from atmosphere import get_standard_atmosphere
+from trajectory import TrajectoryIndex
+
+# Statistics of a whole flight, worked out from the flight data columns with one vectorised pass over each column used
+# Absolute maxima are taken from the larger of the maximum and the negated minimum, so no absolute value copy of a column is made
+
+
+def get_absolute_max(values):
+    return max(float(values.max()), -float(values.min()))
+
+
+def get_burnout_time(times, fuel):  # Time of the first row with no fuel left, or the end of the flight if the fuel never runs out
+    burnt_out = fuel == 0
+    row = int(np.argmax(burnt_out))
+    if not burnt_out[row]:
+        return float(times[-1])
+
+    return float(times[row])
+
+
+def get_dynamic_pressures(flight_data, settings, atmosphere='constant'):  # Pa, 0.5 * air density * velocity^2 at each row
+    velocity = flight_data['velocity']
+    dynamic_pressures = velocity * velocity
+    dynamic_pressures *= 0.5 * settings['air density']
+    if atmosphere == 'standard':
+        dynamic_pressures *= get_standard_atmosphere().get_density_ratios(flight_data['altitude'])
+
+    return dynamic_pressures
+
+
+def get_stage_times(times, stages):  # {stage: (time it starts, time it ends)}, the next stage starting as the last one ends
+    starts = np.concatenate(([0], np.flatnonzero(stages[1:] != stages[:-1]) + 1))
+    ends = np.append(starts[1:], len(times) - 1)
+
+    return {int(stages[start]): (float(times[start]), float(times[end])) for start, end in zip(starts.tolist(), ends.tolist())}
+
+
+def get_crossing_times(flight_data, altitudes):  # {altitude: [times the rocket passes through it]}, for each of altitudes
+    trajectory_index = TrajectoryIndex(flight_data)
+    return {altitude: trajectory_index.get_crossing_times(altitude) for altitude in altitudes}
+
+
+def get_flight_summary(flight_data, settings, atmosphere='constant', crossing_altitudes=()):  # flight_data is a Trajectory, MappedTrajectory or anything else with the columns by key
+    # With crossing_altitudes, the summary also has the times the rocket passes through each of them, as 'altitude crossings'
+    times = flight_data['time']
+    if len(times) == 0:
+        raise Exception('No flight data to summarise')
+
+    apoapsis_row = int(np.argmax(flight_data['altitude']))
+    dynamic_pressures = get_dynamic_pressures(flight_data, settings, atmosphere)
+    max_dynamic_pressure_row = int(np.argmax(dynamic_pressures))
+
+    summary = {
+        'flight time': float(times[-1]),
+        'apoapsis': float(flight_data['altitude'][apoapsis_row]),
+        'apoapsis time': float(times[apoapsis_row]),
+        'max speed': get_absolute_max(flight_data['velocity']),
+        'max acceleration': get_absolute_max(flight_data['acceleration']),
+        'max g-force': get_absolute_max(flight_data['g-force']),
+        'burnout time': get_burnout_time(times, flight_data['fuel']),
+        'max dynamic pressure': float(dynamic_pressures[max_dynamic_pressure_row]),
+        'max dynamic pressure time': float(times[max_dynamic_pressure_row]),
+        'stage times': get_stage_times(times, flight_data['stage'])
+    }
+    if crossing_altitudes:
+        summary['altitude crossings'] = get_crossing_times(flight_data, crossing_altitudes)
+
+    return summary
+
+
+def get_simulator_summary(simulator, crossing_altitudes=()):  # Summary of a finished simulation, in the simulator's own atmosphere
+    return get_flight_summary(simulator.flight_data, simulator.settings, simulator.atmosphere, crossing_altitudes)
@@ -0,0 +1,467 @@
+import argparse
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+
+import db_controller
+import monte_carlo
+import rocket_simulator
+import simulate
+import simulation_cache
+import sweep
+from part_model import *
+
+# Local service running simulate, sweep and Monte Carlo jobs for several tools at once, over HTTP on a TCP port or a Unix socket
+# A job is POSTed to /jobs as JSON:
+#     {"type": "simulate" | "sweep" | "monte carlo", "rocket": name saved in the database, or "spec": rocket spec as in simulate.py,
+#      "settings": {setting: value}, with the defaults for settings left out, and the options of the job type:
+#      simulate:    "options": {"integrator", "tolerance", "analytic_coast", "atmosphere", "drag_model", "recording_tolerance"}
+#      sweep:       "overrides": {part id: {attribute: [values]}}, "chunk size"
+#      monte carlo: "runs", "seed", "dispersions": {"PART_ID.ATTRIBUTE": deviation}, "settings dispersions": {setting: deviation}, "chunk size"}
+# The results stream back as NDJSON, one JSON object per line, starting with {"job": content hash, "coalesced": ...} and ending with
+# {"done": true} or {"error": message}. A simulate job sends {"columns": [...], "flight events": {...}} and then the flight data as
+# {"rows": [[...], ...]}, a sweep sends each summary row as it completes, and a Monte Carlo job sends the statistics of the runs
+# completed so far, {"runs": count, "statistics": {summary key: summary}}, after each chunk
+# A job identical to one still running joins it rather than running again, and is sent every line from the start. Lines are only
+# kept until every client has taken them, so a job can only be joined until then, and an identical job arriving later runs again
+# GET /status gives the jobs running and the tasks queued in the process pool
+
+JOB_TYPES = ['simulate', 'sweep', 'monte carlo']
+SIMULATE_OPTIONS = ['integrator', 'tolerance', 'analytic_coast', 'atmosphere', 'drag_model', 'recording_tolerance']
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_MAX_JOBS = 16  # Distinct jobs running at once, further jobs are turned away until one finishes
+ROWS_PER_LINE = 1000  # Flight data rows sent in each line of a simulate job
+MAX_LAG_LINES = 64  # Lines a job can get ahead of its slowest client before it waits for that client
+MAX_REQUEST_BYTES = 16 * 1024**2
+
+STATUS_TEXTS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+
+def simulate_flight(rocket, settings, options):  # Run in a worker process, returns (flight data rows, flight events)
+    simulator = rocket_simulator.Simulator(rocket, settings, **options)
+    simulator.simulate()
+
+    return simulator.flight_data.get_rows(), simulator.flight_events
+
+
+def get_job_settings(job):
+    settings = dict(rocket_simulator.DEFAULT_SETTINGS)
+    for setting, value in job.get('settings', {}).items():
+        if setting not in settings:
+            raise Exception(f'No setting called {setting}')
+        settings[setting] = float(value)
+
+    return settings
+
+
+def parse_job(request, load_rocket=simulate.load_rocket):  # (job, content hash) from a request, job being the request with the rocket and settings filled in
+    if not isinstance(request, dict):
+        raise Exception('A job must be a JSON object')
+    if request.get('type') not in JOB_TYPES:
+        raise Exception(f'Invalid job type: {request.get("type")}, expected one of {", ".join(JOB_TYPES)}')
+    if ('rocket' in request) == ('spec' in request):
+        raise Exception('A job needs either a rocket name or a spec')
+
+    job = dict(request)
+    job['rocket'] = load_rocket(request['rocket']) if 'rocket' in request else simulate.rocket_from_spec(request['spec'])
+    job['settings'] = get_job_settings(request)
+
+    if job['type'] == 'simulate':
+        job['options'] = dict(request.get('options', {}))
+        for option in job['options']:
+            if option not in SIMULATE_OPTIONS:
+                raise Exception(f'Invalid simulate option: {option}')
+    elif job['type'] == 'sweep':
+        job['overrides'] = {int(part_id): {attribute: [float(value) for value in values] for attribute, values in attributes.items()}
+                            for part_id, attributes in request.get('overrides', {}).items()}
+        sweep.check_overrides(job['rocket'], job['overrides'])
+    else:
+        if 'dispersions' in request:
+            job['dispersions'] = {}
+            for key, deviation in request['dispersions'].items():
+                part_id, attribute = key.split('.', 1)
+                job['dispersions'][(int(part_id), attribute)] = float(deviation)
+        else:
+            job['dispersions'] = monte_carlo.get_default_dispersions(job['rocket'])
+        job['settings dispersions'] = request.get('settings dispersions', {'air density': monte_carlo.DEFAULT_AIR_DENSITY_DISPERSION})
+        job['runs'] = int(request.get('runs', 1000))
+        monte_carlo.check_dispersions(job['rocket'], job['settings'], job['dispersions'], job['settings dispersions'])
+
+    # Everything the results depend on, the rocket name and the spelling of the request left out
+    content = {key: value for key, value in job.items() if key not in ['rocket', 'spec', 'dispersions', 'overrides']}
+    content['parts'] = [simulation_cache.get_part_state(part) for part in job['rocket'].parts]
+    content['stages'] = job['rocket'].stages
+    content['overrides'] = job.get('overrides')
+    content['dispersions'] = sorted([f'{part_id}.{attribute}', deviation] for (part_id, attribute), deviation in job.get('dispersions', {}).items())
+    content['version'] = simulation_cache.CACHE_VERSION
+    key = hashlib.sha256(json.dumps(simulation_cache.get_key_value(content), sort_keys=True).encode()).hexdigest()
+
+    return job, key
+
+
+class Job():
+    # Lines produced by a running job, kept until every client has taken them. The job waits for any client more than
+    # MAX_LAG_LINES behind, so a slow client slows the job down rather than the lines piling up ahead of it
+    def __init__(self, key):
+        self.key = key
+        self.lines = []
+        self.offset = 0  # Lines dropped from the start of lines, once every client had taken them
+        self.finished = False
+        self.positions = {}  # Lines taken by each client, counted from the job's first line
+        self.changed = asyncio.Condition()
+
+    def get_length(self):  # Lines published so far, including those dropped
+        return self.offset + len(self.lines)
+
+    async def publish(self, message):
+        async with self.changed:
+            await self.changed.wait_for(lambda: all(self.get_length() - position < MAX_LAG_LINES for position in self.positions.values()))
+            self.lines.append(json.dumps(message).encode() + b'\n')
+            self.trim()
+            self.changed.notify_all()
+
+    async def finish(self):
+        async with self.changed:
+            self.finished = True
+            self.changed.notify_all()
+
+    def add_client(self):  # New client to be sent every line from the start, or None once some lines have been dropped
+        if self.offset > 0:
+            return None
+
+        client = object()
+        self.positions[client] = 0
+        return client
+
+    async def remove_client(self, client):
+        async with self.changed:
+            del self.positions[client]
+            self.trim()
+            self.changed.notify_all()
+
+    async def get_lines(self, client):  # Lines the client has not taken yet, waiting for some if there are none, b'' once the job is over
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.positions[client] < self.get_length() or self.finished)
+            lines = self.lines[self.positions[client] - self.offset:]
+            self.positions[client] = self.get_length()
+            self.trim()
+            self.changed.notify_all()
+
+        return b''.join(lines)
+
+    def trim(self):  # Drops the lines every client has taken, which is every line once there are no clients
+        taken = min(self.positions.values(), default=self.get_length())
+        del self.lines[:taken - self.offset]
+        self.offset = taken
+
+
+class JobServer():
+    # Runs jobs on a process pool shared by every job, with at most max_tasks tasks queued in it at once
+    def __init__(self, workers=None, max_jobs=DEFAULT_MAX_JOBS, max_tasks=None, load_rocket=simulate.load_rocket):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_jobs = max_jobs
+        self.max_tasks = max_tasks or self.workers * sweep.MAX_CHUNKS_PER_WORKER
+        self.load_rocket = load_rocket
+
+        self.executor = None  # Started with the server
+        self.task_slots = None
+        self.queued_tasks = 0
+        self.jobs = {}  # Running jobs by content hash
+        self.tasks = set()  # asyncio tasks of the running jobs, kept so they are not garbage collected before they finish
+        self.server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        self.task_slots = asyncio.Semaphore(self.max_tasks)
+
+        if socket_path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=socket_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    async def iter_task_results(self, function, tasks):  # Yields function(*task) for each task as they complete, run in the process pool
+        loop = asyncio.get_running_loop()
+        pending = set()
+
+        for task in tasks:
+            await self.task_slots.acquire()  # Waits for a slot once the pool has max_tasks tasks queued, from this job or any other
+            self.queued_tasks += 1
+            future = loop.run_in_executor(self.executor, function, *task)
+            future.add_done_callback(self.release_task_slot)
+            pending.add(future)
+
+            for future in [future for future in pending if future.done()]:
+                pending.remove(future)
+                yield future.result()
+
+        while len(pending) > 0:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def release_task_slot(self, future):
+        self.queued_tasks -= 1
+        self.task_slots.release()
+
+    async def run_job(self, job, running_job):
+        try:
+            if job['type'] == 'simulate':
+                await self.run_simulate(job, running_job)
+            elif job['type'] == 'sweep':
+                await self.run_sweep(job, running_job)
+            else:
+                await self.run_monte_carlo(job, running_job)
+            await running_job.publish({'done': True})
+        except Exception as error:
+            await running_job.publish({'error': str(error)})
+        finally:
+            if self.jobs.get(running_job.key) is running_job:
+                del self.jobs[running_job.key]
+            await running_job.finish()
+
+    def end_task(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:  # run_job sends errors to the clients, so this is a bug in the server
+            sys.stderr.write(f'Job failed: {task.exception()!r}\n')
+
+    async def run_simulate(self, job, running_job):
+        async for rows, flight_events in self.iter_task_results(simulate_flight, [(job['rocket'], job['settings'], job['options'])]):
+            await running_job.publish({'columns': list(rows.dtype.names), 'flight events': flight_events})
+            for start in range(0, len(rows), ROWS_PER_LINE):
+                await running_job.publish({'rows': rows[start:start + ROWS_PER_LINE].tolist()})
+
+    async def run_sweep(self, job, running_job):
+        chunks = sweep.iter_chunks(job['overrides'], int(job.get('chunk size', sweep.DEFAULT_CHUNK_SIZE)))
+        await running_job.publish({'columns': ['run'] + [sweep.get_column_name(key) for key in sweep.get_override_keys(job['overrides'])] + sweep.SUMMARY_KEYS})
+
+        async for rows in self.iter_task_results(sweep.get_chunk_rows, ((job['rocket'], job['settings'], chunk) for chunk in chunks)):
+            for row in rows:
+                await running_job.publish(row)
+
+    async def run_monte_carlo(self, job, running_job):
+        tasks = monte_carlo.get_tasks(job['runs'], job['dispersions'], job['settings dispersions'], job.get('seed'), int(job.get('chunk size', monte_carlo.DEFAULT_CHUNK_SIZE)))
+        statistics = {key: monte_carlo.OnlineStatistics() for key in sweep.SUMMARY_KEYS}
+
+        async for summaries in self.iter_task_results(monte_carlo.simulate_samples, ((job['rocket'], job['settings'], task) for task in tasks)):
+            for key, values in summaries.items():
+                statistics[key].add(values)
+
+            await running_job.publish({'runs': statistics['apoapsis'].count, 'statistics': {key: key_statistics.get_summary() for key, key_statistics in statistics.items()}})
+
+    async def handle_connection(self, reader, writer):
+        try:
+            method, path, body = await read_request(reader)
+
+            if path == '/status' and method == 'GET':
+                await write_response(writer, 200, {'jobs': len(self.tasks), 'queued tasks': self.queued_tasks, 'max tasks': self.max_tasks, 'workers': self.workers})
+            elif path == '/jobs' and method == 'POST':
+                await self.handle_job(writer, body)
+            elif path in ['/status', '/jobs']:
+                await write_response(writer, 405, {'error': f'{method} is not allowed on {path}'})
+            else:
+                await write_response(writer, 404, {'error': f'Nothing at {path}'})
+        except RequestError as error:
+            await write_response(writer, error.status, {'error': str(error)})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    async def handle_job(self, writer, body):
+        try:
+            request = json.loads(body)
+            loop = asyncio.get_running_loop()
+            job, key = await loop.run_in_executor(None, parse_job, request, self.load_rocket)  # Reads the database in a thread
+        except Exception as error:
+            raise RequestError(400, str(error))
+
+        running_job = self.jobs.get(key)
+        client = running_job.add_client() if running_job is not None else None
+        coalesced = client is not None
+        if not coalesced:
+            if len(self.tasks) >= self.max_jobs:
+                raise RequestError(503, f'{len(self.tasks)} jobs are already running, try again later')
+
+            # Takes the place of a running job that can no longer be joined, which carries on for the clients it has
+            running_job = Job(key)
+            client = running_job.add_client()
+            self.jobs[key] = running_job
+            task = asyncio.create_task(self.run_job(job, running_job))
+            self.tasks.add(task)
+            task.add_done_callback(self.end_task)
+
+        try:
+            await write_head(writer, 200, 'application/x-ndjson')
+            await write_chunk(writer, json.dumps({'job': key, 'type': job['type'], 'coalesced': coalesced}).encode() + b'\n')
+            while True:
+                lines = await running_job.get_lines(client)
+                if len(lines) == 0:
+                    break
+                await write_chunk(writer, lines)
+            await write_chunk(writer, b'')
+        finally:
+            await running_job.remove_client(client)
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):  # (method, path, body) of an HTTP request
+    try:
+        method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise RequestError(400, 'Invalid request line')
+
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if line in ['\r\n', '\n', '']:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length', 0))
+    if length > MAX_REQUEST_BYTES:
+        raise RequestError(413, f'Requests can be at most {MAX_REQUEST_BYTES} bytes')
+
+    return method, path.split('?', 1)[0], await reader.readexactly(length)
+
+
+async def write_head(writer, status, content_type, chunked=True, length=None):
+    lines = [f'HTTP/1.1 {status} {STATUS_TEXTS[status]}', f'Content-Type: {content_type}', 'Connection: close']
+    lines.append('Transfer-Encoding: chunked' if chunked else f'Content-Length: {length}')
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+
+
+async def write_chunk(writer, data):  # An empty chunk ends the response
+    writer.write(f'{len(data):x}\r\n'.encode('latin-1') + data + b'\r\n')
+    await writer.drain()  # Waits while the client is slow to read, which in turn holds the job back
+
+
+async def write_response(writer, status, message):  # Whole JSON response
+    body = json.dumps(message).encode() + b'\n'
+    await write_head(writer, status, 'application/json', chunked=False, length=len(body))
+    writer.write(body)
+    await writer.drain()
+
+
+class JobClient():
+    # Client for a JobServer, on host and port or the Unix socket at socket_path
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+
+    async def request(self, method, path, message=None):  # (status, async iterator of the response's JSON lines)
+        if self.socket_path is not None:
+            reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+
+        body = json.dumps(message).encode() if message is not None else b''
+        writer.write(f'{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+        await writer.drain()
+
+        status = int((await reader.readline()).decode('latin-1').split(' ', 2)[1])
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1')
+            if line in ['\r\n', '\n', '']:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        return status, iter_response_lines(reader, writer, headers.get('transfer-encoding') == 'chunked')
+
+    async def iter_job(self, job):  # Yields each line of a job's results, raising an Exception if the server turns the job away
+        status, lines = await self.request('POST', '/jobs', job)
+        if status != 200:
+            async for line in lines:
+                raise Exception(f'{status} {STATUS_TEXTS.get(status, "")}: {line.get("error")}')
+
+        async for line in lines:
+            yield line
+
+    async def get_status(self):
+        _, lines = await self.request('GET', '/status')
+        async for line in lines:
+            return line
+
+    def run_job(self, job):  # Every line of a job's results, for callers without an event loop
+        async def collect():
+            return [line async for line in self.iter_job(job)]
+
+        return asyncio.run(collect())
+
+
+async def iter_response_lines(reader, writer, chunked):
+    try:
+        buffer = b''
+        while True:
+            if chunked:
+                size = int((await reader.readline()).strip(), 16)
+                data = (await reader.readexactly(size + 2))[:size]  # Leaves out the line break ending the chunk
+                if size == 0:
+                    break
+            else:
+                data = await reader.read()
+                if len(data) == 0:
+                    break
+
+            buffer += data
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                if len(line) > 0:
+                    yield json.loads(line)
+
+        if len(buffer.strip()) > 0:
+            yield json.loads(buffer)
+    finally:
+        writer.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run simulate, sweep and Monte Carlo jobs for local tools, streaming the results back as NDJSON')
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--socket', help='listen on a Unix socket at this path instead of a TCP port')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes, one per CPU by default')
+    parser.add_argument('--max-jobs', type=int, default=DEFAULT_MAX_JOBS, help='distinct jobs run at once, further jobs are turned away until one finishes')
+    parser.add_argument('--max-tasks', type=int, default=None, help=f'tasks queued in the worker processes at once, {sweep.MAX_CHUNKS_PER_WORKER} per worker by default')
+    args = parser.parse_args(args)
+
+    if db_controller.get_db_status() == 'outdated':  # Brought up to date before any job reads it, rather than by jobs running at once
+        db_controller.init_db()
+
+    async def serve():
+        server = JobServer(args.workers, args.max_jobs, args.max_tasks)
+        await server.start(args.host, args.port, args.socket)
+        sys.stderr.write(f'Listening on {args.socket or f"{args.host}:{args.port}"}\n')
+        try:
+            await server.server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+import argparse
+import concurrent.futures
+import math
+import os
+
+import numpy as np
+
+import sweep
+from part_model import *
+
+DEFAULT_CHUNK_SIZE = 256  # Runs per task, each task samples and simulates its runs together
+DEFAULT_BIN_COUNT = 1024  # Histogram resolution, percentiles are interpolated within a bin so this bounds their error
+PERCENTILES = [1, 5, 25, 50, 75, 95, 99]
+
+# Relative standard deviations used when none are given, typical of hobby motor and build tolerances
+DEFAULT_THRUST_DISPERSION = 0.03
+DEFAULT_BURN_TIME_DISPERSION = 0.03
+DEFAULT_MASS_DISPERSION = 0.02
+DEFAULT_AIR_DENSITY_DISPERSION = 0.02
+
+
+def get_default_dispersions(rocket, thrust=DEFAULT_THRUST_DISPERSION, burn_time=DEFAULT_BURN_TIME_DISPERSION, mass=DEFAULT_MASS_DISPERSION):
+    # Relative standard deviation of each perturbed part attribute, as {(local_part_id, attribute): deviation}
+    dispersions = {}
+    for part in rocket.parts:
+        if isinstance(part, Engine):
+            dispersions[(part.local_part_id, 'average_thrust')] = thrust
+            dispersions[(part.local_part_id, 'burn_time')] = burn_time
+        dispersions[(part.local_part_id, 'mass')] = mass
+
+    return {key: deviation for key, deviation in dispersions.items() if deviation != 0}
+
+
+class Histogram():
+    # Fixed number of equal width bins whose range doubles whenever a value falls outside it, so memory stays
+    # constant however many values are added. Counts from two neighbouring bins are merged each time the range doubles
+    def __init__(self, bin_count=DEFAULT_BIN_COUNT):
+        self.bin_count = bin_count + bin_count % 2  # Even, so bins always merge in pairs
+        self.counts = np.zeros(self.bin_count, dtype=np.int64)
+        self.origin = None
+        self.width = None
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return None
+
+        low, high = values.min(), values.max()
+        if self.origin is None:
+            self.origin = low
+            self.width = (high - low) / self.bin_count
+            if self.width == 0:
+                self.width = max(abs(low), 1) * 1e-9
+
+        while low < self.origin or high >= self.origin + self.width * self.bin_count:
+            self.double_range(extend_down=low < self.origin)
+
+        bins = np.minimum(((values - self.origin) / self.width).astype(int), self.bin_count - 1)
+        self.counts += np.bincount(bins, minlength=self.bin_count)
+
+    def double_range(self, extend_down):
+        merged = self.counts[0::2] + self.counts[1::2]
+        self.counts = np.zeros(self.bin_count, dtype=np.int64)
+        if extend_down:
+            self.origin -= self.width * self.bin_count
+            self.counts[self.bin_count // 2:] = merged
+        else:
+            self.counts[:self.bin_count // 2] = merged
+        self.width *= 2
+
+    def get_percentile(self, percentile):
+        total = self.counts.sum()
+        if total == 0:
+            return math.nan
+
+        cumulative_counts = np.cumsum(self.counts)
+        target = percentile / 100 * total
+        bin = min(int(np.searchsorted(cumulative_counts, target)), self.bin_count - 1)
+        before = cumulative_counts[bin] - self.counts[bin]
+        fraction = (target - before) / self.counts[bin] if self.counts[bin] > 0 else 0
+
+        return self.origin + self.width * (bin + fraction)
+
+    def get_bins(self, bin_count):  # Coarser copy of the histogram over the occupied range, as (edges, counts)
+        occupied = np.nonzero(self.counts)[0]
+        if len(occupied) == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+
+        counts = self.counts[occupied[0]:occupied[-1] + 1]
+        group = math.ceil(len(counts) / bin_count)
+        counts = np.pad(counts, (0, -len(counts) % group)).reshape(-1, group).sum(axis=1)
+        edges = self.origin + self.width * (occupied[0] + group * np.arange(len(counts) + 1))
+
+        return edges, counts
+
+
+class OnlineStatistics():
+    # Running count, mean, variance, extremes and histogram of a stream of values, added in batches
+    def __init__(self, bin_count=DEFAULT_BIN_COUNT):
+        self.count = 0
+        self.mean = 0
+        self.m2 = 0  # Sum of squared differences from the mean
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.histogram = Histogram(bin_count)
+
+    def add(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return None
+
+        # Combine the batch's own mean and spread with the running ones (Chan et al.), which is stable for large counts
+        count = len(values)
+        mean = values.mean()
+        m2 = ((values - mean)**2).sum()
+
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+
+        self.minimum = min(self.minimum, values.min())
+        self.maximum = max(self.maximum, values.max())
+        self.histogram.add(values)
+
+    def get_variance(self):
+        if self.count < 2:
+            return math.nan
+
+        return self.m2 / (self.count - 1)
+
+    def get_standard_deviation(self):
+        return math.sqrt(self.get_variance())
+
+    def get_percentile(self, percentile):
+        return min(max(self.histogram.get_percentile(percentile), self.minimum), self.maximum)
+
+    def get_summary(self, percentiles=PERCENTILES):
+        summary = {
+            'count': self.count,
+            'mean': float(self.mean),
+            'standard deviation': self.get_standard_deviation(),
+            'min': float(self.minimum),
+            'max': float(self.maximum)
+        }
+        summary.update({f'p{percentile}': float(self.get_percentile(percentile)) for percentile in percentiles})
+
+        return summary
+
+
+def sample_runs(rocket, settings, dispersions, settings_dispersions, count, seed_sequence):  # Perturbed rockets and settings for count runs
+    rng = np.random.default_rng(seed_sequence)
+
+    factors = {key: np.maximum(rng.normal(1, deviation, count), 0) for key, deviation in dispersions.items()}
+    points = [{} for _ in range(count)]
+    for (part_id, attribute), attribute_factors in factors.items():
+        nominal = getattr(rocket.get_part_with_part_id(part_id), attribute)
+        for point, factor in zip(points, attribute_factors):
+            point[(part_id, attribute)] = nominal * factor
+
+    factors = {setting: np.maximum(rng.normal(1, deviation, count), 0) for setting, deviation in settings_dispersions.items()}
+    run_settings = [dict(settings) for _ in range(count)]
+    for setting, setting_factors in factors.items():
+        for member_settings, factor in zip(run_settings, setting_factors):
+            member_settings[setting] = settings[setting] * factor
+
+    return [sweep.apply_overrides(rocket, point) for point in points], run_settings
+
+
+def simulate_chunk(task):  # task is (count, seed_sequence, dispersions, settings_dispersions), returns each summary value of the runs as arrays
+    return simulate_samples(sweep.worker_rocket, sweep.worker_settings, task)
+
+
+def simulate_samples(rocket, settings, task):  # As simulate_chunk for any rocket and settings
+    count, seed_sequence, dispersions, settings_dispersions = task
+    rockets, run_settings = sample_runs(rocket, settings, dispersions, settings_dispersions, count, seed_sequence)
+
+    return sweep.simulate_summaries(rockets, run_settings)
+
+
+def check_dispersions(rocket, settings, dispersions, settings_dispersions):
+    sweep.check_overrides(rocket, {part_id: {attribute: []} for part_id, attribute in dispersions})
+    for setting in settings_dispersions:
+        if setting not in settings:
+            raise Exception(f'No setting called {setting}')
+
+
+def get_tasks(runs, dispersions, settings_dispersions, seed=None, chunk_size=DEFAULT_CHUNK_SIZE):  # Yields a simulate_chunk task for each chunk of the runs
+    # Each chunk draws from its own child of the seed, so a seeded study gives the same runs whatever order the chunks finish in
+    chunk_counts = [chunk_size] * (runs // chunk_size) + ([runs % chunk_size] if runs % chunk_size else [])
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(chunk_counts))
+
+    return ((count, seed_sequence, dispersions, settings_dispersions) for count, seed_sequence in zip(chunk_counts, seed_sequences))
+
+
+def run_monte_carlo(rocket, runs, dispersions=None, settings=sweep.DEFAULT_SETTINGS, settings_dispersions=None, seed=None, workers=None,
+                    chunk_size=DEFAULT_CHUNK_SIZE, bin_count=DEFAULT_BIN_COUNT, callback=None):
+    # Returns {summary key: OnlineStatistics} over every run. Each chunk draws from its own child of the seed, so a
+    # seeded study gives the same runs whatever the number of workers or the order chunks finish in
+    if isinstance(rocket, str):
+        rocket = sweep.load_rocket(rocket)
+    if dispersions is None:
+        dispersions = get_default_dispersions(rocket)
+    if settings_dispersions is None:
+        settings_dispersions = {'air density': DEFAULT_AIR_DENSITY_DISPERSION}
+
+    check_dispersions(rocket, settings, dispersions, settings_dispersions)
+
+    workers = workers or os.cpu_count() or 1
+    tasks = get_tasks(runs, dispersions, settings_dispersions, seed, chunk_size)
+
+    statistics = {key: OnlineStatistics(bin_count) for key in sweep.SUMMARY_KEYS}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=sweep.init_worker, initargs=(rocket, settings)) as executor:
+        for summaries in sweep.iter_task_results(executor, simulate_chunk, tasks, workers * sweep.MAX_CHUNKS_PER_WORKER):
+            for key, values in summaries.items():
+                statistics[key].add(values)
+
+            if callback is not None:
+                callback(statistics)
+
+    return statistics
+
+
+def format_histogram(statistics, bin_count, width=50):
+    edges, counts = statistics.histogram.get_bins(bin_count)
+    lines = []
+    for low, high, count in zip(edges[:-1], edges[1:], counts):
+        bar = '#' * round(width * count / max(counts.max(), 1))
+        lines.append(f'{low:12.3f} - {high:12.3f} | {count:9d} {bar}')
+
+    return '\n'.join(lines)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Monte Carlo dispersion analysis of a saved rocket')
+    parser.add_argument('rocket', help='name of a rocket saved in the database')
+    parser.add_argument('-n', '--runs', type=int, default=1000, help='number of runs')
+    parser.add_argument('--seed', type=int, default=None, help='seed for the random number generator, for repeatable studies')
+    parser.add_argument('--thrust', type=float, default=DEFAULT_THRUST_DISPERSION, help='relative standard deviation of engine thrust')
+    parser.add_argument('--burn-time', type=float, default=DEFAULT_BURN_TIME_DISPERSION, help='relative standard deviation of engine burn time')
+    parser.add_argument('--mass', type=float, default=DEFAULT_MASS_DISPERSION, help='relative standard deviation of part masses')
+    parser.add_argument('--air-density-dispersion', type=float, default=DEFAULT_AIR_DENSITY_DISPERSION, help='relative standard deviation of air density')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes, one per CPU by default')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='runs simulated per task')
+    parser.add_argument('--histogram', default='apoapsis', choices=sweep.SUMMARY_KEYS, help='summary value to print a histogram of')
+    parser.add_argument('--histogram-bins', type=int, default=20)
+    for setting, value in sweep.DEFAULT_SETTINGS.items():
+        parser.add_argument('--' + setting.replace(' ', '-'), type=float, default=value, dest=setting, metavar=setting.upper().replace(' ', '_'))
+    args = parser.parse_args(args)
+
+    settings = {setting: getattr(args, setting) for setting in sweep.DEFAULT_SETTINGS}
+
+    try:
+        rocket = sweep.load_rocket(args.rocket)
+    except Exception as error:
+        parser.error(str(error))
+
+    dispersions = get_default_dispersions(rocket, args.thrust, args.burn_time, args.mass)
+    settings_dispersions = {'air density': args.air_density_dispersion} if args.air_density_dispersion != 0 else {}
+
+    statistics = run_monte_carlo(rocket, args.runs, dispersions, settings, settings_dispersions, args.seed, args.workers, args.chunk_size)
+
+    columns = ['mean', 'standard deviation', 'min'] + [f'p{percentile}' for percentile in PERCENTILES] + ['max']
+    print(f"{'':14}" + ''.join(f'{column:>20}' for column in columns))
+    for key, key_statistics in statistics.items():
+        summary = key_statistics.get_summary()
+        print(f'{key:14}' + ''.join(f'{summary[column]:20.4f}' for column in columns))
+
+    print()
+    print(f'{args.histogram} histogram')
+    print(format_histogram(statistics[args.histogram], args.histogram_bins))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+import math
+
+# Physical model of a rocket, holding only what is saved to the database
+# Every part class lists its saved attributes in FIELDS, in the same order as the columns of its database table
+# Editing and rendering state is added on top of these classes by rocket_parts, so nothing here needs pygame
+
+
+def check_part_type(part, part_whitelist):
+    for whitelisted_part in part_whitelist:
+        if isinstance(part, whitelisted_part):
+            return True
+    return False
+
+
+def get_children(master_part, rocket):
+    children = []
+
+    for part in rocket.parts:
+        if hasattr(part, 'parent_id'):
+            if part.parent_id == master_part.local_part_id:
+                children.append(part)
+
+    return children
+
+
+class RocketPart():
+    __slots__ = ('local_part_id',)
+    FIELDS = ('local_part_id',)
+
+    def __init__(self, local_part_id=None):
+        self.local_part_id = local_part_id
+
+    def get_stage(self, rocket):
+        for stage_num, stage in enumerate(rocket.stages):
+            if self.local_part_id in stage:
+                return stage_num
+
+        return None
+
+    def get_fields(self):  # Saved attributes as a dictionary, in database column order
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+class Rocket():
+    __slots__ = ('name', 'parts', 'new_part_id', 'stages')
+
+    def __init__(self, name='New Rocket', parts=[], new_part_id=0):
+        self.name = name
+        self.parts = parts
+        self.new_part_id = new_part_id
+
+        self.stages = [] # List of lists of part ids
+
+    def get_part_with_part_id(self, part_id):
+        for part in self.parts:
+            if part.local_part_id == part_id:
+                return part
+
+
+class BodyTube(RocketPart):
+    __slots__ = ('length', 'diameter', 'wall_thickness', 'density', 'mass')
+    FIELDS = RocketPart.FIELDS + __slots__
+
+    def __init__(self, length=1, diameter=0.3, wall_thickness=0.01, density=1330, mass=None, local_part_id=None):
+        super().__init__(local_part_id)
+
+        self.length = length
+        self.diameter = diameter
+        self.wall_thickness = wall_thickness
+        self.density = density
+        self.mass = self.get_mass()
+
+    def get_mass(self):
+        return round(self.density * math.pi * self.length * (self.diameter**2 - (self.diameter - self.wall_thickness)**2) / 4, 10)
+
+
+class NoseCone(RocketPart):
+    __slots__ = ('cone_shape', 'length', 'diameter', 'density', 'mass')
+    FIELDS = RocketPart.FIELDS + __slots__
+
+    def __init__(self, cone_shape='conic', length=0.3, diameter=0.3, density=1330, mass=None, local_part_id=None):
+        super().__init__(local_part_id)
+
+        self.cone_shape = cone_shape
+        self.length = length
+        self.diameter = diameter
+        self.density = density
+        self.mass = self.get_mass()
+
+    def get_mass(self):
+        if self.cone_shape == 'conic':
+            return round(math.pi * (self.diameter/2)**2 * self.length/3, 10)
+        else:
+            raise Exception('Invalid cone shape')
+
+
+class Engine(RocketPart):
+    __slots__ = ('length', 'diameter', 'mass', 'propellant_mass', 'offset', 'average_thrust', 'burn_time', 'parent_id', 'thrust_curve')
+    FIELDS = RocketPart.FIELDS + __slots__
+
+    # thrust_curve is the text of a RASP .eng file, or None for constant thrust. The curve is scaled to the engine's average_thrust
+    # and burn_time, which load_eng sets to the motor's own
+    def __init__(self, parent_id=None, length=0.5, diameter=0.1, mass=1, propellant_mass=0.9, offset=0, average_thrust=100, burn_time=10, local_part_id=None, thrust_curve=None):
+        super().__init__(local_part_id)
+
+        self.length = length
+        self.diameter = diameter
+        self.mass = mass
+        self.propellant_mass = propellant_mass
+        self.offset = offset
+        self.average_thrust = average_thrust
+        self.burn_time = burn_time
+
+        self.parent_id = parent_id
+        self.thrust_curve = thrust_curve
+
+    def get_thrust_curve(self):  # ThrustCurve tables, or None for constant thrust
+        if not self.thrust_curve:
+            return None
+
+        import thrust_curves  # Imported when first needed, so the part model and the database never import numpy
+        return thrust_curves.get_thrust_curve(self.thrust_curve)
+
+    def load_eng(self, text):  # Takes the thrust curve, dimensions and masses of the motor in a RASP .eng file
+        import thrust_curves
+        header, _, _ = thrust_curves.parse_eng(text)
+        curve = thrust_curves.get_thrust_curve(text)
+
+        self.thrust_curve = text
+        self.average_thrust = curve.average_thrust
+        self.burn_time = curve.burn_time
+        self.length = header['length']
+        self.diameter = header['diameter']
+        self.mass = header['mass']
+        self.propellant_mass = header['propellant_mass']
+
+
+class Fins(RocketPart):
+    __slots__ = ('fin_shape', 'fin_count', 'width', 'length', 'thickness', 'offset', 'mass', 'parent_id')
+    FIELDS = RocketPart.FIELDS + __slots__
+
+    def __init__(self, parent_id=None, fin_shape='triangle', fin_count=4, length=0.2, thickness=0.05, width=0.1, offset=0, mass=0.05, local_part_id=None):
+        super().__init__(local_part_id)
+
+        self.fin_shape = fin_shape
+        self.fin_count = fin_count
+        self.width = width
+        self.length = length
+        self.thickness = thickness
+        self.offset = offset
+        self.mass = mass
+
+        self.parent_id = parent_id
+
+
+class Decoupler(RocketPart):
+    __slots__ = ('length', 'diameter', 'mass')
+    FIELDS = RocketPart.FIELDS + __slots__
+
+    def __init__(self, length=0.05, diameter=0.3, mass=0.1, local_part_id=None):
+        super().__init__(local_part_id)
+
+        self.length = length
+        self.diameter = diameter
+        self.mass = mass
+
+
+ROCKET_PARTS = [BodyTube, NoseCone, Engine, Fins, Decoupler]
@@ -0,0 +1,222 @@
+import math
+import collections
+
+import numpy as np
+
+import atmosphere
+from tables import get_table_value, get_table_values
+from trajectory import FLIGHT_DATA_DTYPE
+from rocket_simulator import *
+from batch_simulator import BatchSimulator, FLIGHT_DATA_KEYS, MEMBER_ATTRIBUTES
+
+# Flight in the vertical plane of the launch rail, x downrange and z up, for landing zones as well as altitudes
+# The recorded channels are those of the vertical flight, altitude, velocity, acceleration, g-force and drag being the vertical
+# components and thrust the whole thrust, followed by the downrange distance and the flight path angle in degrees above horizontal
+
+PLANAR_FLIGHT_DATA_DTYPE = np.dtype(FLIGHT_DATA_DTYPE.descr + [('downrange', float), ('flight path angle', float)])
+PLANAR_FLIGHT_DATA_KEYS = FLIGHT_DATA_KEYS + ['downrange', 'flight path angle']
+PLANAR_RECORDING_TOLERANCE = {
+    'downrange': 0.01,  # m
+    'flight path angle': 0.01  # degrees
+}
+DEFAULT_RAIL_LENGTH = 1  # m
+
+PlanarStepRecord = collections.namedtuple('PlanarStepRecord', StepRecord._fields + ('downrange', 'flight_path_angle'))
+
+
+class WindProfile():
+    # Horizontal wind speed over altitude in m/s, positive when blowing downrange, tabulated on the altitudes of the atmosphere table
+    # The speed is linear between the given altitudes, and the speed at the nearest one outside them
+    def __init__(self, altitudes, speeds):
+        altitudes = np.atleast_1d(np.array(altitudes, dtype=float))
+        speeds = np.atleast_1d(np.array(speeds, dtype=float))
+        if len(altitudes) == 0 or len(altitudes) != len(speeds):
+            raise Exception('A wind profile needs one speed for each altitude')
+        if np.any(np.diff(altitudes) <= 0):
+            raise Exception('Wind profile altitudes must increase')
+
+        self.speeds = np.interp(atmosphere.TABLE_BOTTOM + atmosphere.TABLE_SPACING * np.arange(atmosphere.TABLE_SIZE + 1), altitudes, speeds)
+        self.speed_list = self.speeds.tolist()
+
+    def get_speed(self, altitude):
+        return get_table_value(self.speed_list, atmosphere.TABLE_BOTTOM, atmosphere.TABLE_SPACING, atmosphere.TABLE_SIZE, altitude)
+
+
+def get_wind_profile(wind):  # WindProfile from None for still air, a speed at every altitude or a WindProfile
+    if wind is None or isinstance(wind, WindProfile):
+        return wind
+
+    return WindProfile([0], [wind])
+
+
+def get_wind_speeds(tables, wind_index, altitudes):  # As WindProfile.get_speed for arrays, tables being every wind profile joined end to end
+    return get_table_values(tables, atmosphere.TABLE_BOTTOM, atmosphere.TABLE_SPACING, atmosphere.TABLE_SIZE, altitudes, wind_index)
+
+
+def get_launch_direction(launch_angle):  # Unit vector along the launch rail, launch_angle being in degrees from vertical, tilted downrange
+    if not -90 < launch_angle < 90:
+        raise Exception(f'Invalid launch angle: {launch_angle}, it must be less than 90 degrees from vertical')
+
+    return [math.sin(math.radians(launch_angle)), math.cos(math.radians(launch_angle))]
+
+
+class PlanarSimulator(Simulator):
+    # The rocket's position and velocity are held in one array, [x, z, vx, vz]. It moves along the launch rail, launch_angle degrees
+    # from vertical, until it is rail_length from the launch point, then weathercocks: it points along its velocity through the air,
+    # which is its velocity less the wind. wind is None for still air, a speed in m/s, or a WindProfile
+    # Only the euler integrator is supported, and analytic_coast has no effect. Other options are as for Simulator
+    flight_data_dtype = PLANAR_FLIGHT_DATA_DTYPE
+    step_record = PlanarStepRecord
+    checkpoint_attributes = Simulator.checkpoint_attributes + ['state', 'downrange', 'flight_path_angle']
+
+    def __init__(self, rocket, settings, launch_angle=0, rail_length=DEFAULT_RAIL_LENGTH, wind=None, recording_tolerance=None, **options):
+        if options.get('integrator', 'euler') != 'euler':
+            raise Exception('The planar simulation only supports the euler integrator')
+        options['analytic_coast'] = False
+
+        if recording_tolerance is not None:
+            recording_tolerance = dict(PLANAR_RECORDING_TOLERANCE, **recording_tolerance)
+
+        self.launch_angle = launch_angle
+        self.launch_direction = np.array(get_launch_direction(launch_angle))
+        self.rail_length = rail_length
+        self.wind = get_wind_profile(wind)
+
+        self.state = np.zeros(4)
+        self.downrange = 0
+        self.flight_path_angle = 90 - launch_angle
+
+        super().__init__(rocket, settings, recording_tolerance=recording_tolerance, **options)
+
+    def get_flight_options(self):
+        wind_speeds = self.wind.speed_list if self.wind is not None else None
+        return super().get_flight_options() + [self.launch_angle, self.rail_length, wind_speeds]
+
+    def move(self):
+        time_increment = self.settings['time increment']
+        state = self.state
+
+        air_velocity = state[2:].copy()
+        if self.wind is not None:
+            air_velocity[0] -= self.wind.get_speed(state[1])
+        air_speed = np.hypot(air_velocity[0], air_velocity[1])
+
+        if air_speed != 0:
+            air_direction = air_velocity / air_speed
+        else:
+            air_direction = np.zeros(2)
+
+        on_rail = np.hypot(state[0], state[1]) < self.rail_length
+        direction = self.launch_direction if on_rail or air_speed == 0 else air_direction
+
+        drag = self.get_drag(float(air_speed), state[1])  # Along the velocity through the air, so never positive
+        force = self.thrust * direction + air_direction * drag
+
+        if self.mass != 0:
+            acceleration = force / self.mass
+            acceleration[1] -= self.settings['gravity acc']
+        else:
+            acceleration = np.full(2, float(LARGE_NUMBER))
+
+        if on_rail:  # The rail only lets the rocket move along it
+            acceleration = (acceleration[0] * self.launch_direction[0] + acceleration[1] * self.launch_direction[1]) * self.launch_direction
+
+        state[2:] += acceleration * time_increment
+        state[:2] += state[2:] * time_increment
+
+        self.downrange = float(state[0])
+        self.altitude = float(state[1])
+        self.velocity = float(state[3])
+        self.acceleration = float(acceleration[1])
+        self.g_force = self.acceleration / self.settings['gravity acc']
+        self.drag = float(air_direction[1] * drag)
+        if state[2] != 0 or state[3] != 0:
+            self.flight_path_angle = float(np.degrees(np.arctan2(state[3], state[2])))
+
+    def update_flight_data(self):
+        return self.add_row((self.time, self.altitude, self.velocity, self.acceleration, self.g_force, self.thrust, self.drag, self.fuel, self.mass, self.current_stage,
+                             self.downrange, self.flight_path_angle))
+
+
+class PlanarBatchSimulator(BatchSimulator):
+    # PlanarSimulator for many members at once, the state of every member being a row of one array. launch_angle, rail_length
+    # and wind are either shared by every member or given as a list with one for each member, for landing zone studies
+    flight_data_keys = PLANAR_FLIGHT_DATA_KEYS
+    member_attributes = MEMBER_ATTRIBUTES + ['state', 'launch_direction', 'rail_length', 'wind_index', 'downrange', 'flight_path_angle']
+
+    def __init__(self, rockets, settings, launch_angle=0, rail_length=DEFAULT_RAIL_LENGTH, wind=None, **options):
+        super().__init__(rockets, settings, **options)
+
+        launch_angles = np.broadcast_to(np.array(launch_angle, dtype=float), self.size).tolist()
+        self.launch_direction = np.array([get_launch_direction(angle) for angle in launch_angles])
+        self.rail_length = np.broadcast_to(np.array(rail_length, dtype=float), self.size).copy()
+
+        # Every member has a wind profile, still air being a profile of no wind shared by the members without one
+        winds = wind if isinstance(wind, (list, tuple)) else [wind] * self.size
+        if len(winds) != self.size:
+            raise Exception('Number of winds and number of members do not match')
+
+        wind_profiles = [WindProfile([0], [0])]
+        self.wind_index = np.zeros(self.size, dtype=int)
+        for member, member_wind in enumerate(winds):
+            profile = get_wind_profile(member_wind)
+            if profile is None:
+                continue
+
+            for index, other_profile in enumerate(wind_profiles):
+                if other_profile is profile:
+                    break
+            else:
+                index = len(wind_profiles)
+                wind_profiles.append(profile)
+            self.wind_index[member] = index
+        self.wind_tables = np.concatenate([profile.speeds for profile in wind_profiles])
+
+        self.state = np.zeros((self.size, 4))
+        self.downrange = np.zeros(self.size)
+        self.flight_path_angle = 90 - np.array(launch_angles)
+
+    def move(self):
+        state = self.state
+
+        air_velocity = state[:, 2:].copy()
+        air_velocity[:, 0] -= get_wind_speeds(self.wind_tables, self.wind_index, state[:, 1])
+        air_speed = np.hypot(air_velocity[:, 0], air_velocity[:, 1])
+
+        moving = air_speed != 0
+        air_direction = np.zeros_like(air_velocity)
+        np.divide(air_velocity, air_speed[:, np.newaxis], out=air_direction, where=moving[:, np.newaxis])
+
+        on_rail = np.hypot(state[:, 0], state[:, 1]) < self.rail_length
+        direction = np.where((on_rail | ~moving)[:, np.newaxis], self.launch_direction, air_direction)
+
+        drag = self.get_drag(air_speed, state[:, 1])
+        force = self.thrust[:, np.newaxis] * direction + air_direction * drag[:, np.newaxis]
+
+        has_mass = self.mass != 0
+        acceleration = np.full((len(self.active), 2), float(LARGE_NUMBER))
+        np.divide(force, self.mass[:, np.newaxis], out=acceleration, where=has_mass[:, np.newaxis])
+        acceleration[has_mass, 1] -= self.gravity_acc[has_mass]
+
+        along_rail = acceleration[:, 0] * self.launch_direction[:, 0] + acceleration[:, 1] * self.launch_direction[:, 1]
+        acceleration[on_rail] = along_rail[on_rail, np.newaxis] * self.launch_direction[on_rail]
+
+        state[:, 2:] += acceleration * self.time_increment[:, np.newaxis]
+        state[:, :2] += state[:, 2:] * self.time_increment[:, np.newaxis]
+
+        self.downrange = state[:, 0].copy()
+        self.altitude = state[:, 1].copy()
+        self.velocity = state[:, 3].copy()
+        self.acceleration = acceleration[:, 1].copy()
+        self.g_force = self.acceleration / self.gravity_acc
+        self.drag = air_direction[:, 1] * drag
+
+        moved = (state[:, 2] != 0) | (state[:, 3] != 0)
+        self.flight_path_angle[moved] = np.degrees(np.arctan2(state[moved, 3], state[moved, 2]))
+
+    def get_state(self):
+        state = super().get_state()
+        state['downrange'] = self.downrange
+        state['flight path angle'] = self.flight_path_angle
+
+        return state
@@ -4,24 +4,11 @@ import time
 import random
 
 import geometry
+import part_model
+from part_model import check_part_type, get_children, Rocket
 
-
-def check_part_type(part, part_whitelist):
-    for whitelisted_part in part_whitelist:
-        if isinstance(part, whitelisted_part):
-            return True
-    return False
-
-
-def get_children(master_part, rocket):
-    children = []
-
-    for part in rocket.parts:
-        if hasattr(part, 'parent_id'):
-            if part.parent_id == master_part.local_part_id:
-                children.append(part)
-    
-    return children
+# Editor and renderer layer over the physical part model in part_model, adding the state used while editing
+# and drawing a rocket. Parts created by the editor are these classes, which are still part_model parts
 
 
 def get_entry(master, variable, last_value, blacklist=[None, 0]):
@@ -35,10 +22,8 @@ def get_entry(master, variable, last_value, blacklist=[None, 0]):
         return last_value
 
 
-class RocketPart():
-    def __init__(self, colour=(255, 255, 255), local_part_id=None):
-        self.local_part_id = local_part_id
-
+class EditorPart():
+    def __init__(self, colour=(255, 255, 255)):
         self.colour = colour
 
         self.being_dragged = False
@@ -49,37 +34,12 @@ class RocketPart():
     
     def check_point_in_hit_box(self, point):
         return geometry.check_point_in_poly(point, self.hit_box)
-    
-    def get_stage(self, rocket):
-        for stage_num, stage in enumerate(rocket.stages):
-            if self.local_part_id in stage:
-                return stage_num
-        
-        return None
-
-class Rocket():
-    def __init__(self, name='New Rocket', parts=[], new_part_id=0):
-        self.name = name
-        self.parts = parts
-        self.new_part_id = new_part_id
-
-        self.stages = [] # List of lists of part ids
-    
-    def get_part_with_part_id(self, part_id):
-        for part in self.parts:
-            if part.local_part_id == part_id:
-                return part
 
 
-class BodyTube(RocketPart):
+class BodyTube(part_model.BodyTube, EditorPart):
     def __init__(self, length=1, diameter=0.3, wall_thickness=0.01, density=1330, mass=None, colour=(255, 255, 255), local_part_id=None):
-        super().__init__(colour, local_part_id)
-
-        self.length = length
-        self.diameter = diameter
-        self.wall_thickness = wall_thickness
-        self.density = density
-        self.mass = self.get_mass()
+        part_model.BodyTube.__init__(self, length, diameter, wall_thickness, density, mass, local_part_id)
+        EditorPart.__init__(self, colour)
 
         self.unrotated_hit_box = [0, 0, 0, 0]
 
@@ -96,9 +56,6 @@ class BodyTube(RocketPart):
             else:
                 self.mass = get_entry(master, 'mass', self.mass)
     
-    def get_mass(self):
-        return round(self.density * math.pi * self.length * (self.diameter**2 - (self.diameter - self.wall_thickness)**2) / 4, 10)
-    
     def render(self, root, rocket, zoom, length_rendered, total_length, graphic_centre, normal_line_width, selected_line_width, angle=0):
         if self.selected:
             line_width = selected_line_width
@@ -131,15 +88,10 @@ class BodyTube(RocketPart):
             pygame.draw.polygon(root, self.colour, self.vertices, line_width)
 
 
-class NoseCone(RocketPart):
+class NoseCone(part_model.NoseCone, EditorPart):
     def __init__(self, cone_shape='conic', length=0.3, diameter=0.3, density=1330, mass=None, colour=(255, 255, 255), local_part_id=None):
-        super().__init__(colour, local_part_id)
-
-        self.cone_shape = cone_shape
-        self.length = length
-        self.diameter = diameter
-        self.density = density
-        self.mass = self.get_mass()
+        part_model.NoseCone.__init__(self, cone_shape, length, diameter, density, mass, local_part_id)
+        EditorPart.__init__(self, colour)
 
     
     def editor_update_variables(self, master):
@@ -152,11 +104,6 @@ class NoseCone(RocketPart):
             else:
                 self.mass = get_entry(master, 'mass', self.mass)
     
-    def get_mass(self):
-        if self.cone_shape == 'conic':
-            return round(math.pi * (self.diameter/2)**2 * self.length/3, 10)
-        else:
-            raise Exception('Invalid cone shape')
 
     def render(self, root, rocket, zoom, length_rendered, total_length, graphic_centre, normal_line_width, selected_line_width, angle=0):
         if self.selected:
@@ -193,19 +140,11 @@ class NoseCone(RocketPart):
                 pygame.draw.polygon(root, self.colour, self.vertices, line_width)
 
 
-class Engine(RocketPart):
-    def __init__(self, parent_id=None, length=0.5, diameter=0.1, mass=1, propellant_mass=0.9, offset=0, average_thrust=100, burn_time=10, colour=(255, 255, 255), local_part_id=None):
-        super().__init__(colour, local_part_id)
-
-        self.length = length
-        self.diameter = diameter
-        self.mass = mass
-        self.propellant_mass = propellant_mass
-        self.offset = offset
-        self.average_thrust = average_thrust
-        self.burn_time = burn_time
+class Engine(part_model.Engine, EditorPart):
+    def __init__(self, parent_id=None, length=0.5, diameter=0.1, mass=1, propellant_mass=0.9, offset=0, average_thrust=100, burn_time=10, colour=(255, 255, 255), local_part_id=None, thrust_curve=None):
+        part_model.Engine.__init__(self, parent_id, length, diameter, mass, propellant_mass, offset, average_thrust, burn_time, local_part_id, thrust_curve)
+        EditorPart.__init__(self, colour)
 
-        self.parent_id = parent_id
         self.parent = BodyTube()  # Skeleton object to reference before update_variables is first called
 
 
@@ -300,19 +239,11 @@ class Engine(RocketPart):
                 pygame.draw.polygon(root, self.colour, self.vertices, line_width)
 
 
-class Fins(RocketPart):
+class Fins(part_model.Fins, EditorPart):
     def __init__(self, parent_id=None, fin_shape='triangle', fin_count=4, length=0.2, thickness=0.05, width=0.1, offset=0, mass=0.05, colour=(255, 255, 255), local_part_id=None):
-        super().__init__(colour, local_part_id)
+        part_model.Fins.__init__(self, parent_id, fin_shape, fin_count, length, thickness, width, offset, mass, local_part_id)
+        EditorPart.__init__(self, colour)
 
-        self.fin_shape = fin_shape
-        self.fin_count = fin_count
-        self.width = width
-        self.length = length
-        self.thickness = thickness
-        self.offset = offset
-        self.mass = mass
-
-        self.parent_id = parent_id
         self.parent = BodyTube() # Skeleton object to reference before update_variables is first called
 
     
@@ -383,13 +314,10 @@ class Fins(RocketPart):
                 pygame.draw.polygon(root, self.colour, self.vertices[1], line_width)
 
 
-class Decoupler(RocketPart):
+class Decoupler(part_model.Decoupler, EditorPart):
     def __init__(self, length=0.05, diameter=0.3, mass=0.1, colour=(255, 255, 255), local_part_id=None):
-        super().__init__(colour, local_part_id)
-
-        self.length = length
-        self.diameter = diameter
-        self.mass = mass
+        part_model.Decoupler.__init__(self, length, diameter, mass, local_part_id)
+        EditorPart.__init__(self, colour)
     
     def editor_update_variables(self, master):
         if self.selected:
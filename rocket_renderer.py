@@ -55,7 +55,7 @@ def render_rocket_editor(rocket, root, container, font=None, auto_zoom=True, zoo
                 root.blit(stage_number_surface, text_rect)
 
 
-def render_rocket_simulation(current_rocket, flight_data, time_step, angle, root, container, font=None, zoom_multiplier=0.9, line_width=2, reference_line_separation=100):  # time_step is how many steps of the simulation have been rendered since the start of the data
+def render_rocket_simulation(current_rocket, state, apoapsis, angle, root, container, font=None, zoom_multiplier=0.9, line_width=2, reference_line_separation=100):  # state is the flight data row being shown, apoapsis the highest altitude of the flight
     # ZOOM
     container_centre = geometry.get_box_centre(container)
 
@@ -87,8 +87,8 @@ def render_rocket_simulation(current_rocket, flight_data, time_step, angle, root
             continue
 
         if check_part_type(part, [Engine]):
-            if part.get_stage(current_rocket) == flight_data['stage'][time_step-1]:  # Engine burning
-                part.render(root=root, rocket=current_rocket, zoom=zoom, length_rendered=length_rendered, total_length=total_length, graphic_centre=container_centre, normal_line_width=line_width, selected_line_width=line_width, angle=angle, burning=True, fuel=flight_data["fuel"][time_step-1])
+            if part.get_stage(current_rocket) == state['stage']:  # Engine burning
+                part.render(root=root, rocket=current_rocket, zoom=zoom, length_rendered=length_rendered, total_length=total_length, graphic_centre=container_centre, normal_line_width=line_width, selected_line_width=line_width, angle=angle, burning=True, fuel=state['fuel'])
             else:  # Engine not burning
                 part.render(root=root, rocket=current_rocket, zoom=zoom, length_rendered=length_rendered, total_length=total_length, graphic_centre=container_centre, normal_line_width=line_width, selected_line_width=line_width, angle=angle, burning=False, fuel=1)
         else:
@@ -98,11 +98,10 @@ def render_rocket_simulation(current_rocket, flight_data, time_step, angle, root
             length_rendered += part.length * zoom
 
     # ALTITUDE REFERENCE LINES
-    current_altitude = flight_data['altitude'][time_step-1]
+    current_altitude = state['altitude']
     altitude_line_width = math.ceil(6 * zoom_multiplier)  # Altitude lines get thinner as the camera zooms out to give the illusion of depth
 
     # Apoapsis line
-    apoapsis = max(flight_data['altitude'])
     y_coord = (current_altitude - apoapsis) * zoom + container_centre[1]
 
     if container[1] + container[3] >= y_coord >= container[1]:
@@ -113,8 +112,12 @@ def render_rocket_simulation(current_rocket, flight_data, time_step, angle, root
 
             root.blit(altitude_marker_surface, text_rect)
     
-    # Incremental altitude lines
-    for line_altitude in range(0, int(max(flight_data['altitude'])), reference_line_separation):
+    # Incremental altitude lines, only the ones in the container are visited rather than every one up to apoapsis
+    lowest_visible = current_altitude - (container[1] + container[3] - container_centre[1]) / zoom
+    highest_visible = current_altitude + (container_centre[1] - container[1]) / zoom
+    first_line = max(0, math.floor(lowest_visible / reference_line_separation) * reference_line_separation)  # One line either side spare, which the check below leaves out
+    last_line = min(int(apoapsis), math.floor(highest_visible) + reference_line_separation)
+    for line_altitude in range(first_line, last_line, reference_line_separation):
         y_coord = (current_altitude - line_altitude) * zoom + container_centre[1]
 
         if container[1] + container[3] >= y_coord >= container[1]:
@@ -126,10 +129,14 @@ def render_rocket_simulation(current_rocket, flight_data, time_step, angle, root
                 root.blit(altitude_marker_surface, text_rect)
 
 
-def draw_slider(root, start, end, position, colour=(255, 255, 255), line_width=3, button_radius=10):  # position should be 0 -> 1
-    pygame.draw.line(root, colour, start, end, width=line_width)
-
+def draw_slider(root, start, end, position, colour=(255, 255, 255), line_width=3, button_radius=10, computed=1, uncomputed_colour=(100, 100, 100)):  # position and computed should be 0 -> 1
+    # computed is how far along the line has been simulated, the rest of the line is drawn in uncomputed_colour
     line_vector = geometry.get_distance_vector(start, end)
+
+    computed_end = [line_vector[0] * computed + start[0], line_vector[1] * computed + start[1]]
+    if computed < 1:
+        pygame.draw.line(root, uncomputed_colour, computed_end, end, width=line_width)
+    pygame.draw.line(root, colour, start, computed_end, width=line_width)
     circle_pos = [line_vector[0] * position + start[0], line_vector[1] * position + start[1]]
 
     pygame.draw.circle(root, colour, circle_pos, button_radius)
@@ -1,8 +1,61 @@
-from rocket_parts import *
+from part_model import *
 import math
-import copy
+import collections
+
+import numpy as np
+
+from trajectory import FLIGHT_DATA_DTYPE, Trajectory, TrajectoryWriter, Decimator
+from coast import CoastPhase
+import adaptive_integrator
+from atmosphere import ATMOSPHERES, SEA_LEVEL_SPEED_OF_SOUND, get_standard_atmosphere
+import drag_tables
+from drag_tables import DRAG_MODELS
+from tables import get_table_value
+from simulation_stats import SimulationStats
 
 LARGE_NUMBER = 10000000000000  # Used to represent dividing by zero, so the program does not crash
+INTEGRATORS = ['euler', 'adaptive']
+DEFAULT_SETTINGS = {
+    'gravity acc': 9.81,
+    'air density': 1.225,
+    'time increment': 0.01,
+    'altitude cutoff': -10,
+    'time cutoff': 1000
+}
+TAIL_BLOCK_ROWS = 4096  # Rows of an analytic coast phase generated at a time when streaming steps
+
+# State of the rocket after a step, as yielded by Simulator.iter_steps, in the same order as the flight data keys
+StepRecord = collections.namedtuple('StepRecord', ['time', 'altitude', 'velocity', 'acceleration', 'g_force', 'thrust', 'drag', 'fuel', 'mass', 'stage'])
+
+# State of the simulator before a step, from which a later simulation can carry on instead of starting again, see Simulator.resimulate
+# step_count is the number of rows produced before it, and state holds the values of the simulator's checkpoint_attributes
+# recorded_rows is the number of rows recorded before it, fewer than step_count in a decimated recording, and recording_state is
+# the decimator's state then, see trajectory.Decimator.get_state, or None when every row is recorded
+Checkpoint = collections.namedtuple('Checkpoint', ['step_count', 'stage', 'state', 'flight_events', 'recorded_rows', 'recording_state'])
+CUTOFF_SETTINGS = ['altitude cutoff', 'time cutoff']  # Settings that only decide when the flight ends
+
+
+class FlightCheckpoints():
+    # What Simulator.resimulate needs of a finished flight with checkpoints, without holding on to the simulator: its checkpoints,
+    # stage keys and recording tolerance, the rows recorded before its last checkpoint, and their step numbers in a decimated recording
+    def __init__(self, checkpoints, stage_keys, rows, recording_tolerance=None, steps=None):
+        self.checkpoints = checkpoints
+        self.stage_keys = stage_keys
+        self.rows = rows
+        self.recording_tolerance = recording_tolerance
+        self.steps = steps
+
+    def get_lowest_altitude(self, checkpoint):  # Lowest altitude the rows before one of the checkpoints can have reached
+        lowest_altitude = self.rows['altitude'][:checkpoint.recorded_rows].min()
+        if checkpoint.recording_state is None:
+            return lowest_altitude
+
+        # The rows left out are within the altitude tolerance of the lines joining the rows kept and the row still pending
+        pending = checkpoint.recording_state[1]
+        if pending is not None:
+            lowest_altitude = min(lowest_altitude, pending[0][self.rows.dtype.names.index('altitude')])
+        return lowest_altitude - self.recording_tolerance['altitude']
+
 
 def get_drag_coefficient(part):
     if isinstance(part, BodyTube):
@@ -14,32 +67,205 @@ def get_drag_coefficient(part):
     elif isinstance(part, Fins):
         return 0.075
 
+
+def get_drag_coefficient_area_total(parts):  # Total of all drag coefficients multiplied by their respective areas
+    total = 0
+    nose_found = False
+
+    for part in parts:
+        if check_part_type(part, [NoseCone, BodyTube]) and not nose_found:  # Only the front of the rocket is exposed to the airflow
+            nose_found = True
+            total += get_drag_coefficient(part) * math.pi * (part.diameter/2)**2
+        elif isinstance(part, Fins):
+            total += get_drag_coefficient(part) * part.width * part.thickness
+
+    return total
+
+
+def get_drag_coefficient_area_table(parts):  # get_drag_coefficient_area_total at each Mach number of the drag tables
+    total = np.zeros(drag_tables.TABLE_SIZE + 1)
+    nose_found = False
+
+    for part in parts:
+        if check_part_type(part, [NoseCone, BodyTube]) and not nose_found:
+            nose_found = True
+            total += get_drag_coefficient(part) * math.pi * (part.diameter/2)**2 * drag_tables.get_part_mach_factors(part)
+        elif isinstance(part, Fins):
+            total += get_drag_coefficient(part) * part.width * part.thickness * drag_tables.get_part_mach_factors(part)
+
+    return total
+
+
+def get_frontal_area(parts):  # Area exposed to the airflow, the same areas the drag coefficients are multiplied by
+    total = 0
+    nose_found = False
+
+    for part in parts:
+        if check_part_type(part, [NoseCone, BodyTube]) and not nose_found:
+            nose_found = True
+            total += math.pi * (part.diameter/2)**2
+        elif isinstance(part, Fins):
+            total += part.width * part.thickness
+
+    return total
+
+
+# Properties of the rocket that only change when parts are dropped, see AerodynamicCache
+AerodynamicProperties = collections.namedtuple('AerodynamicProperties', ['frontal_area', 'drag_coefficient_area_total', 'drag_coefficient_area_table', 'mass'])
+
+
+def get_aerodynamic_properties(parts):
+    mass = 0
+    for part in parts:
+        mass += part.mass
+
+    return AerodynamicProperties(get_frontal_area(parts), get_drag_coefficient_area_total(parts), get_drag_coefficient_area_table(parts), mass)
+
+
+class AerodynamicCache():
+    # Aerodynamic properties of each set of attached parts, worked out the first time the rocket flies with that set of parts
+    # so staging only has to look them up, and stepping only reads the resulting values
+    def __init__(self, rocket):
+        self.rocket = rocket
+        self.properties = {}
+
+    def get(self, part_ids):  # part_ids is a frozenset of local part ids, as in StageDescriptor
+        if part_ids not in self.properties:
+            self.properties[part_ids] = get_aerodynamic_properties([part for part in self.rocket.parts if part.local_part_id in part_ids])
+
+        return self.properties[part_ids]
+
+
+def get_parts_after_decoupling(parts, decoupler):  # Removes the decoupler and everything below it, along with their children
+    remaining_parts = list(parts)
+    reached_decoupler = False
+
+    for part in parts:
+        if check_part_type(part, [BodyTube, NoseCone, Decoupler]):
+            if part.local_part_id == decoupler.local_part_id:
+                reached_decoupler = True
+            if reached_decoupler:
+                remaining_parts = [remaining_part for remaining_part in remaining_parts if remaining_part is not part and getattr(remaining_part, 'parent_id', None) != part.local_part_id]
+
+    return remaining_parts
+
+
+class StageDescriptor(collections.namedtuple('StageDescriptor', ['part_ids', 'mass', 'engine'])):
+    # Immutable record of the rocket at a stage. part_ids are the ids of the parts still attached, mass is the total mass after
+    # staging or None if this stage does not change it, and engine is the engine ignited by this stage or None
+    __slots__ = ()
+
+    def get_rocket(self, rocket):  # Rocket made of the parts still attached at this stage, sharing the part objects of rocket
+        stage_rocket = Rocket(name=rocket.name, parts=[part for part in rocket.parts if part.local_part_id in self.part_ids], new_part_id=rocket.new_part_id)
+        stage_rocket.stages = rocket.stages
+
+        return stage_rocket
+
+
+def get_first_stage(rocket):  # Stage the rocket starts in, the first non-empty stage
+    first_stage = 0
+    while first_stage < len(rocket.stages) - 1 and len(rocket.stages[first_stage]) == 0:
+        first_stage += 1
+
+    return first_stage
+
+
+def get_stage_plan(rocket):  # Works out ahead of time what each stage does to the rocket, without any flight dynamics
+    # List of StageDescriptors indexed by stage number. The rocket starts in its first non-empty stage, so nothing in that stage
+    # or the empty stages before it is activated
+    parts = list(rocket.parts)
+    parts_to_part_ids = {part.local_part_id: part for part in rocket.parts}
+    first_stage = get_first_stage(rocket)
+
+    all_part_ids = frozenset(parts_to_part_ids)
+    stage_plan = [StageDescriptor(all_part_ids, None, None) for _ in range(min(first_stage + 1, max(len(rocket.stages), 1)))]
+
+    for stage in rocket.stages[first_stage + 1:]:
+        mass = None
+        engine = None
+        for part_id in stage:
+            part_in_stage = parts_to_part_ids.get(part_id)
+            if isinstance(part_in_stage, Decoupler):
+                parts = get_parts_after_decoupling(parts, part_in_stage)
+
+                mass = 0
+                for part in parts:
+                    mass += part.mass
+            elif isinstance(part_in_stage, Engine):
+                engine = part_in_stage
+
+        if mass is None:
+            stage_plan.append(StageDescriptor(stage_plan[-1].part_ids, mass, engine))
+        else:
+            stage_plan.append(StageDescriptor(frozenset(part.local_part_id for part in parts), mass, engine))
+
+    return stage_plan
+
+
 class Simulator():
-    def __init__(self, rocket, settings):
-        self.rocket = copy.deepcopy(rocket)
+    # integrator is 'euler' for fixed steps of the time increment, or 'adaptive' for Runge-Kutta steps with error control, which
+    # land exactly on burnout, staging, apoapsis and the altitude cutoff. With the default tolerance the adaptive integrator's
+    # apoapsis and flight time agree with the euler integrator to within 0.1% at a time increment of 0.001 s
+    # With analytic_coast, the unpowered flight after the last stage burns out is solved in closed form instead of stepped through
+    # With a recording_tolerance, as {flight data key: largest error}, only the rows needed to interpolate the flight data to within it
+    # are recorded, see trajectory.Decimator. Keys left out use trajectory.DEFAULT_RECORDING_TOLERANCE, so {} gives the defaults
+    # atmosphere is 'constant' for the air density setting at every altitude, or 'standard' for the International Standard
+    # Atmosphere, scaled so the air density setting is the density at sea level. The closed form coast phase assumes a constant
+    # density, so analytic_coast has no effect in the standard atmosphere
+    # drag_model is 'constant' for drag coefficients that do not depend on speed, or 'mach' for the drag coefficients of
+    # drag_tables, which rise through the speed of sound. analytic_coast has no effect with 'mach' drag either
+    # With a trajectory_file path, rows are written to that file as they are produced rather than kept in memory, and once the
+    # flight is over flight_data is the file opened with numpy.memmap, see trajectory.TrajectoryWriter
+    # With a checkpoint_interval, a Checkpoint is kept before every staging and every checkpoint_interval rows, so a simulation of an
+    # edited rocket can carry on from the last point the edit cannot have changed, see resimulate. Only the euler integrator
+    # recording in memory keeps checkpoints. The stage keys are worked out when the simulator is made, so they still describe the
+    # flight simulated if the rocket is edited afterwards
+    # With stats, the time taken by each phase of the flight is recorded in stats, a simulation_stats.SimulationStats, which is
+    # None otherwise
+    flight_data_dtype = FLIGHT_DATA_DTYPE
+    step_record = StepRecord
+    checkpoint_attributes = ['time', 'altitude', 'velocity', 'acceleration', 'g_force', 'thrust', 'drag', 'fuel', 'mass', 'current_stage', 'impulse_fraction',
+                             'step_count', 'apoapsis_altitude', 'last_fuel', 'last_stage']
+
+    def __init__(self, rocket, settings, integrator='euler', tolerance=1e-6, analytic_coast=False, recording_tolerance=None, atmosphere='constant', drag_model='constant', trajectory_file=None, stats=False, checkpoint_interval=None):
+        if integrator not in INTEGRATORS:
+            raise Exception(f'Invalid integrator: {integrator}')
+        if checkpoint_interval is not None and (integrator != 'euler' or trajectory_file is not None):
+            raise Exception('Checkpoints are only kept by the euler integrator recording in memory')
+        if atmosphere not in ATMOSPHERES:
+            raise Exception(f'Invalid atmosphere: {atmosphere}')
+        if drag_model not in DRAG_MODELS:
+            raise Exception(f'Invalid drag model: {drag_model}')
+
+        self.rocket = rocket  # Never modified, staging is described by the stage plan instead
 
         self.settings = settings
+        self.integrator = integrator
+        self.tolerance = tolerance
+        self.analytic_coast = analytic_coast and atmosphere == 'constant' and drag_model == 'constant'
+        self.coast_phase = None
+
+        self.atmosphere = atmosphere
+        self.atmosphere_table = get_standard_atmosphere() if atmosphere == 'standard' else None
+        self.drag_model = drag_model
+        self.stats = SimulationStats() if stats else None
 
         self.engine = None
         self.nose = None
         self.fins = []
 
-        self.drag_coefficient_area_total = 0 # Total of all drag coefficients multiplied by their respective areas
-
-        self.rocket_at_stage = []
-
         for part in self.rocket.parts:
             if isinstance(part, Engine):
                 self.engine = part
-            elif isinstance(part, NoseCone) and self.nose is None:
+            elif check_part_type(part, [NoseCone, BodyTube]) and self.nose is None:
                 self.nose = part
-                self.drag_coefficient_area_total += get_drag_coefficient(part) * math.pi * (part.diameter/2)**2
-            elif isinstance(part, BodyTube) and self.nose is None:
-                self.nose = part
-                self.drag_coefficient_area_total += get_drag_coefficient(part) * math.pi * (part.diameter/2)**2
             elif isinstance(part, Fins):
                 self.fins.append(part)
-                self.drag_coefficient_area_total += get_drag_coefficient(part) * part.width * part.thickness
+
+        self.aerodynamic_cache = AerodynamicCache(self.rocket)
+        self.frontal_area = 0
+        self.drag_coefficient_area_total = 0
+        self.drag_coefficient_area_table = None  # Over Mach number, with 'mach' drag
 
         self.time = 0
         self.altitude = 0
@@ -53,104 +279,490 @@ class Simulator():
         if self.engine == None:  # No engine found
             self.engine = Engine(mass=0, propellant_mass=0, average_thrust=0, burn_time=0)
             self.fuel = 0
+        self.launch_engine = self.engine  # Engine burning from launch, which need not be in the first stage
         
         self.thrust = self.engine.average_thrust
+        self.thrust_curve = self.engine.get_thrust_curve()  # None for constant thrust
+        self.impulse_fraction = 0  # Fraction of the thrust curve's impulse delivered so far
 
-        if len(self.rocket.stages) != 0:
-            self.current_stage = 0
-            while len(self.rocket.stages[self.current_stage]) == 0 and self.current_stage < len(self.rocket.stages):  # Increment stage until a non-empty stage is found
-                self.rocket_at_stage.append(copy.deepcopy(self.rocket))
-                self.current_stage += 1
-
-            self.max_stage = len(rocket.stages) - 1
+        if self.stats is not None:
+            self.stage_plan = self.stats.time_call('stage plan', get_stage_plan, self.rocket)
         else:
-            self.rocket_at_stage.append(copy.deepcopy(self.rocket))
-            self.max_stage = 0
+            self.stage_plan = get_stage_plan(self.rocket)
+        self.current_stage = get_first_stage(self.rocket)
+        self.max_stage = len(self.stage_plan) - 1
+        self.set_aerodynamic_properties(self.stage_plan[self.current_stage].part_ids)
+
+        self.rocket_at_stage = self.stage_plan[:self.current_stage]  # StageDescriptor for each stage reached, see get_rocket_at_stage
+        self.rockets_at_stage = {}
 
-        self.parts_to_part_ids = {}
         for part in self.rocket.parts:
             self.mass += part.mass
-            self.parts_to_part_ids.update({part.local_part_id:part})
-
-        self.flight_data = {
-            'time': [],
-            'altitude': [],
-            'velocity': [],
-            'acceleration': [],
-            'g-force': [],
-            'thrust': [],
-            'drag': [],
-            'fuel': [],
-            'mass': [],
-            'stage': []
-        }
 
+        self.record = True  # Whether steps are kept in flight_data, see iter_steps
+        self.trajectory_file = trajectory_file
+        if trajectory_file is not None:
+            self.flight_data = TrajectoryWriter(trajectory_file, self.flight_data_dtype)
+        elif recording_tolerance is None:
+            self.flight_data = Trajectory.from_settings(self.settings, self.flight_data_dtype)
+        else:
+            self.flight_data = Trajectory(self.flight_data_dtype)
+
+        self.decimator = Decimator(self.flight_data, recording_tolerance) if recording_tolerance is not None else None
+        self.step_count = 0  # Rows produced so far, whether recorded or not
+
+        # Flight events are updated as each row is produced, so they never need a scan of the flight data
         self.flight_events = {
             'propellant depletion': 0,
             'apoapsis': 0
         }
+        self.apoapsis_altitude = -math.inf
+        self.last_fuel = self.fuel
+        self.last_stage = self.current_stage
+
+        # Rows of an analytic coast phase after the stepped rows, see fast_forward_coast
+        self.coast_tail_length = 0
+        self.get_tail_rows = None
+
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = [] if checkpoint_interval is not None else None
+        self.next_checkpoint = checkpoint_interval  # Step count of the next checkpoint taken between stagings
+        self.stage_keys = [self.get_stage_key(stage) for stage in range(len(self.stage_plan))] if checkpoint_interval is not None else None
+
+        if self.stats is not None:
+            self.stats.instrument(self)
     
     def simulate(self):
-        self.rocket_at_stage.append(copy.deepcopy(self.rocket))
+        for _ in self.run():
+            pass
+
+    def iter_steps(self, record=False):  # Yields a StepRecord for every row of the flight as it is simulated
+        # Without record, no flight data is kept, so memory use does not grow with the length of the flight. The flight
+        # events are kept up to date as the steps are yielded, and the consumer can stop at any time
+        self.record = record
+        if not record:
+            self.flight_data = Trajectory(self.flight_data_dtype, capacity=1)
+            self.decimator = None
+
+        for row in self.run():
+            yield self.step_record(*row)
+
+        # Rows of an analytic coast phase are only generated here if they are asked for
+        for row in self.iter_tail_rows():
+            yield self.step_record(*row)
+
+    def iter_tail_rows(self):  # Rows of an analytic coast phase, generated a block at a time
+        for start in range(1, self.coast_tail_length + 1, TAIL_BLOCK_ROWS):
+            steps = np.arange(start, min(start + TAIL_BLOCK_ROWS, self.coast_tail_length + 1))
+            yield from self.get_tail_rows(steps).tolist()
+
+    def run(self):  # Simulates the flight, yielding each row as it is produced
+        self.rocket_at_stage.append(self.stage_plan[self.current_stage])
+
+        if self.integrator == 'adaptive':
+            yield from self.run_adaptive()
+            return None
 
         while True:
             self.step()
 
-            self.update_flight_data()
+            yield self.update_flight_data()
 
             # Cutoff logic
-            elapsed_time = len(self.flight_data['time']) * self.settings['time increment']
+            elapsed_time = self.step_count * self.settings['time increment']
 
             if self.altitude < self.settings['altitude cutoff'] or elapsed_time > self.settings['time cutoff']:
                 self.end_simulation()
                 break
 
+            if self.analytic_coast and self.check_coasting():
+                self.fast_forward_coast()
+                if self.decimator is not None:  # Decimating needs every row, so the coast phase rows are produced now rather than when read
+                    for row in self.iter_tail_rows():
+                        yield self.add_row(row)
+                    self.coast_tail_length = 0
+
+                self.end_simulation()
+                break
+
             self.time += self.settings['time increment']
-        
-        
-    
+
+            # The last row before staging, when the next step stages, and every checkpoint_interval rows
+            if self.checkpoints is not None and (self.step_count >= self.next_checkpoint or (self.fuel <= 0 and self.current_stage != self.max_stage)):
+                self.add_checkpoint()
+
+    def run_adaptive(self):
+        # Absolute tolerances for altitude, velocity, mass and fuel
+        absolute_tolerance = [self.tolerance * 1000, self.tolerance * 100, self.tolerance, self.tolerance]
+        time_tolerance = self.tolerance * 1e-3
+        h = self.settings['time increment']
+
+        if self.engine.burn_time == 0:  # Engine burns out instantly
+            self.fuel = 0
+
+        self.update_derived_state()
+        yield self.update_flight_data()
+
+        while True:
+            # Stage at burnout, passing through stages with no engine at the same instant
+            if self.fuel <= 0 and self.current_stage != self.max_stage:
+                while self.fuel <= 0 and self.current_stage != self.max_stage:
+                    self.stage()
+                    if self.fuel > 0 and self.engine.burn_time == 0:
+                        self.fuel = 0
+
+                self.update_derived_state()
+                yield self.update_flight_data()
+
+            if self.altitude < self.settings['altitude cutoff'] or self.time >= self.settings['time cutoff']:
+                break
+
+            if self.analytic_coast and self.check_coasting():
+                yield from self.fast_forward_coast_adaptive()
+                break
+
+            # Steps never cross the time cutoff or burnout, so those are landed on exactly
+            time_limit = self.settings['time cutoff']
+            if self.fuel > 0:
+                time_limit = min(time_limit, self.time + self.fuel * self.engine.burn_time)
+            h = min(h, time_limit - self.time)
+            reaches_limit = h == time_limit - self.time
+
+            y = [self.altitude, self.velocity, self.mass, self.fuel]
+            y_new, error = adaptive_integrator.dormand_prince_step(self.get_derivatives, y, h)
+            error_ratio = adaptive_integrator.get_error_ratio(y, y_new, error, self.tolerance, absolute_tolerance)
+
+            if error_ratio > 1:  # Step rejected
+                h *= adaptive_integrator.get_step_change(error_ratio)
+                continue
+
+            # Event location, an event shortens the step to end exactly on it
+            events = []
+            if y[1] > 0 and y_new[1] <= 0:  # Apoapsis
+                get_velocity = lambda s: adaptive_integrator.dormand_prince_step(self.get_derivatives, y, s)[0][1]
+                events.append((adaptive_integrator.locate_event(get_velocity, h, y[1], y_new[1], time_tolerance), 'apoapsis'))
+            if y_new[0] < self.settings['altitude cutoff']:
+                get_altitude = lambda s: adaptive_integrator.dormand_prince_step(self.get_derivatives, y, s)[0][0] - self.settings['altitude cutoff']
+                events.append((adaptive_integrator.locate_event(get_altitude, h, y[0] - self.settings['altitude cutoff'], y_new[0] - self.settings['altitude cutoff'], time_tolerance), 'altitude cutoff'))
+
+            step_change = adaptive_integrator.get_step_change(error_ratio)
+            reached_cutoff = False
+            if len(events) > 0:
+                event_h, event = min(events)
+                if event_h < h:
+                    y_new = adaptive_integrator.dormand_prince_step(self.get_derivatives, y, event_h)[0]
+                    h = event_h
+                    reaches_limit = False
+                reached_cutoff = event == 'altitude cutoff'
+
+            self.altitude, self.velocity, self.mass, self.fuel = y_new
+            if reaches_limit:
+                self.time = time_limit
+                if self.time != self.settings['time cutoff']:  # Burnout
+                    self.fuel = 0
+            else:
+                self.time += h
+
+            self.update_derived_state()
+            yield self.update_flight_data()
+
+            if reached_cutoff:
+                break
+
+            h = max(h, self.settings['time increment'] * 1e-6) * step_change
+
+        self.end_simulation()
+
+    def add_checkpoint(self):
+        state = {name: getattr(self, name) for name in self.checkpoint_attributes}
+        for name, value in state.items():
+            if isinstance(value, np.ndarray):
+                state[name] = value.copy()
+
+        recording_state = self.decimator.get_state() if self.decimator is not None else None
+        self.checkpoints.append(Checkpoint(self.step_count, self.current_stage, state, dict(self.flight_events), self.flight_data.length, recording_state))
+        self.next_checkpoint = self.step_count + self.checkpoint_interval
+
+    def get_flight_options(self):  # Options every part of the flight depends on, leaving out the cutoffs
+        settings = {setting: value for setting, value in self.settings.items() if setting not in CUTOFF_SETTINGS}
+        return [settings, self.integrator, self.analytic_coast, self.atmosphere, self.drag_model, self.flight_data_dtype]
+
+    def get_stage_key(self, stage):  # Everything the flight depends on until it leaves a stage, apart from the cutoffs
+        # Two simulators with equal keys for a stage fly identically until the end of that stage, as long as neither reaches a cutoff
+        if stage >= len(self.stage_plan):
+            return None
+
+        launch_mass = 0
+        for part in self.rocket.parts:
+            launch_mass += part.mass
+        launch_fuel = any(part is self.launch_engine for part in self.rocket.parts)
+
+        key = [self.get_flight_options(), launch_mass, launch_fuel, self.launch_engine.get_fields(), get_first_stage(self.rocket), stage == self.max_stage]
+        for number, descriptor in enumerate(self.stage_plan[:stage + 1]):
+            properties = self.aerodynamic_cache.get(descriptor.part_ids)
+            table = properties.drag_coefficient_area_table.tolist() if self.drag_model == 'mach' else None
+            empty = len(self.rocket.stages[number]) == 0 if number < len(self.rocket.stages) else None
+            engine = descriptor.engine.get_fields() if descriptor.engine is not None else None
+            key.append([empty, descriptor.mass, properties.frontal_area, properties.drag_coefficient_area_total, table, engine])
+
+        return key
+
+    def get_recording_tolerance(self):  # None when every row is recorded
+        return self.decimator.tolerance if self.decimator is not None else None
+
+    def get_flight_checkpoints(self):  # FlightCheckpoints of this finished flight, or None if it kept no checkpoints
+        if not self.record or not self.checkpoints:
+            return None
+
+        recorded_rows = self.checkpoints[-1].recorded_rows
+        steps = self.decimator.steps[:recorded_rows] if self.decimator is not None else None
+        return FlightCheckpoints(self.checkpoints, self.stage_keys, self.flight_data.data[:recorded_rows], self.get_recording_tolerance(), steps)
+
+    def get_resume_checkpoint(self, previous):  # Latest checkpoint of previous, a FlightCheckpoints, this flight is certain to share the rows before, or None
+        if self.integrator != 'euler' or self.trajectory_file is not None:
+            return None
+        if self.get_recording_tolerance() != previous.recording_tolerance:
+            return None
+
+        shared_stages = {}  # Whether each stage is flown the same by both
+        for checkpoint in reversed(previous.checkpoints):
+            # The rows before the checkpoint must not reach either cutoff, which are checked after every row
+            if checkpoint.step_count * self.settings['time increment'] > self.settings['time cutoff']:
+                continue
+            if checkpoint.step_count > 0 and previous.get_lowest_altitude(checkpoint) < self.settings['altitude cutoff']:
+                continue
+
+            if checkpoint.stage not in shared_stages:
+                stage_key = self.get_stage_key(checkpoint.stage)
+                shared_stages[checkpoint.stage] = stage_key is not None and stage_key == previous.stage_keys[checkpoint.stage]
+            if shared_stages[checkpoint.stage]:
+                return checkpoint
+
+        return None
+
+    def resimulate(self, previous):  # As simulate, carrying on from a checkpoint of previous, the FlightCheckpoints or finished simulator of an earlier version of the flight
+        # Returns the number of steps taken from previous rather than simulated again, 0 if the flight had to be simulated from the start
+        if isinstance(previous, Simulator):
+            previous = previous.get_flight_checkpoints()
+        checkpoint = self.get_resume_checkpoint(previous) if previous is not None else None
+        if checkpoint is None:
+            self.simulate()
+            return 0
+
+        for name, value in checkpoint.state.items():
+            setattr(self, name, value.copy() if isinstance(value, np.ndarray) else value)
+        self.flight_events = dict(checkpoint.flight_events)
+
+        # The engine and the attached parts of the stage, which are this rocket's own parts
+        for descriptor in reversed(self.stage_plan[:checkpoint.stage + 1]):
+            if descriptor.engine is not None:
+                self.engine = descriptor.engine
+                break
+        self.thrust_curve = self.engine.get_thrust_curve()
+        self.set_aerodynamic_properties(self.stage_plan[checkpoint.stage].part_ids)
+        self.rocket_at_stage = list(self.stage_plan[:checkpoint.stage])
+
+        self.flight_data.extend(previous.rows[:checkpoint.recorded_rows])
+        if self.decimator is not None:
+            self.decimator.set_state(checkpoint.recording_state, previous.steps[:checkpoint.recorded_rows])
+        if self.checkpoints is not None:
+            self.checkpoints = [earlier for earlier in previous.checkpoints if earlier.step_count <= checkpoint.step_count]
+            self.next_checkpoint = checkpoint.step_count + self.checkpoint_interval
+
+        for _ in self.run():
+            pass
+
+        return checkpoint.step_count
+
+    def check_coasting(self):  # True once nothing can change the thrust or mass for the rest of the flight
+        return self.fuel <= 0 and self.current_stage == self.max_stage and self.mass > 0
+
+    def start_coast_phase(self):
+        self.coast_phase = CoastPhase(self.altitude, self.velocity, self.mass, self.settings['gravity acc'], self.settings['air density'], self.drag_coefficient_area_total)
+
+    def fast_forward_coast(self):  # Euler integrator, the rest of the flight is added as rows at each time increment that are generated when first read
+        self.start_coast_phase()
+
+        time_increment = self.settings['time increment']
+        recorded_length = self.step_count
+
+        # Number of rows to add, stopping the same way as the stepping loop
+        time_cutoff_rows = max(int(self.settings['time cutoff'] / time_increment) - recorded_length, 1)
+        while (recorded_length + time_cutoff_rows) * time_increment <= self.settings['time cutoff']:
+            time_cutoff_rows += 1
+        while time_cutoff_rows > 1 and (recorded_length + time_cutoff_rows - 1) * time_increment > self.settings['time cutoff']:
+            time_cutoff_rows -= 1
+
+        cutoff_time = self.coast_phase.get_time_at_altitude(self.settings['altitude cutoff'])
+        altitude_cutoff_rows = min(max(int(cutoff_time / time_increment), 1), time_cutoff_rows)
+        while altitude_cutoff_rows < time_cutoff_rows and self.coast_phase.get_state(altitude_cutoff_rows * time_increment)[0] >= self.settings['altitude cutoff']:
+            altitude_cutoff_rows += 1
+        while altitude_cutoff_rows > 1 and self.coast_phase.get_state((altitude_cutoff_rows - 1) * time_increment)[0] < self.settings['altitude cutoff']:
+            altitude_cutoff_rows -= 1
+
+        tail_length = min(time_cutoff_rows, altitude_cutoff_rows)
+        start_time = self.time
+        self.coast_tail_length = tail_length
+        self.get_tail_rows = lambda steps: self.get_coast_rows(start_time + steps * time_increment, steps * time_increment)
+        if self.record and self.decimator is None:
+            self.flight_data.set_tail(tail_length, self.get_tail_rows)
+
+        last_row = self.get_coast_rows(np.array([start_time + tail_length * time_increment]), np.array([tail_length * time_increment]))[0]
+        self.time, self.altitude, self.velocity, self.acceleration, self.g_force, self.thrust, self.drag = [float(last_row[key]) for key in ['time', 'altitude', 'velocity', 'acceleration', 'g-force', 'thrust', 'drag']]
+
+    def fast_forward_coast_adaptive(self):  # Adaptive integrator, the flight jumps straight to apoapsis and then the end of the flight
+        self.start_coast_phase()
+
+        start_time = self.time
+        end_time = min(start_time + self.coast_phase.get_time_at_altitude(self.settings['altitude cutoff']), self.settings['time cutoff'])
+
+        coast_times = [end_time - start_time]
+        if 0 < self.coast_phase.apoapsis_time < end_time - start_time:
+            coast_times.insert(0, self.coast_phase.apoapsis_time)
+
+        for row in self.get_coast_rows(start_time + np.array(coast_times), np.array(coast_times)):
+            self.time, self.altitude, self.velocity, self.acceleration, self.g_force, self.thrust, self.drag = [float(row[key]) for key in ['time', 'altitude', 'velocity', 'acceleration', 'g-force', 'thrust', 'drag']]
+            yield self.update_flight_data()
+
+    def get_coast_rows(self, times, coast_times):  # Flight data rows at the given times, coast_times being the same times measured from the start of the coast phase
+        rows = np.empty(len(times), dtype=self.flight_data.dtype)
+        altitude, velocity = self.coast_phase.get_state(coast_times)
+        drag = self.coast_phase.get_drag(velocity)
+        acceleration = drag / self.mass - self.settings['gravity acc']
+
+        rows['time'] = times
+        rows['altitude'] = altitude
+        rows['velocity'] = velocity
+        rows['acceleration'] = acceleration
+        rows['g-force'] = acceleration / self.settings['gravity acc']
+        rows['thrust'] = 0
+        rows['drag'] = drag
+        rows['fuel'] = 0
+        rows['mass'] = self.mass
+        rows['stage'] = self.current_stage
+
+        return rows
+
+    def get_derivatives(self, y):  # Rates of change of altitude, velocity, mass and fuel for the adaptive integrator
+        altitude, velocity, mass, fuel = y
+
+        if self.fuel > 0:  # Steps end at burnout, so the engine burns for the whole step
+            thrust_fraction = self.get_thrust_fraction(fuel)
+            thrust = self.engine.average_thrust * thrust_fraction
+            fuel_rate = -1 / self.engine.burn_time
+        else:
+            thrust_fraction = 0
+            thrust = 0
+            fuel_rate = 0
+
+        acceleration = self.get_acceleration(thrust, self.get_drag(velocity, altitude), mass)
+
+        return [velocity, acceleration, fuel_rate * thrust_fraction * self.engine.propellant_mass, fuel_rate]
+
+    def get_thrust_fraction(self, fuel):  # Thrust as a fraction of the average thrust with fuel left, propellant is burnt at the same rate
+        if self.thrust_curve is None:
+            return 1
+
+        return self.thrust_curve.get_thrust_fraction(1 - fuel)
+
+    def update_derived_state(self):  # Thrust, drag, acceleration and g-force for the current state
+        if self.fuel > 0:
+            self.thrust = self.engine.average_thrust * self.get_thrust_fraction(self.fuel)
+        else:
+            self.thrust = 0
+
+        self.drag = self.get_drag(self.velocity, self.altitude)
+        self.acceleration = self.get_acceleration(self.thrust, self.drag, self.mass)
+        self.g_force = self.acceleration / self.settings['gravity acc']
+
+    def get_drag(self, velocity, altitude):
+        air_density = self.settings['air density']
+        if self.atmosphere_table is not None:
+            air_density *= self.atmosphere_table.get_density_ratio(altitude)
+
+        drag_coefficient_area_total = self.drag_coefficient_area_total
+        if self.drag_coefficient_area_table is not None:
+            drag_coefficient_area_total = get_table_value(self.drag_coefficient_area_table, 0, drag_tables.TABLE_SPACING, drag_tables.TABLE_SIZE, abs(velocity) / self.get_speed_of_sound(altitude))
+
+        if velocity >= 0:
+            return 0.5 * air_density * velocity**2 * drag_coefficient_area_total * -1
+        else:
+            return 0.5 * air_density * velocity**2 * drag_coefficient_area_total
+
+    def get_speed_of_sound(self, altitude):
+        if self.atmosphere_table is not None:
+            return self.atmosphere_table.get_speed_of_sound(altitude)
+
+        return SEA_LEVEL_SPEED_OF_SOUND
+
+    def get_acceleration(self, thrust, drag, mass):
+        if mass != 0:
+            return (thrust + drag) / mass - self.settings['gravity acc']
+        else:
+            return LARGE_NUMBER
+
     def end_simulation(self):
-        apoapsis_altitude = max(self.flight_data['altitude'])
-        self.flight_events['apoapsis'] = self.flight_data['altitude'].index(apoapsis_altitude)
+        if self.decimator is not None:
+            self.decimator.finish()
+
+            # Event rows are always kept, so the events are moved from step numbers to the kept rows
+            self.flight_events = {event: self.decimator.get_row(step) for event, step in self.flight_events.items()}
+        else:
+            self.flight_data.trim()
+
+        # The coast phase rows have not been produced yet, so apoapsis is checked for among them directly
+        if self.coast_tail_length > 0 and self.coast_phase.apoapsis_time > 0:
+            time_increment = self.settings['time increment']
+            apoapsis_row = int(self.coast_phase.apoapsis_time / time_increment)
+            candidate_rows = np.clip(np.array([apoapsis_row, apoapsis_row + 1]), 1, self.coast_tail_length)
+            candidate_altitudes = self.coast_phase.get_state(candidate_rows * time_increment)[0]
+            if candidate_altitudes.max() > self.apoapsis_altitude:
+                self.flight_events['apoapsis'] = self.step_count - 1 + int(candidate_rows[np.argmax(candidate_altitudes)])
+
+        if isinstance(self.flight_data, TrajectoryWriter):  # The file is complete, so it is opened for reading in its place
+            self.flight_data = self.flight_data.close(self.flight_events, self.settings['time increment'])
+
+    def load_results(self, flight_data, flight_events):  # Takes the results of an identical earlier simulation instead of simulating
+        self.flight_data = flight_data
+        self.flight_events = dict(flight_events)
+
+        if len(flight_data['stage']) > 0:
+            self.current_stage = int(flight_data['stage'][-1])
+        self.rocket_at_stage = list(self.stage_plan[:self.current_stage + 1])
 
-        for step, fuel in enumerate(self.flight_data['fuel']):
-            if fuel == 0 and self.flight_data['fuel'][step-1] != 0:
-                self.flight_events['propellant depletion']
-        
     def stage(self):
         if self.current_stage != self.max_stage:
             self.current_stage += 1
-            while len(self.rocket.stages[self.current_stage]) == 0:  # Increment stage until a non-empty stage is found
-                self.rocket_at_stage.append(copy.deepcopy(self.rocket))
+            while len(self.rocket.stages[self.current_stage]) == 0 and self.current_stage != self.max_stage:  # Increment stage until a non-empty stage is found
+                self.rocket_at_stage.append(self.stage_plan[self.current_stage])
                 self.current_stage += 1
-            
-            for part_id in self.rocket.stages[self.current_stage]:  # Check for decouplers first, then engines
-                part_in_stage = self.parts_to_part_ids[part_id]
-                if isinstance(part_in_stage, Decoupler):
-                    reached_decoupler = False
-                    for part in copy.deepcopy(self.rocket.parts):  # Iterate through a new copy of parts so items are not skipped when an item is deleted
-                        if check_part_type(part, [BodyTube, NoseCone, Decoupler]):
-                            if part.local_part_id == part_in_stage.local_part_id:
-                                reached_decoupler = True
-                            if reached_decoupler:  # Once the decoupler is found, we delete it and everything after it
-                                # Delete part and children
-                                children = get_children(part, self.rocket)
-                                self.rocket.parts.remove(self.rocket.get_part_with_part_id(part.local_part_id))
-
-                                for child in children:
-                                    self.rocket.parts.remove(child)
-                    
-                    self.mass = 0
-                    for part in self.rocket.parts:
-                        self.mass += part.mass
-            
-            for part_id in self.rocket.stages[self.current_stage]:
-                if isinstance(part_in_stage, Engine):
-                    self.engine = part_in_stage
-                    self.fuel = 1
-                    self.thrust = self.engine.average_thrust
-
-            self.rocket_at_stage.append(copy.deepcopy(self.rocket))
+
+            stage = self.stage_plan[self.current_stage]
+            if stage.mass is not None:  # Decoupled
+                self.mass = stage.mass
+                self.set_aerodynamic_properties(stage.part_ids)
+
+            if stage.engine is not None:
+                self.engine = stage.engine
+                self.thrust_curve = self.engine.get_thrust_curve()
+                self.impulse_fraction = 0
+                self.fuel = 1
+                self.thrust = self.engine.average_thrust
+
+            self.rocket_at_stage.append(stage)
+
+    def set_aerodynamic_properties(self, part_ids):  # Drag of the parts still attached, used by every step until the next decoupling
+        properties = self.aerodynamic_cache.get(part_ids)
+        self.frontal_area = properties.frontal_area
+        self.drag_coefficient_area_total = properties.drag_coefficient_area_total
+        if self.drag_model == 'mach':
+            self.drag_coefficient_area_table = properties.drag_coefficient_area_table.tolist()
+
+    def get_rocket_at_stage(self, stage):  # Rocket with only the parts attached at a stage that has been reached, for rendering
+        if stage not in self.rockets_at_stage:
+            self.rockets_at_stage[stage] = self.rocket_at_stage[stage].get_rocket(self.rocket)
+
+        return self.rockets_at_stage[stage]
     
     def step(self):
         self.thrust = 0
@@ -161,10 +773,13 @@ class Simulator():
                 fuel_decrease = LARGE_NUMBER  # Large number to represent dividing by zero
 
             if self.fuel < fuel_decrease and self.fuel > 0:  # Engine burning partway during the time step
-                self.thrust = self.engine.average_thrust * self.fuel/fuel_decrease
-                self.fuel = 0
+                if self.thrust_curve is not None:
+                    self.burn_thrust_curve(0)
+                else:
+                    self.thrust = self.engine.average_thrust * self.fuel/fuel_decrease
+                    self.fuel = 0
 
-                self.mass -= self.fuel * self.engine.propellant_mass
+                    self.mass -= self.fuel * self.engine.propellant_mass
 
             elif self.fuel <= 0:  # Engine not burning at all during the time step
                 self.thrust = 0
@@ -172,35 +787,64 @@ class Simulator():
 
                 self.stage()
 
+            elif self.thrust_curve is not None:  # Engine burning all the way during the time step, following its thrust curve
+                self.burn_thrust_curve(self.fuel - fuel_decrease)
+
             else:  # Engine burning all the way during the time step
                 self.thrust = self.engine.average_thrust
                 self.fuel -= fuel_decrease
 
                 self.mass -= fuel_decrease * self.engine.propellant_mass
 
-        if self.velocity >= 0:
-            self.drag = 0.5 * self.settings['air density'] * self.velocity**2 * self.drag_coefficient_area_total * -1
-        else:
-            self.drag = 0.5 * self.settings['air density'] * self.velocity**2 * self.drag_coefficient_area_total
+        self.move()
 
-        if self.mass != 0:
-            self.acceleration = (self.thrust + self.drag) / self.mass - self.settings['gravity acc']
-        else:
-            self.acceleration = LARGE_NUMBER
+    def move(self):  # Moves the rocket through a time increment under the thrust worked out by step
+        self.drag = self.get_drag(self.velocity, self.altitude)
+        self.acceleration = self.get_acceleration(self.thrust, self.drag, self.mass)
 
         self.velocity += self.acceleration * self.settings['time increment']
         self.altitude += self.velocity * self.settings['time increment']
 
         self.g_force = self.acceleration / self.settings['gravity acc']
 
-    def update_flight_data(self):
-        self.flight_data['time'].append(self.time)
-        self.flight_data['altitude'].append(self.altitude)
-        self.flight_data['velocity'].append(self.velocity)
-        self.flight_data['acceleration'].append(self.acceleration)
-        self.flight_data['g-force'].append(self.g_force)
-        self.flight_data['thrust'].append(self.thrust)
-        self.flight_data['drag'].append(self.drag)
-        self.flight_data['fuel'].append(self.fuel)
-        self.flight_data['mass'].append(self.mass)
-        self.flight_data['stage'].append(self.current_stage)
+    def burn_thrust_curve(self, fuel):  # Average thrust and propellant burnt over a step that leaves fuel left, from the impulse the curve delivers
+        new_impulse_fraction = self.thrust_curve.get_impulse_fraction(1 - fuel)
+        impulse_fraction = new_impulse_fraction - self.impulse_fraction
+        self.impulse_fraction = new_impulse_fraction
+        self.fuel = fuel
+
+        self.thrust = self.engine.average_thrust * self.engine.burn_time * impulse_fraction / self.settings['time increment']
+        self.mass -= impulse_fraction * self.engine.propellant_mass
+
+    def update_flight_data(self):  # Produces a row for the current state, returning it
+        return self.add_row((self.time, self.altitude, self.velocity, self.acceleration, self.g_force, self.thrust, self.drag, self.fuel, self.mass, self.current_stage))
+
+    def add_row(self, row):  # Records a row, updating the flight events, and returns it
+        altitude = row[1]
+        fuel = row[7]
+        stage = row[9]
+        step_count = self.step_count
+
+        # Rows a decimated recording has to keep: burnout, both sides of staging, and apoapsis, which is only known a row later
+        keep = stage != self.last_stage
+        keep_previous = keep
+
+        if altitude > self.apoapsis_altitude:
+            self.apoapsis_altitude = altitude
+            self.flight_events['apoapsis'] = step_count
+        elif self.flight_events['apoapsis'] == step_count - 1:
+            keep_previous = True
+        if fuel == 0 and self.last_fuel != 0 and step_count > 0:
+            self.flight_events['propellant depletion'] = step_count
+            keep = True
+        self.last_fuel = fuel
+        self.last_stage = stage
+
+        if self.record:
+            if self.decimator is None:
+                self.flight_data.append(row)
+            else:
+                self.decimator.add(row, step_count, keep, keep_previous)
+        self.step_count = step_count + 1
+
+        return row
@@ -0,0 +1,248 @@
+import argparse
+import csv
+import json
+import sys
+
+import db_controller
+import rocket_simulator
+import simulation_cache
+import planar
+from flight_summary import get_crossing_times
+from trajectory import DEFAULT_RECORDING_TOLERANCE, FLIGHT_DATA_DTYPE, check_recording_tolerance, write_trajectory
+from part_model import *
+
+# Headless entry point, which never imports pygame or matplotlib
+# Rockets come from the database by name, or from a JSON spec of the form
+# {"name": ..., "parts": [{"type": "BodyTube", "local_part_id": 0, ...}, ...], "stages": [[part ids], ...]}
+
+PART_TYPES = {part.__name__: part for part in ROCKET_PARTS}
+OUTPUT_FORMATS = ['csv', 'json', 'events']
+
+
+def rocket_from_spec(spec):
+    rocket = Rocket(name=spec.get('name', 'New Rocket'), parts=[], new_part_id=0)
+
+    for part_spec in spec['parts']:
+        part_spec = dict(part_spec)
+        part_type = part_spec.pop('type', None)
+        if part_type not in PART_TYPES:
+            raise Exception(f'Invalid part type: {part_type}')
+
+        mass = part_spec.get('mass')
+        part = PART_TYPES[part_type](**part_spec)
+        if mass is not None:  # Body tubes and nose cones work out their own mass, which a spec can override
+            part.mass = mass
+
+        rocket.parts.append(part)
+
+    part_ids = [part.local_part_id for part in rocket.parts]
+    if None in part_ids or len(set(part_ids)) != len(part_ids):
+        raise Exception('Every part needs a unique local_part_id')
+
+    rocket.new_part_id = spec.get('new_part_id', max(part_ids + [-1]) + 1)
+    rocket.stages = [list(stage) for stage in spec.get('stages', [])]
+
+    return rocket
+
+
+def get_rocket_spec(rocket):  # Inverse of rocket_from_spec, with the attributes the database saves
+    parts = []
+    for part in rocket.parts:
+        part_spec = {'type': part.__class__.__name__}
+        part_spec.update(part.get_fields())
+        parts.append(part_spec)
+
+    return {'name': rocket.name, 'parts': parts, 'stages': rocket.stages}
+
+
+def load_rocket(name):  # Reads the database without changing it, unless it was saved by an older version and needs bringing up to date
+    status = db_controller.get_db_status()
+    if status in ['missing', 'empty']:
+        raise Exception(f'No saved rocket called {name}, {db_controller.DATABASE} has no saved rockets')
+    if status == 'outdated':
+        db_controller.init_db()
+
+    if not db_controller.check_rocket_exists(name):
+        raise Exception(f'No saved rocket called {name}')
+
+    return db_controller.get_rocket(name)
+
+
+def load_thrust_curve(rocket, text):  # Loads the RASP .eng file given as PART_ID=FILE into that engine of the rocket
+    try:
+        part_id, path = text.split('=', 1)
+        part = rocket.get_part_with_part_id(int(part_id))
+    except ValueError:
+        raise Exception(f'Invalid thrust curve {text}, expected PART_ID=FILE')
+
+    if not isinstance(part, Engine):
+        raise Exception(f'No engine with part id {part_id}')
+
+    with open(path) as eng_file:
+        part.load_eng(eng_file.read())
+
+
+def write_csv(output, simulator, crossing_times):
+    flight_data = simulator.flight_data
+
+    for event, step in simulator.flight_events.items():
+        output.write(f'# {event}: {step}\n')
+    for altitude, times in crossing_times.items():
+        output.write(f'# crossing {altitude}: {", ".join(str(time) for time in times)}\n')
+
+    writer = csv.writer(output)
+    writer.writerow(list(flight_data))
+    writer.writerows(flight_data.get_rows().tolist())
+
+
+def get_results(simulator, crossing_times):  # crossing_times is {altitude: [times the rocket passes through it]}, left out if empty
+    results = {
+        'rocket': simulator.rocket.name,
+        'settings': simulator.settings,
+        'flight events': {event: {'step': step, 'time': float(simulator.flight_data['time'][step])} for event, step in simulator.flight_events.items()}
+    }
+    if crossing_times:
+        results['altitude crossings'] = crossing_times
+
+    return results
+
+
+def write_json(output, simulator, crossing_times):
+    results = get_results(simulator, crossing_times)
+    results['flight data'] = {key: simulator.flight_data[key].tolist() for key in simulator.flight_data}
+
+    json.dump(results, output)
+    output.write('\n')
+
+
+def write_events(output, simulator, crossing_times):
+    json.dump(get_results(simulator, crossing_times), output, indent=4)
+    output.write('\n')
+
+
+def parse_recording_tolerance(texts):  # {flight data key: tolerance} from KEY=VALUE texts
+    recording_tolerance = {}
+    for text in texts:
+        try:
+            key, value = text.split('=', 1)
+            recording_tolerance[key] = float(value)
+        except ValueError:
+            raise Exception(f'Invalid recording tolerance {text}, expected KEY=VALUE')
+
+    return recording_tolerance
+
+
+def parse_wind(texts):  # WindProfile from SPEED or ALTITUDE=SPEED texts, a single SPEED being the wind at every altitude
+    points = []
+    for text in texts:
+        try:
+            if '=' in text:
+                altitude, speed = text.split('=', 1)
+            else:
+                altitude, speed = 0, text
+            points.append((float(altitude), float(speed)))
+        except ValueError:
+            raise Exception(f'Invalid wind {text}, expected SPEED or ALTITUDE=SPEED')
+
+    points.sort()
+    return planar.WindProfile([altitude for altitude, _ in points], [speed for _, speed in points])
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Simulate a rocket without the graphical interface')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('rocket', nargs='?', help='name of a rocket saved in the database')
+    source.add_argument('--spec', help='JSON file describing the rocket, - for stdin')
+    parser.add_argument('-o', '--output', help='file to write to, stdout by default')
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS, default='csv', help='csv or json trajectory with the flight events, or only the events')
+    parser.add_argument('--export-spec', action='store_true', help='write the JSON spec of the rocket instead of simulating it')
+    parser.add_argument('--thrust-curve', action='append', default=[], metavar='PART_ID=FILE', help='give an engine the thrust curve, dimensions and masses of a motor from a RASP .eng file')
+    parser.add_argument('--integrator', choices=rocket_simulator.INTEGRATORS, default='euler')
+    parser.add_argument('--tolerance', type=float, default=1e-6, help='relative tolerance of the adaptive integrator')
+    parser.add_argument('--analytic-coast', action='store_true', help='solve the unpowered part of the flight in closed form, with a constant atmosphere')
+    parser.add_argument('--atmosphere', choices=rocket_simulator.ATMOSPHERES, default='constant', help='constant air density, or the standard atmosphere scaled to the air density at sea level')
+    parser.add_argument('--drag-model', choices=rocket_simulator.DRAG_MODELS, default='constant', help='constant drag coefficients, or drag coefficients that rise through the speed of sound')
+    parser.add_argument('--cache', action='store_true', help='reuse the results of an identical earlier simulation')
+    parser.add_argument('--trajectory-file', metavar='FILE', help='also write the flight data to a binary trajectory file as it is simulated, which can be opened with numpy.memmap')
+    parser.add_argument('--planar', action='store_true', help='fly in the vertical plane of the launch rail, adding the downrange distance and flight path angle')
+    parser.add_argument('--launch-angle', type=float, default=0, help='launch rail angle from vertical in degrees, tilted downrange, implies --planar')
+    parser.add_argument('--rail-length', type=float, default=planar.DEFAULT_RAIL_LENGTH, help='length of the launch rail in m, implies --planar')
+    parser.add_argument('--wind', action='append', default=[], metavar='[ALTITUDE=]SPEED', help='horizontal wind in m/s blowing downrange, at an altitude in m or every altitude, implies --planar')
+    parser.add_argument('--stats', action='store_true', help='write the calls and time taken by each phase of the simulation to stderr')
+    parser.add_argument('--decimate', action='store_true', help='record only the rows needed to interpolate the flight data to within the recording tolerances')
+    parser.add_argument('--crossing', action='append', type=float, default=[], metavar='ALTITUDE', help='also give the times the rocket passes through an altitude in m, with the flight events')
+    parser.add_argument('--recording-tolerance', action='append', default=[], metavar='KEY=VALUE', help='largest interpolation error allowed in a flight data channel, implies --decimate')
+    for setting, value in rocket_simulator.DEFAULT_SETTINGS.items():
+        parser.add_argument('--' + setting.replace(' ', '-'), type=float, default=value, dest=setting, metavar=setting.upper().replace(' ', '_'))
+    args = parser.parse_args(args)
+
+    settings = {setting: getattr(args, setting) for setting in rocket_simulator.DEFAULT_SETTINGS}
+
+    options = {'integrator': args.integrator, 'tolerance': args.tolerance, 'analytic_coast': args.analytic_coast, 'atmosphere': args.atmosphere, 'drag_model': args.drag_model}
+    is_planar = args.planar or args.launch_angle != 0 or args.rail_length != planar.DEFAULT_RAIL_LENGTH or len(args.wind) > 0
+
+    if args.stats:
+        options['stats'] = True
+
+    try:
+        if args.stats and args.cache:
+            raise Exception('--stats cannot be used with --cache')
+        if is_planar:
+            if args.cache:
+                raise Exception('--cache cannot be used with a planar simulation')
+            planar_options = {'launch_angle': args.launch_angle, 'rail_length': args.rail_length, 'wind': parse_wind(args.wind) if len(args.wind) > 0 else None}
+            planar.get_launch_direction(args.launch_angle)
+
+        if args.decimate or len(args.recording_tolerance) > 0:
+            recording_tolerance = parse_recording_tolerance(args.recording_tolerance)
+            check_recording_tolerance(recording_tolerance, planar.PLANAR_FLIGHT_DATA_DTYPE if is_planar else FLIGHT_DATA_DTYPE)
+            options['recording_tolerance'] = dict(DEFAULT_RECORDING_TOLERANCE, **recording_tolerance)
+        if args.spec is not None:
+            if args.spec == '-':
+                rocket = rocket_from_spec(json.load(sys.stdin))
+            else:
+                with open(args.spec) as spec_file:
+                    rocket = rocket_from_spec(json.load(spec_file))
+        else:
+            rocket = load_rocket(args.rocket)
+
+        for text in args.thrust_curve:
+            load_thrust_curve(rocket, text)
+    except Exception as error:
+        parser.error(str(error))
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        if args.export_spec:
+            json.dump(get_rocket_spec(rocket), output, indent=4)
+            output.write('\n')
+            return None
+
+        if is_planar:
+            simulator = planar.PlanarSimulator(rocket, settings, trajectory_file=args.trajectory_file, **planar_options, **options)
+            simulator.simulate()
+        elif args.cache:
+            simulator = simulation_cache.get_simulator(rocket, settings, **options)
+            if args.trajectory_file is not None:
+                write_trajectory(args.trajectory_file, simulator.flight_data, simulator.flight_events, settings['time increment'])
+        else:
+            simulator = rocket_simulator.Simulator(rocket, settings, trajectory_file=args.trajectory_file, **options)
+            simulator.simulate()
+
+        if args.stats:
+            sys.stderr.write(simulator.stats.format())
+
+        crossing_times = get_crossing_times(simulator.flight_data, args.crossing)
+        if args.format == 'csv':
+            write_csv(output, simulator, crossing_times)
+        elif args.format == 'json':
+            write_json(output, simulator, crossing_times)
+        else:
+            write_events(output, simulator, crossing_times)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
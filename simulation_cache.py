@@ -0,0 +1,288 @@
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import rocket_simulator
+from trajectory import FLIGHT_DATA_DTYPE, Trajectory, MappedTrajectory, get_expected_length
+
+CACHE_DATABASE = 'simulation_cache.db'
+CACHE_VERSION = 2  # Part of every key, increase it whenever a change to the simulator changes its results
+DEFAULT_MEMORY_MAX_BYTES = 256 * 1024**2
+DEFAULT_DISK_MAX_BYTES = 1024**3
+TRAJECTORY_DIRECTORY = 'simulation_cache'  # Trajectory files of the disk cache
+MAPPED_MIN_ROWS = 1000000  # Flights that could last longer than this are written to trajectory files and read with numpy.memmap
+
+
+def get_key_value(value):  # JSON friendly copy of a value, floats are written exactly so equal keys mean equal inputs
+    if isinstance(value, dict):
+        return {str(key): get_key_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [get_key_value(item) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+
+    return value
+
+
+def get_part_state(part):  # The attributes of a part that are saved to the database, which are all that affect a simulation
+    return [part.__class__.__name__, get_key_value(part.get_fields())]
+
+
+def get_cache_key(rocket, settings, **options):  # Stable hash of everything a simulation result depends on, the rocket name is left out
+    content = {
+        'version': CACHE_VERSION,
+        'parts': [get_part_state(part) for part in rocket.parts],
+        'stages': get_key_value(rocket.stages),
+        'settings': get_key_value(settings),
+        'options': get_key_value(options)
+    }
+
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode()).hexdigest()
+
+
+def get_entry_size(entry):  # entry is (flight_data, results), flight_data being an array of rows, a MappedTrajectory or None
+    flight_data, results = entry
+    size = len(json.dumps(results))
+    if flight_data is not None:
+        size += flight_data.nbytes
+
+    return size
+
+
+def get_memory_size(entry):  # As get_entry_size, leaving out flight data in a trajectory file, which the memory cache only holds open
+    flight_data, results = entry
+    if isinstance(flight_data, MappedTrajectory):
+        return len(json.dumps(results))
+
+    return get_entry_size(entry)
+
+
+class MemoryCache():
+    # Least recently used entries are evicted once the entries take up more than max_bytes, see get_memory_size
+    def __init__(self, max_bytes=DEFAULT_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        if key not in self.entries:
+            return None
+
+        self.entries.move_to_end(key)
+        return self.entries[key][0]
+
+    def put(self, key, entry):
+        size = get_memory_size(entry)
+        if size > self.max_bytes:
+            return None
+
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+
+        self.entries[key] = (entry, size)
+        self.size += size
+
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+def delete_trajectory_files(results_texts):  # Deletes the trajectory files of entries, given the results column of their rows
+    for results_text in results_texts:
+        path = json.loads(results_text).get('trajectory file')
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError:  # Already deleted, or still open on a system that cannot delete open files
+                pass
+
+
+class DiskCache():
+    # Entries in an SQLite database, shared between sessions and processes. Least recently used entries are deleted once
+    # the entries take up more than max_bytes
+    # Flight data in a trajectory file is left in the file, whose path is kept with the results, and is counted in the size
+    def __init__(self, db_path=CACHE_DATABASE, max_bytes=DEFAULT_DISK_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+
+        conn = self.connect()
+        sql = """CREATE TABLE IF NOT EXISTS Results (
+                key TEXT PRIMARY KEY,
+                flight_data BLOB,
+                results TEXT,
+                size INTEGER,
+                last_used REAL
+            );"""
+        conn.execute(sql)
+        conn.commit()
+        conn.close()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)  # Waits for other processes writing to the cache
+
+    def get(self, key):
+        conn = self.connect()
+        try:
+            row = conn.execute("SELECT flight_data, results FROM Results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            results = json.loads(row[1])
+            trajectory_file = results.pop('trajectory file', None)
+            if trajectory_file is not None and not os.path.exists(trajectory_file):  # Deleted outside the cache
+                conn.execute("DELETE FROM Results WHERE key = ?", (key,))
+                conn.commit()
+                return None
+
+            conn.execute("UPDATE Results SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+        finally:
+            conn.close()
+
+        if trajectory_file is not None:
+            flight_data = MappedTrajectory(trajectory_file)
+        else:
+            flight_data = None if row[0] is None else np.frombuffer(row[0], dtype=FLIGHT_DATA_DTYPE)
+        return flight_data, results
+
+    def put(self, key, entry):
+        flight_data, results = entry
+        size = get_entry_size(entry)
+        if size > self.max_bytes:
+            if isinstance(flight_data, MappedTrajectory):
+                delete_trajectory_files([json.dumps({'trajectory file': flight_data.path})])
+            return None
+
+        if isinstance(flight_data, MappedTrajectory):
+            results = dict(results, **{'trajectory file': flight_data.path})
+            flight_data_blob = None
+        else:
+            flight_data_blob = None if flight_data is None else flight_data.tobytes()
+
+        conn = self.connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO Results VALUES (?, ?, ?, ?, ?)", (key, flight_data_blob, json.dumps(results), size, time.time()))
+
+            total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM Results").fetchone()[0]
+            if total_size > self.max_bytes:
+                evicted_size = 0
+                evicted_keys = []
+                evicted_results = []
+                for evicted_key, entry_size, evicted_results_text in conn.execute("SELECT key, size, results FROM Results ORDER BY last_used"):
+                    if total_size - evicted_size <= self.max_bytes:
+                        break
+                    evicted_keys.append((evicted_key,))
+                    evicted_results.append(evicted_results_text)
+                    evicted_size += entry_size
+                conn.executemany("DELETE FROM Results WHERE key = ?", evicted_keys)
+                delete_trajectory_files(evicted_results)
+
+            conn.commit()
+        finally:
+            conn.close()
+
+    def clear(self):
+        conn = self.connect()
+        delete_trajectory_files([results_text for (results_text,) in conn.execute("SELECT results FROM Results")])
+        conn.execute("DELETE FROM Results")
+        conn.commit()
+        conn.close()
+
+
+class SimulationCache():
+    # Looks up results in memory first, then on disk, and remembers disk hits in memory
+    # With a disk cache, flights that could last more than mapped_min_rows rows are simulated straight to trajectory files in
+    # trajectory_directory, and are opened with numpy.memmap rather than read into memory
+    def __init__(self, memory_max_bytes=DEFAULT_MEMORY_MAX_BYTES, db_path=CACHE_DATABASE, disk_max_bytes=DEFAULT_DISK_MAX_BYTES,
+                 trajectory_directory=TRAJECTORY_DIRECTORY, mapped_min_rows=MAPPED_MIN_ROWS):
+        self.memory = MemoryCache(memory_max_bytes)
+        self.disk = DiskCache(db_path, disk_max_bytes) if db_path is not None else None
+        self.trajectory_directory = trajectory_directory
+        self.mapped_min_rows = mapped_min_rows
+        self.lock = threading.Lock()  # Simulations run in the background put their results from their worker threads
+
+    def get(self, key):
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is None and self.disk is not None:
+                entry = self.disk.get(key)
+                if entry is not None:
+                    self.memory.put(key, entry)
+
+        return entry
+
+    def put(self, key, flight_data, results):
+        if isinstance(flight_data, np.ndarray):
+            flight_data = flight_data.copy()
+            flight_data.flags.writeable = False  # Shared by every simulator that gets this entry
+        entry = (flight_data, results)
+
+        with self.lock:
+            self.memory.put(key, entry)
+            if self.disk is not None:
+                self.disk.put(key, entry)
+
+    def load_results(self, key, simulator):  # Gives the simulator the cached results for key, returning whether there were any
+        entry = self.get(key)
+        if entry is None:
+            return False
+
+        flight_data, results = entry
+        if not isinstance(flight_data, MappedTrajectory):
+            flight_data = Trajectory.from_array(flight_data)
+        simulator.load_results(flight_data, results['flight events'])
+
+        return True
+
+    def put_results(self, key, simulator):  # Caches the results of a simulator that has finished simulating
+        if isinstance(simulator.flight_data, MappedTrajectory):
+            self.put(key, simulator.flight_data, {'flight events': simulator.flight_events})
+        else:
+            self.put(key, simulator.flight_data.get_rows(), {'flight events': simulator.flight_events})
+
+    def get_simulator(self, rocket, settings, **options):  # Simulator that has finished simulating, from the cache if the same flight has been simulated before
+        key = get_cache_key(rocket, settings, **options)
+
+        trajectory_file = None
+        if self.disk is not None and self.trajectory_directory is not None and get_expected_length(settings) > self.mapped_min_rows:
+            os.makedirs(self.trajectory_directory, exist_ok=True)
+            trajectory_file = os.path.join(self.trajectory_directory, key + '.traj')
+
+        simulator = rocket_simulator.Simulator(rocket, settings, trajectory_file=trajectory_file, **options)
+        if self.load_results(key, simulator):
+            return simulator
+
+        simulator.simulate()
+        self.put_results(key, simulator)
+
+        return simulator
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+default_cache = None
+
+
+def get_default_cache():  # Cache shared by everything in this process, created when first used
+    global default_cache
+    if default_cache is None:
+        default_cache = SimulationCache()
+
+    return default_cache
+
+
+def get_simulator(rocket, settings, **options):
+    return get_default_cache().get_simulator(rocket, settings, **options)
@@ -0,0 +1,107 @@
+import time
+
+# Call counts and wall time of each phase of a simulation, for finding where the time goes in a slow one
+# The phases are the simulator's methods, replaced on the instance by timed versions of themselves, so a simulator without stats
+# runs exactly the same code as before. Times are cumulative, so a phase includes the phases it calls, step including stage and
+# move for example, and run is the whole flight
+
+PHASES = ['step', 'move', 'stage', 'set_aerodynamic_properties', 'update_flight_data', 'update_derived_state', 'get_derivatives', 'fast_forward_coast', 'end_simulation']
+
+
+def get_buffer_bytes(flight_data):  # Memory held by the rows of a trajectory, or the current block of a trajectory file
+    for name in ['data', 'block']:
+        buffer = getattr(flight_data, name, None)
+        if buffer is not None:
+            return buffer.nbytes
+
+    return 0
+
+
+class SimulationStats():
+    def __init__(self):
+        self.calls = {}
+        self.times = {}  # s
+
+        self.steps = 0  # Rows produced by the stepping, which leaves out the rows of an analytic coast phase read afterwards
+        self.peak_trajectory_bytes = 0  # The flight data buffer only grows until the flight ends, so its size then is the peak
+        self.stagings = 0  # Stages passed through, including empty ones
+
+    def add(self, phase, elapsed):
+        self.calls[phase] = self.calls.get(phase, 0) + 1
+        self.times[phase] = self.times.get(phase, 0) + elapsed
+
+    def time_call(self, phase, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        self.add(phase, time.perf_counter() - start)
+
+        return result
+
+    def get_timed_method(self, phase, method):
+        def timed_method(*args):
+            start = time.perf_counter()
+            result = method(*args)
+            self.add(phase, time.perf_counter() - start)
+
+            return result
+
+        return timed_method
+
+    def get_timed_generator(self, phase, method):  # Only the time spent producing each row is counted, not the time the consumer takes
+        def timed_generator(*args):
+            generator = method(*args)
+            self.calls[phase] = self.calls.get(phase, 0) + 1
+            while True:
+                start = time.perf_counter()
+                try:
+                    row = next(generator)
+                except StopIteration:
+                    self.times[phase] = self.times.get(phase, 0) + time.perf_counter() - start
+                    return None
+                self.times[phase] = self.times.get(phase, 0) + time.perf_counter() - start
+
+                yield row
+
+        return timed_generator
+
+    def instrument(self, simulator):  # Called once the simulator is set up, so only the flight is timed
+        for phase in PHASES:
+            setattr(simulator, phase, self.get_timed_method(phase, getattr(simulator, phase)))
+        simulator.run = self.get_timed_generator('run', simulator.run)
+
+        first_stage = simulator.current_stage
+        end_simulation = simulator.end_simulation
+
+        def record_flight():
+            self.steps = simulator.step_count
+            self.peak_trajectory_bytes = max(self.peak_trajectory_bytes, get_buffer_bytes(simulator.flight_data))
+            self.stagings = simulator.current_stage - first_stage
+            end_simulation()
+
+        simulator.end_simulation = record_flight
+
+    def get_steps_per_second(self):
+        run_time = self.times.get('run', 0)
+        if run_time == 0:
+            return 0
+
+        return self.steps / run_time
+
+    def to_dict(self):
+        return {
+            'phases': {phase: {'calls': self.calls[phase], 'time': self.times[phase]} for phase in self.calls},
+            'steps': self.steps,
+            'steps per second': self.get_steps_per_second(),
+            'peak trajectory bytes': self.peak_trajectory_bytes,
+            'stagings': self.stagings
+        }
+
+    def format(self):  # Table of the phases, slowest first, followed by the totals
+        lines = [f'{"phase":<28}{"calls":>10}{"time (s)":>12}{"per call (us)":>16}']
+        for phase in sorted(self.calls, key=lambda phase: self.times[phase], reverse=True):
+            lines.append(f'{phase:<28}{self.calls[phase]:>10}{self.times[phase]:>12.4f}{self.times[phase] / self.calls[phase] * 1e6:>16.2f}')
+
+        lines.append(f'steps: {self.steps}, steps per second: {self.get_steps_per_second():.0f}')
+        lines.append(f'peak trajectory memory: {self.peak_trajectory_bytes / 1024:.1f} KiB, stagings: {self.stagings}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,234 @@
+import argparse
+import concurrent.futures
+import copy
+import csv
+import itertools
+import os
+import sys
+
+import numpy as np
+
+import db_controller
+import simulation_cache
+from batch_simulator import BatchSimulator
+from rocket_simulator import DEFAULT_SETTINGS
+from simulate import load_rocket
+from part_model import *
+
+SUMMARY_KEYS = ['apoapsis', 'max velocity', 'burnout time', 'flight time']
+DEFAULT_CHUNK_SIZE = 64  # Runs per task, each task simulates its runs together in one BatchSimulator
+MAX_CHUNKS_PER_WORKER = 2  # Tasks queued ahead per worker, so the grid is never all held in memory at once
+
+# Rocket and settings shared by every run, set once in each worker process rather than sent with every task
+worker_rocket = None
+worker_settings = None
+worker_cache = None
+
+
+def get_override_keys(overrides):  # overrides is {local_part_id: {attribute: [values]}}
+    return [(part_id, attribute) for part_id, attributes in overrides.items() for attribute in attributes]
+
+
+def get_column_name(key):
+    return f'{key[0]}.{key[1]}'
+
+
+def iter_grid(overrides):  # Yields every combination of override values as {(local_part_id, attribute): value}
+    keys = get_override_keys(overrides)
+    for values in itertools.product(*[overrides[part_id][attribute] for part_id, attribute in keys]):
+        yield dict(zip(keys, values))
+
+
+def get_grid_size(overrides):
+    size = 1
+    for part_id, attribute in get_override_keys(overrides):
+        size *= len(overrides[part_id][attribute])
+
+    return size
+
+
+def check_overrides(rocket, overrides):
+    for part_id, attribute in get_override_keys(overrides):
+        part = rocket.get_part_with_part_id(part_id)
+        if part is None:
+            raise Exception(f'No part with part id {part_id}')
+        if attribute not in part.FIELDS or attribute in db_controller.TEXT_ATTRIBUTES or not isinstance(getattr(part, attribute), (int, float)):
+            raise Exception(f'{part.__class__.__name__} has no numeric attribute {attribute}')
+
+
+def apply_overrides(rocket, point):  # Rocket with the overridden parts copied, the other parts and the stages are shared with rocket
+    new_parts = {}
+    for (part_id, attribute), value in point.items():
+        if part_id not in new_parts:
+            new_parts[part_id] = copy.copy(rocket.get_part_with_part_id(part_id))
+        setattr(new_parts[part_id], attribute, value)
+
+    for part_id, part in new_parts.items():
+        overridden_attributes = [attribute for overridden_part_id, attribute in point if overridden_part_id == part_id]
+        if hasattr(part, 'get_mass') and not getattr(part, 'mass_override', False) and 'mass' not in overridden_attributes:
+            part.mass = part.get_mass()  # Keep the mass in line with the new dimensions, as the editor does
+
+    new_rocket = Rocket(name=rocket.name, parts=[new_parts.get(part.local_part_id, part) for part in rocket.parts], new_part_id=rocket.new_part_id)
+    new_rocket.stages = rocket.stages
+
+    return new_rocket
+
+
+def init_worker(rocket, settings, use_cache=False):
+    global worker_rocket, worker_settings, worker_cache
+    worker_rocket = rocket
+    worker_settings = settings
+    worker_cache = simulation_cache.SimulationCache() if use_cache else None
+
+
+def simulate_summaries(rockets, settings):  # Summary values of each run as {key: array}, settings is one dict or one per rocket
+    simulator = BatchSimulator(rockets, settings, record=False)
+    simulator.simulate()
+
+    return {
+        'apoapsis': simulator.apoapsis_altitude,
+        'max velocity': simulator.max_velocity,
+        'burnout time': simulator.burnout_time,
+        'flight time': simulator.final_state['time']
+    }
+
+
+def get_cached_summaries(rockets, settings, cache):  # As simulate_summaries, only simulating the rockets that are not in the cache
+    keys = [simulation_cache.get_cache_key(rocket, settings, summary=True) for rocket in rockets]
+    entries = [cache.get(key) for key in keys]
+
+    summaries = {key: np.zeros(len(rockets)) for key in SUMMARY_KEYS}
+    missing = []
+    for member, entry in enumerate(entries):
+        if entry is None:
+            missing.append(member)
+        else:
+            for key in SUMMARY_KEYS:
+                summaries[key][member] = entry[1][key]
+
+    if len(missing) > 0:
+        new_summaries = simulate_summaries([rockets[member] for member in missing], settings)
+        for i, member in enumerate(missing):
+            results = {key: float(new_summaries[key][i]) for key in SUMMARY_KEYS}
+            cache.put(keys[member], None, results)
+            for key in SUMMARY_KEYS:
+                summaries[key][member] = results[key]
+
+    return summaries
+
+
+def simulate_chunk(chunk):  # chunk is a list of (run, point), returns a summary row for each run
+    return get_chunk_rows(worker_rocket, worker_settings, chunk, worker_cache)
+
+
+def get_chunk_rows(rocket, settings, chunk, cache=None):  # As simulate_chunk for any rocket and settings, cache being a SimulationCache or None
+    rockets = [apply_overrides(rocket, point) for _, point in chunk]
+    if cache is not None:
+        summaries = get_cached_summaries(rockets, settings, cache)
+    else:
+        summaries = simulate_summaries(rockets, settings)
+
+    rows = []
+    for member, (run, point) in enumerate(chunk):
+        row = {'run': run}
+        row.update({get_column_name(key): value for key, value in point.items()})
+        row.update({key: float(summaries[key][member]) for key in SUMMARY_KEYS})
+        rows.append(row)
+
+    return rows
+
+
+def iter_task_results(executor, function, tasks, max_pending):  # Yields function(task) results as they complete, with at most max_pending tasks submitted at once
+    tasks = iter(tasks)
+    pending = set()
+    for task in itertools.islice(tasks, max_pending):
+        pending.add(executor.submit(function, task))
+
+    while len(pending) > 0:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+        # Top the queue back up before handing results back, so the workers are kept busy while the caller uses them
+        for task in itertools.islice(tasks, len(done)):
+            pending.add(executor.submit(function, task))
+
+        for future in done:
+            yield future.result()
+
+
+def iter_chunks(overrides, chunk_size=DEFAULT_CHUNK_SIZE):  # Yields the runs of the grid chunk_size at a time, as lists of (run, point)
+    runs = enumerate(iter_grid(overrides))
+    return iter(lambda: list(itertools.islice(runs, chunk_size)), [])
+
+
+def run_sweep(rocket, overrides, settings=DEFAULT_SETTINGS, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, use_cache=False):
+    # Yields a summary row per run as the runs complete, so rows are not in run order
+    if isinstance(rocket, str):
+        rocket = load_rocket(rocket)
+    check_overrides(rocket, overrides)
+
+    workers = workers or os.cpu_count() or 1
+    chunks = iter_chunks(overrides, chunk_size)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(rocket, settings, use_cache)) as executor:
+        for rows in iter_task_results(executor, simulate_chunk, chunks, workers * MAX_CHUNKS_PER_WORKER):
+            yield from rows
+
+
+def parse_values(text):  # Either a comma separated list of values, or start:stop:count for evenly spaced values
+    if text.count(':') == 2:
+        start, stop, count = text.split(':')
+        return [float(value) for value in np.linspace(float(start), float(stop), int(count))]
+
+    return [float(value) for value in text.split(',')]
+
+
+def parse_override(text, overrides):  # Adds an override given as PART_ID.ATTRIBUTE=VALUES
+    try:
+        key, values = text.split('=', 1)
+        part_id, attribute = key.split('.', 1)
+        overrides.setdefault(int(part_id), {})[attribute] = parse_values(values)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'Invalid override {text}, expected PART_ID.ATTRIBUTE=V1,V2,... or PART_ID.ATTRIBUTE=START:STOP:COUNT')
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Simulate a saved rocket over a grid of part attribute values')
+    parser.add_argument('rocket', help='name of a rocket saved in the database')
+    parser.add_argument('-s', '--set', action='append', default=[], metavar='PART_ID.ATTRIBUTE=VALUES', help='values to sweep an attribute over, as V1,V2,... or START:STOP:COUNT')
+    parser.add_argument('-o', '--output', help='CSV file to write rows to, stdout by default')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='number of worker processes, one per CPU by default')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='runs simulated per task')
+    parser.add_argument('--cache', action='store_true', help='reuse results of runs simulated before, from the simulation cache')
+    for setting, value in DEFAULT_SETTINGS.items():
+        parser.add_argument('--' + setting.replace(' ', '-'), type=float, default=value, dest=setting, metavar=setting.upper().replace(' ', '_'))
+    args = parser.parse_args(args)
+
+    overrides = {}
+    for text in args.set:
+        try:
+            parse_override(text, overrides)
+        except argparse.ArgumentTypeError as error:
+            parser.error(str(error))
+
+    settings = {setting: getattr(args, setting) for setting in DEFAULT_SETTINGS}
+
+    try:
+        rocket = load_rocket(args.rocket)
+        check_overrides(rocket, overrides)
+    except Exception as error:
+        parser.error(str(error))
+
+    output = open(args.output, 'w', newline='') if args.output else sys.stdout
+    try:
+        writer = csv.DictWriter(output, fieldnames=['run'] + [get_column_name(key) for key in get_override_keys(overrides)] + SUMMARY_KEYS)
+        writer.writeheader()
+        for row in run_sweep(rocket, overrides, settings, args.workers, args.chunk_size, args.cache):
+            writer.writerow(row)
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+import numpy as np
+
+# Linear interpolation in tables of values at evenly spaced points, used by the atmosphere, drag coefficient, thrust curve and wind tables
+# A table holds size + 1 values, at bottom, bottom + spacing, ... bottom + size * spacing, and lookups outside it are clamped to its ends
+# The simulators look values up one at a time every step, for which they keep their tables as lists, as lists index faster than arrays
+
+
+def get_table_value(table, bottom, spacing, size, x):
+    position = (x - bottom) / spacing
+    if position <= 0:
+        return table[0]
+
+    # Past the top the last interval is extended to its end, the same arithmetic as get_table_values, so both give identical values
+    index = int(position) if position < size else size - 1
+    return table[index] + (table[index + 1] - table[index]) * (min(position, size) - index)
+
+
+def get_table_values(tables, bottom, spacing, size, x, table_indices=0):  # As get_table_value for an array, tables being several joined end to end
+    position = np.clip((x - bottom) / spacing, 0, size)
+    index = np.minimum(position.astype(int), size - 1)
+    start = table_indices * (size + 1) + index
+
+    return tables[start] + (tables[start + 1] - tables[start]) * (position - index)
@@ -0,0 +1,80 @@
+from part_model import *
+
+# Rockets and settings shared by the tests, built from the part model so no test needs pygame
+
+SETTINGS = {'gravity acc': 9.81, 'air density': 1.225, 'time increment': 0.01, 'altitude cutoff': -10, 'time cutoff': 1000}
+
+# Approximate Estes C6 curve, enough to exercise the .eng parser and thrust curve tables
+C6_ENG = """; Estes C6, approximate
+; comment lines and blank lines are skipped
+
+C6 18 70 0-3-5-7 0.0108 0.0242 Estes
+0.031 0.946
+0.092 4.826
+0.139 9.936
+0.192 14.090
+0.209 11.446
+0.231 7.381
+0.248 6.151
+0.292 5.489
+0.370 4.921
+0.475 4.448
+0.671 4.258
+0.850 4.448
+1.063 4.353
+1.303 4.258
+1.656 4.448
+1.821 4.448
+1.847 1.325
+1.860 0.000
+;
+"""
+
+
+def get_settings(**changes):  # SETTINGS with settings changed, given with underscores for spaces
+    settings = dict(SETTINGS)
+    for setting, value in changes.items():
+        settings[setting.replace('_', ' ')] = value
+
+    return settings
+
+
+def two_stage(thrust_lower=400, thrust_upper=150, burn_lower=3, burn_upper=4):  # Engine 5 burns first, engine 2 after the decoupler
+    parts = [
+        NoseCone(local_part_id=0, length=0.3, diameter=0.1),
+        BodyTube(local_part_id=1, length=0.6, diameter=0.1),
+        Engine(parent_id=1, local_part_id=2, mass=0.6, propellant_mass=0.4, average_thrust=thrust_upper, burn_time=burn_upper, diameter=0.05),
+        Decoupler(local_part_id=3, diameter=0.1),
+        BodyTube(local_part_id=4, length=0.8, diameter=0.1),
+        Engine(parent_id=4, local_part_id=5, mass=1.2, propellant_mass=0.8, average_thrust=thrust_lower, burn_time=burn_lower, diameter=0.05),
+        Fins(parent_id=4, local_part_id=6),
+    ]
+    rocket = Rocket(name='two stage', parts=parts, new_part_id=7)
+    rocket.stages = [[5], [3], [2]]
+    return rocket
+
+
+def single(thrust=100, burn=10):
+    parts = [
+        NoseCone(local_part_id=0, length=0.3, diameter=0.3),
+        BodyTube(local_part_id=1, length=1, diameter=0.3),
+        Engine(parent_id=1, local_part_id=2, average_thrust=thrust, burn_time=burn),
+        Fins(parent_id=1, local_part_id=3),
+    ]
+    rocket = Rocket(name='single', parts=parts, new_part_id=4)
+    rocket.stages = [[2]]
+    return rocket
+
+
+def small_motor(scale=1):  # Model rocket flying on the C6 curve, its average thrust scaled
+    parts = [
+        NoseCone(local_part_id=0, length=0.08, diameter=0.025),
+        BodyTube(local_part_id=1, length=0.3, diameter=0.025, wall_thickness=0.001),
+        Engine(parent_id=1, local_part_id=2),
+        Fins(parent_id=1, local_part_id=3, width=0.04, thickness=0.002, mass=0.01),
+    ]
+    parts[2].load_eng(C6_ENG)
+    parts[2].average_thrust *= scale
+    rocket = Rocket(name='small motor', parts=parts, new_part_id=4)
+    rocket.stages = [[2]]
+    return rocket
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import atmosphere
+import rocket_simulator
+from rockets import get_settings, two_stage
+from tables import get_table_value, get_table_values
+
+
+def get_geometric_altitude(geopotential_altitude):
+    return atmosphere.EARTH_RADIUS * geopotential_altitude / (atmosphere.EARTH_RADIUS - geopotential_altitude)
+
+
+# (geopotential altitude in m, temperature in K, pressure in Pa) at the base of each layer of the standard atmosphere
+STANDARD_LAYER_BASES = [
+    (0, 288.15, 101325),
+    (11000, 216.65, 22632.06),
+    (20000, 216.65, 5474.889),
+    (32000, 228.65, 868.0187),
+    (47000, 270.65, 110.9063),
+    (51000, 270.65, 66.93887),
+    (71000, 214.65, 3.956420)
+]
+
+
+@pytest.mark.parametrize('geopotential_altitude, temperature, pressure', STANDARD_LAYER_BASES)
+def test_standard_values_at_layer_bases(geopotential_altitude, temperature, pressure):
+    values = atmosphere.get_standard_values(get_geometric_altitude(geopotential_altitude))
+    assert values == pytest.approx((temperature, pressure), rel=1e-5)
+
+
+def test_table_matches_standard_values():
+    table = atmosphere.get_standard_atmosphere()
+    assert table is atmosphere.get_standard_atmosphere()
+    assert table.get_density_ratio(0) == 1
+    assert table.get_speed_of_sound(0) == pytest.approx(atmosphere.SEA_LEVEL_SPEED_OF_SOUND)
+    assert table.density[-atmosphere.TABLE_BOTTOM // atmosphere.TABLE_SPACING] == pytest.approx(atmosphere.SEA_LEVEL_DENSITY, rel=1e-4)
+
+    # Between table points the interpolated values are close to the exact ones, least so where a layer boundary falls between two points
+    for altitude in np.random.default_rng(1).uniform(atmosphere.TABLE_BOTTOM, atmosphere.TABLE_TOP, 200).tolist():
+        temperature, pressure = atmosphere.get_standard_values(altitude)
+        density_ratio = pressure / (atmosphere.GAS_CONSTANT * temperature) / table.density[-atmosphere.TABLE_BOTTOM // atmosphere.TABLE_SPACING]
+        assert table.get_density_ratio(altitude) == pytest.approx(density_ratio, rel=1e-4), altitude
+        assert table.get_speed_of_sound(altitude) == pytest.approx((1.4 * atmosphere.GAS_CONSTANT * temperature)**0.5, rel=1e-4), altitude
+
+
+def test_table_lookups_one_at_a_time_match_arrays():
+    table = atmosphere.get_standard_atmosphere()
+    altitudes = np.concatenate(([-1e4, atmosphere.TABLE_BOTTOM, 0, 5, atmosphere.TABLE_TOP, 1e6], np.random.default_rng(2).uniform(-3000, 90000, 500)))
+
+    density_ratios = table.get_density_ratios(altitudes)
+    speeds_of_sound = table.get_speeds_of_sound(altitudes)
+    for altitude, density_ratio, speed_of_sound in zip(altitudes.tolist(), density_ratios.tolist(), speeds_of_sound.tolist()):
+        assert table.get_density_ratio(altitude) == density_ratio, altitude
+        assert table.get_speed_of_sound(altitude) == speed_of_sound, altitude
+
+    # Outside the table the values at its ends are used
+    assert table.get_density_ratio(-1e4) == table.density_ratio[0]
+    assert table.get_density_ratio(1e6) == table.density_ratio[-1]
+
+
+def test_table_helper():
+    values = [0, 10, 30, 60]
+    tables = np.array(values + [100, 100, 100, 100])
+    assert get_table_value(values, 1, 2, 3, 1) == 0
+    assert get_table_value(values, 1, 2, 3, 4) == 20
+    assert get_table_value(values, 1, 2, 3, -5) == 0
+    assert get_table_value(values, 1, 2, 3, 100) == 60
+
+    x = np.array([-5, 1, 2, 4, 6.5, 7, 100])
+    assert get_table_values(tables, 1, 2, 3, x).tolist() == [get_table_value(values, 1, 2, 3, value) for value in x.tolist()]
+    assert get_table_values(tables, 1, 2, 3, x, table_indices=np.ones(len(x), dtype=int)).tolist() == [100] * len(x)
+
+
+def test_standard_atmosphere_thins_with_altitude():
+    constant = rocket_simulator.Simulator(two_stage(), get_settings())
+    constant.simulate()
+    standard = rocket_simulator.Simulator(two_stage(), get_settings(), atmosphere='standard')
+    standard.simulate()
+
+    # Less drag high up, so the rocket flies higher, while the flights match until the air thins
+    assert standard.flight_data['altitude'].max() > constant.flight_data['altitude'].max()
+    assert standard.flight_data['altitude'][10] == pytest.approx(constant.flight_data['altitude'][10], rel=1e-3)
+
+    with pytest.raises(Exception):
+        rocket_simulator.Simulator(two_stage(), get_settings(), atmosphere='martian')
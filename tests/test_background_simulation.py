@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import background_simulation
+import rocket_simulator
+import simulation_cache
+from rockets import get_settings, two_stage
+from trajectory import DEFAULT_RECORDING_TOLERANCE
+
+
+@pytest.fixture(autouse=True)
+def previous_flights(monkeypatch):
+    monkeypatch.setattr(background_simulation, 'previous_flights', background_simulation.PreviousFlights())
+    return background_simulation.previous_flights
+
+
+def run(rocket, cache, **options):
+    simulation = background_simulation.BackgroundSimulation(rocket, get_settings(), cache=cache, recording_tolerance=DEFAULT_RECORDING_TOLERANCE, **options)
+    simulation.start()
+    simulation.wait()
+    assert simulation.error is None
+
+    expected = rocket_simulator.Simulator(rocket, get_settings(), recording_tolerance=DEFAULT_RECORDING_TOLERANCE, **options)
+    expected.simulate()
+    assert np.array_equal(simulation.get_flight_data().get_rows(), expected.flight_data.get_rows())
+    assert simulation.simulator.flight_events == expected.flight_events
+
+    return simulation
+
+
+def test_edited_rocket_carries_on_from_the_last_run(previous_flights):
+    cache = simulation_cache.SimulationCache(db_path=None)
+    rocket = two_stage()  # Edited in place between runs, as the editor does
+
+    first = run(rocket, cache)
+    assert first.reused_steps == 0
+    flight_checkpoints = previous_flights.get(rocket.name)
+    assert isinstance(flight_checkpoints, rocket_simulator.FlightCheckpoints)
+    assert flight_checkpoints.checkpoints is first.simulator.checkpoints
+    assert len(flight_checkpoints.rows) == flight_checkpoints.checkpoints[-1].recorded_rows
+
+    rocket.parts[2].average_thrust = 200  # The upper stage, so the flight is the same until staging
+    second = run(rocket, cache)
+    assert second.reused_steps > 0
+    assert second.previous is None  # Let go of once finished
+
+    rocket.parts[0].length = 0.4  # Changes the whole flight
+    assert run(rocket, cache).reused_steps == 0
+
+    rocket.parts[0].length = 0.3
+    rocket.parts[2].average_thrust = 200
+    cached = background_simulation.BackgroundSimulation(rocket, get_settings(), cache=cache, recording_tolerance=DEFAULT_RECORDING_TOLERANCE)
+    assert cached.finished and cached.previous is None
+
+
+def test_editing_the_rocket_while_simulating():
+    cache = simulation_cache.SimulationCache(db_path=None)
+    rocket = two_stage()
+    settings = get_settings()
+    simulation = background_simulation.BackgroundSimulation(rocket, settings, cache=cache, recording_tolerance=DEFAULT_RECORDING_TOLERANCE)
+
+    rocket.parts[2].average_thrust = 200  # Edited after the simulation was made, before or while its thread runs
+    settings['time increment'] = 0.02
+    simulation.start()
+    simulation.wait()
+
+    expected = rocket_simulator.Simulator(two_stage(), get_settings(), recording_tolerance=DEFAULT_RECORDING_TOLERANCE)
+    expected.simulate()
+    assert np.array_equal(simulation.get_flight_data().get_rows(), expected.flight_data.get_rows())
+
+    # Cached under the rocket that was simulated, not the edited one
+    key = simulation_cache.get_cache_key(two_stage(), get_settings(), recording_tolerance=DEFAULT_RECORDING_TOLERANCE)
+    assert simulation.key == key
+    assert np.array_equal(cache.get(key)[0], expected.flight_data.get_rows())
+    assert cache.get(simulation_cache.get_cache_key(rocket, settings, recording_tolerance=DEFAULT_RECORDING_TOLERANCE)) is None
+
+
+def test_adaptive_flights_keep_no_checkpoints(previous_flights):
+    simulation = run(two_stage(), simulation_cache.SimulationCache(db_path=None), integrator='adaptive')
+    assert simulation.simulator.checkpoints is None
+    assert len(previous_flights.flights) == 0
+
+
+def test_previous_flights_forget_the_least_recently_used(previous_flights):
+    cache = simulation_cache.SimulationCache(db_path=None)
+    rockets = [two_stage(thrust_upper=150 + number) for number in range(background_simulation.MAX_PREVIOUS_FLIGHTS + 1)]
+    for number, rocket in enumerate(rockets):
+        rocket.name = f'rocket {number}'
+        run(rocket, cache)
+        previous_flights.get(rockets[0].name)  # Used again by every run, so never the least recently used
+
+    assert list(previous_flights.flights) == [rocket.name for rocket in rockets[2:]] + [rockets[0].name]
+    assert previous_flights.get(rockets[1].name) is None
@@ -0,0 +1,59 @@
+import random
+
+import numpy as np
+import pytest
+
+import batch_simulator
+import rocket_simulator
+from rockets import C6_ENG, get_settings, single, small_motor, two_stage
+
+
+def get_members(count, seed):  # Rockets and settings of every kind the batch handles, with flights of different lengths
+    rng = random.Random(seed)
+    rockets = []
+    settings = []
+    for member in range(count):
+        if member % 4 == 0:
+            rocket = single(rng.uniform(50, 300), rng.uniform(2, 12))
+        elif member % 4 == 1:
+            rocket = two_stage(rng.uniform(200, 600), rng.uniform(50, 300), rng.uniform(1, 4), rng.uniform(1, 5))
+        elif member % 4 == 2:
+            rocket = small_motor(rng.uniform(0.8, 1.2))
+        else:
+            rocket = two_stage(rng.uniform(200, 600), rng.uniform(50, 300))
+            rocket.parts[5].thrust_curve = C6_ENG  # Scaled to the engine's own average thrust and burn time
+            rocket.stages = [[5, 3], [], [2]] if member % 8 == 3 else rocket.stages
+
+        rockets.append(rocket)
+        settings.append(get_settings(time_increment=rng.choice([0.01, 0.005, 0.02]), air_density=rng.uniform(1, 1.3)))
+    settings[1]['time cutoff'] = 5
+
+    return rockets, settings
+
+
+@pytest.mark.parametrize('options', [{}, {'atmosphere': 'standard', 'drag_model': 'mach'}], ids=['constant', 'standard atmosphere and mach drag'])
+def test_batch_matches_simulator(options):
+    rockets, settings = get_members(12, seed=1)
+    batch = batch_simulator.BatchSimulator(rockets, settings, **options)
+    batch.simulate()
+
+    for member, (rocket, member_settings) in enumerate(zip(rockets, settings)):
+        simulator = rocket_simulator.Simulator(rocket, member_settings, **options)
+        simulator.simulate()
+
+        for key in simulator.flight_data:
+            assert np.array_equal(batch.flight_data[member][key], simulator.flight_data[key]), (member, key)
+        assert batch.flight_events[member] == simulator.flight_events
+
+
+def test_batch_without_recording_keeps_the_final_state():
+    rockets, settings = get_members(8, seed=2)
+    batch = batch_simulator.BatchSimulator(rockets, settings, record=False)
+    batch.simulate()
+
+    for member, (rocket, member_settings) in enumerate(zip(rockets, settings)):
+        simulator = rocket_simulator.Simulator(rocket, member_settings)
+        simulator.simulate()
+
+        for key in simulator.flight_data:
+            assert batch.final_state[key][member] == simulator.flight_data[key][-1], (member, key)
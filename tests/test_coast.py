@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import rocket_simulator
+from coast import CoastPhase
+from rockets import get_settings, single, small_motor, two_stage
+
+
+def integrate_coast(coast_phase, times, step=1e-3):  # (altitudes, velocities) at times, stepped with Runge-Kutta as a reference
+    def derivatives(velocity):
+        return -coast_phase.gravity_acc - coast_phase.k * velocity * abs(velocity)
+
+    altitude = coast_phase.altitude
+    velocity = coast_phase.velocity
+    time = 0
+    altitudes = []
+    velocities = []
+    for end_time in times:
+        while time < end_time - 1e-12:
+            h = min(step, end_time - time)
+            k1 = derivatives(velocity)
+            k2 = derivatives(velocity + h / 2 * k1)
+            k3 = derivatives(velocity + h / 2 * k2)
+            k4 = derivatives(velocity + h * k3)
+            altitude += h * (velocity + h / 6 * (k1 + k2 + k3))
+            velocity += h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            time += h
+        altitudes.append(altitude)
+        velocities.append(velocity)
+
+    return np.array(altitudes), np.array(velocities)
+
+
+@pytest.mark.parametrize('velocity', [120, 0, -30, -200], ids=['rising', 'at rest', 'falling', 'above terminal velocity'])
+@pytest.mark.parametrize('drag_coefficient_area_total', [0.01, 0], ids=['drag', 'no drag'])
+def test_coast_phase_matches_stepped_flight(velocity, drag_coefficient_area_total):
+    coast_phase = CoastPhase(500, velocity, 2, 9.81, 1.225, drag_coefficient_area_total)
+    times = np.linspace(0, 20, 41)
+
+    altitudes, velocities = coast_phase.get_state(times)
+    expected_altitudes, expected_velocities = integrate_coast(coast_phase, times)
+    assert altitudes == pytest.approx(expected_altitudes, abs=1e-6)
+    assert velocities == pytest.approx(expected_velocities, abs=1e-6)
+
+    if velocity > 0:
+        apoapsis_altitude, apoapsis_velocity = coast_phase.get_state(coast_phase.apoapsis_time)
+        assert apoapsis_velocity == pytest.approx(0, abs=1e-9)
+        assert apoapsis_altitude == pytest.approx(coast_phase.apoapsis_altitude)
+
+
+def test_time_at_altitude_inverts_the_coast():
+    coast_phase = CoastPhase(500, 120, 2, 9.81, 1.225, 0.01)
+    for altitude in [480, 100, 0, -1000]:
+        time = coast_phase.get_time_at_altitude(altitude)
+        assert time > coast_phase.apoapsis_time
+        assert coast_phase.get_state(time)[0] == pytest.approx(altitude, abs=1e-6)
+
+    assert coast_phase.get_time_at_altitude(coast_phase.apoapsis_altitude + 1) == coast_phase.apoapsis_time
+
+
+@pytest.mark.parametrize('make_rocket', [two_stage, single, small_motor], ids=['two stage', 'single', 'thrust curve'])
+def test_analytic_coast_agrees_with_stepped_coast(make_rocket):
+    settings = get_settings(time_increment=0.001)
+    stepped = rocket_simulator.Simulator(make_rocket(), settings)
+    stepped.simulate()
+    analytic = rocket_simulator.Simulator(make_rocket(), settings, analytic_coast=True)
+    analytic.simulate()
+
+    assert analytic.coast_tail_length > 0
+    burnout = analytic.flight_events['propellant depletion']
+    assert burnout == stepped.flight_events['propellant depletion']
+    assert np.array_equal(analytic.flight_data.get_rows()[:burnout + 1], stepped.flight_data.get_rows()[:burnout + 1])
+
+    # The stepped coast drifts from the exact one by a little every step
+    assert analytic.flight_data['altitude'].max() == pytest.approx(stepped.flight_data['altitude'].max(), rel=5e-4)
+    assert analytic.flight_data['time'][-1] == pytest.approx(stepped.flight_data['time'][-1], rel=5e-4)
+    apoapsis_time = analytic.flight_data['time'][analytic.flight_events['apoapsis']]
+    assert apoapsis_time == pytest.approx(stepped.flight_data['time'][stepped.flight_events['apoapsis']], rel=5e-4)
+    assert analytic.flight_data['altitude'][-1] < get_settings()['altitude cutoff'] <= analytic.flight_data['altitude'][-2]
+
+
+def test_analytic_coast_is_ignored_where_it_does_not_apply():
+    for options in [{'atmosphere': 'standard'}, {'drag_model': 'mach'}]:
+        simulator = rocket_simulator.Simulator(single(), get_settings(), analytic_coast=True, **options)
+        assert not simulator.analytic_coast
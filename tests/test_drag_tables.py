@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import drag_tables
+import rocket_simulator
+from part_model import BodyTube, Fins, NoseCone
+from rockets import get_settings, single, small_motor, two_stage
+
+
+def test_stagnation_pressure_ratios():
+    mach = np.linspace(0, drag_tables.TABLE_MAX_MACH, 5001)
+    ratios = drag_tables.get_stagnation_pressure_ratios(mach)
+
+    # 1 at rest, rising through the speed of sound, where the subsonic and supersonic fits meet within 1%, and levelling off well above it
+    assert ratios[0] == 1
+    assert np.all(np.diff(ratios) >= 0)
+    assert drag_tables.get_stagnation_pressure_ratios(np.array([1 - 1e-9, 1 + 1e-9])) == pytest.approx([1.275, 1.275], rel=0.01)
+    assert ratios[-1] == pytest.approx(1.84, abs=0.04)
+
+
+def test_mach_factors_by_part():
+    body_tube = drag_tables.get_mach_factors(BodyTube, 1, 0.1)
+    blunt_nose = drag_tables.get_mach_factors(NoseCone, 0.05, 0.1)
+    pointed_nose = drag_tables.get_mach_factors(NoseCone, 1, 0.1)
+    thin_fins = drag_tables.get_mach_factors(Fins, 0.1, 0.002)
+
+    assert len(body_tube) == drag_tables.TABLE_SIZE + 1
+    for factors in [body_tube, blunt_nose, pointed_nose, thin_fins]:
+        assert factors[0] == 1
+        assert np.all(np.diff(factors) >= 0)
+    assert np.all(body_tube >= blunt_nose) and np.all(blunt_nose >= pointed_nose) and np.all(pointed_nose >= thin_fins)
+
+    # Shared between parts of the same geometry, so they cannot be changed
+    assert drag_tables.get_mach_factors(BodyTube, 1, 0.1) is body_tube
+    with pytest.raises(ValueError):
+        body_tube[0] = 2
+
+
+@pytest.mark.parametrize('make_rocket', [two_stage, single, small_motor], ids=['two stage', 'single', 'thrust curve'])
+def test_table_at_rest_is_the_constant_drag(make_rocket):
+    parts = make_rocket().parts
+    table = rocket_simulator.get_drag_coefficient_area_table(parts)
+    assert table[0] == pytest.approx(rocket_simulator.get_drag_coefficient_area_total(parts))
+    assert np.all(table[1:] >= table[0])
+
+
+def test_mach_drag_slows_fast_rockets_only():
+    slow_constant = rocket_simulator.Simulator(single(), get_settings())
+    slow_constant.simulate()
+    slow_mach = rocket_simulator.Simulator(single(), get_settings(), drag_model='mach')
+    slow_mach.simulate()
+    fast_constant = rocket_simulator.Simulator(two_stage(thrust_lower=2000, thrust_upper=800), get_settings())
+    fast_constant.simulate()
+    fast_mach = rocket_simulator.Simulator(two_stage(thrust_lower=2000, thrust_upper=800), get_settings(), drag_model='mach')
+    fast_mach.simulate()
+
+    assert slow_mach.flight_data['altitude'].max() == pytest.approx(slow_constant.flight_data['altitude'].max(), rel=0.02)
+    assert slow_mach.flight_data['altitude'].max() < slow_constant.flight_data['altitude'].max()
+    assert np.abs(fast_constant.flight_data['velocity']).max() > 340
+    assert fast_mach.flight_data['altitude'].max() < 0.95 * fast_constant.flight_data['altitude'].max()
+
+    with pytest.raises(Exception):
+        rocket_simulator.Simulator(single(), get_settings(), drag_model='reynolds')
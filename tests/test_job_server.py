@@ -0,0 +1,188 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+import job_server
+import rocket_simulator
+from rockets import single, two_stage
+
+ROCKETS = {'two stage': two_stage, 'single': single}
+
+
+def load_rocket(name):  # Stands in for the database
+    if name not in ROCKETS:
+        raise Exception(f'No saved rocket called {name}')
+    return ROCKETS[name]()
+
+
+def run_with_server(tmp_path, client_function, **options):  # client_function(client) run against a server with one worker on a Unix socket
+    socket_path = str(tmp_path / 'jobs.sock')
+
+    async def run():
+        server = job_server.JobServer(workers=1, load_rocket=load_rocket, **options)
+        await server.start(socket_path=socket_path)
+        try:
+            return await client_function(job_server.JobClient(socket_path=socket_path))
+        finally:
+            await server.close()
+
+    return asyncio.run(run())
+
+
+async def collect(client, job):
+    return [line async for line in client.iter_job(job)]
+
+
+def test_simulate_job(tmp_path):
+    lines = run_with_server(tmp_path, lambda client: collect(client, {'type': 'simulate', 'rocket': 'single', 'settings': {'time increment': 0.01}}))
+
+    assert lines[0]['type'] == 'simulate' and lines[0]['coalesced'] is False
+    assert lines[-1] == {'done': True}
+
+    simulator = rocket_simulator.Simulator(single(), dict(rocket_simulator.DEFAULT_SETTINGS, **{'time increment': 0.01}))
+    simulator.simulate()
+    rows = [row for line in lines if 'rows' in line for row in line['rows']]
+    assert lines[1]['columns'] == list(simulator.flight_data)
+    assert lines[1]['flight events'] == simulator.flight_events
+    assert np.array_equal(np.array(rows), np.array(simulator.flight_data.get_rows().tolist()))
+
+
+def test_identical_jobs_are_coalesced(tmp_path):
+    # Each job takes long enough to simulate that the second request arrives while the first is still running
+    job = {'type': 'monte carlo', 'rocket': 'two stage', 'runs': 1000, 'seed': 1, 'chunk size': 500}
+
+    async def run_twice(client):
+        return await asyncio.gather(collect(client, job), collect(client, dict(job, settings={'time increment': 0.01})))
+
+    first, second = run_with_server(tmp_path, run_twice)
+
+    assert first[0]['job'] == second[0]['job']
+    assert sorted([first[0]['coalesced'], second[0]['coalesced']]) == [False, True]
+    assert first[1:] == second[1:]  # The client joining later is sent every line from the start
+    assert first[-2]['runs'] == 1000
+    assert first[-1] == {'done': True}
+
+
+def test_identical_job_runs_again_once_lines_are_dropped(tmp_path):
+    job = {'type': 'monte carlo', 'rocket': 'two stage', 'runs': 1000, 'seed': 1, 'chunk size': 500}
+
+    async def run_late(client):
+        lines = client.iter_job(job)
+        first = [await lines.__anext__(), await lines.__anext__()]  # The first statistics have been taken, so the job drops them
+        second = await collect(client, job)
+        first += [line async for line in lines]
+        return first, second
+
+    first, second = run_with_server(tmp_path, run_late)
+    assert first[0]['job'] == second[0]['job']
+    assert not first[0]['coalesced'] and not second[0]['coalesced']
+    assert first[1:] == second[1:]
+
+
+def test_lines_are_dropped_once_every_client_has_taken_them():
+    async def run():
+        job = job_server.Job('key')
+        first = job.add_client()
+        second = job.add_client()
+        for number in range(3):
+            await job.publish({'line': number})
+        first_lines = [await job.get_lines(first)]
+        kept = [(job.offset, len(job.lines))]
+
+        await job.publish({'line': 3})
+        second_lines = [await job.get_lines(second)]
+        kept.append((job.offset, len(job.lines)))
+        late_client = job.add_client()
+
+        await job.remove_client(first)
+        kept.append((job.offset, len(job.lines)))
+        await job.publish({'line': 4})
+        await job.finish()
+        second_lines += [await job.get_lines(second), await job.get_lines(second)]
+
+        return first_lines, second_lines, kept, late_client
+
+    first_lines, second_lines, kept, late_client = asyncio.run(run())
+    assert first_lines == [b''.join(json.dumps({'line': number}).encode() + b'\n' for number in range(3))]
+    assert b''.join(second_lines) == b''.join(json.dumps({'line': number}).encode() + b'\n' for number in range(5))
+    assert second_lines[-1] == b''
+    assert kept == [(0, 3), (3, 1), (4, 0)]
+    assert late_client is None  # Too late to be sent every line
+
+
+def test_different_jobs_are_not_coalesced(tmp_path):
+    async def run_both(client):
+        return await asyncio.gather(collect(client, {'type': 'simulate', 'rocket': 'single'}), collect(client, {'type': 'simulate', 'rocket': 'two stage'}))
+
+    first, second = run_with_server(tmp_path, run_both)
+    assert first[0]['job'] != second[0]['job']
+    assert not first[0]['coalesced'] and not second[0]['coalesced']
+
+
+def test_running_jobs_are_counted(tmp_path):
+    async def run_over_limit(client):
+        lines = client.iter_job({'type': 'monte carlo', 'rocket': 'two stage', 'runs': 1000, 'chunk size': 500})
+        await lines.__anext__()  # The job is running once its first line arrives
+        running_status = await client.get_status()
+        with pytest.raises(Exception, match='503'):
+            await collect(client, {'type': 'simulate', 'rocket': 'single'})
+
+        last_line = [line async for line in lines][-1]
+        return running_status, last_line, await client.get_status()
+
+    running_status, last_line, finished_status = run_with_server(tmp_path, run_over_limit, max_jobs=1)
+    assert running_status['jobs'] == 1
+    assert last_line == {'done': True}
+    assert finished_status['jobs'] == 0
+
+
+BAD_JOBS = [
+    ('not an object', [1, 2]),
+    ('job type', {'type': 'orbit', 'rocket': 'single'}),
+    ('no rocket', {'type': 'simulate'}),
+    ('rocket and spec', {'type': 'simulate', 'rocket': 'single', 'spec': {}}),
+    ('unknown rocket', {'type': 'simulate', 'rocket': 'nope'}),
+    ('unknown setting', {'type': 'simulate', 'rocket': 'single', 'settings': {'wind': 1}}),
+    ('simulate option', {'type': 'simulate', 'rocket': 'single', 'options': {'warp': True}}),
+    ('sweep part', {'type': 'sweep', 'rocket': 'single', 'overrides': {'99': {'mass': [1, 2]}}}),
+]
+
+
+@pytest.mark.parametrize('job', [job for _, job in BAD_JOBS], ids=[name for name, _ in BAD_JOBS])
+def test_invalid_jobs_get_400(tmp_path, job):
+    async def post(client):
+        status, lines = await client.request('POST', '/jobs', job)
+        return status, [line async for line in lines]
+
+    status, lines = run_with_server(tmp_path, post)
+    assert status == 400
+    assert len(lines) == 1 and lines[0]['error']
+
+
+def test_invalid_requests(tmp_path):
+    async def send(client):
+        reader, writer = await asyncio.open_unix_connection(client.socket_path)
+        body = b'{"type": '
+        writer.write(b'POST /jobs HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+        await writer.drain()
+        invalid_json = (await reader.read()).decode()
+        writer.close()
+
+        with pytest.raises(Exception, match='400'):
+            await collect(client, {'type': 'simulate', 'rocket': 'nope'})
+
+        statuses = []
+        for method, path in [('GET', '/jobs'), ('GET', '/nothing')]:
+            status, lines = await client.request(method, path)
+            statuses.append(status)
+            [line async for line in lines]
+
+        return invalid_json, statuses, await client.get_status()
+
+    invalid_json, statuses, status = run_with_server(tmp_path, send)
+    assert invalid_json.startswith('HTTP/1.1 400 Bad Request')
+    assert json.loads(invalid_json.split('\r\n\r\n', 1)[1])['error']
+    assert statuses == [405, 404]
+    assert status == {'jobs': 0, 'queued tasks': 0, 'max tasks': status['max tasks'], 'workers': 1}
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import monte_carlo
+from monte_carlo import Histogram, OnlineStatistics
+from rockets import get_settings, single
+
+
+def get_batches(seed):  # Batches of different sizes and spreads, the later ones falling outside the range of the first
+    rng = np.random.default_rng(seed)
+    return [rng.normal(100, 5, 1000), rng.normal(100, 5, 1), rng.normal(130, 20, 5000), rng.uniform(-500, 20, 300), rng.normal(1e4, 1, 50)]
+
+
+def test_statistics_merged_across_batches():
+    batches = get_batches(seed=1)
+    values = np.concatenate(batches)
+
+    statistics = OnlineStatistics()
+    for batch in batches:
+        statistics.add(batch)
+    statistics.add([np.nan, np.inf])  # Failed runs are skipped
+
+    assert statistics.count == len(values)
+    assert statistics.mean == pytest.approx(values.mean(), rel=1e-12)
+    assert statistics.get_variance() == pytest.approx(values.var(ddof=1), rel=1e-9)
+    assert statistics.minimum == values.min()
+    assert statistics.maximum == values.max()
+    assert statistics.get_percentile(0) == values.min()
+    assert statistics.get_percentile(100) == values.max()
+
+
+def test_statistics_of_too_few_values():
+    statistics = OnlineStatistics()
+    assert np.isnan(statistics.get_percentile(50))
+    statistics.add([3])
+    assert np.isnan(statistics.get_variance())
+    assert statistics.get_summary()['p50'] == 3
+
+
+@pytest.mark.parametrize('bin_count', [1024, 64])
+def test_histogram_percentiles(bin_count):
+    batches = get_batches(seed=2)
+    values = np.concatenate(batches)
+
+    histogram = Histogram(bin_count)
+    for batch in batches:
+        histogram.add(batch)
+
+    # The range doubled to take in every batch, and each percentile lies in the same bin as the exact one
+    assert histogram.counts.sum() == len(values)
+    assert histogram.origin <= values.min()
+    assert values.max() < histogram.origin + histogram.width * histogram.bin_count
+    assert histogram.width > (values.max() - values.min()) / histogram.bin_count
+    for percentile in [1, 5, 25, 50, 75, 95, 99]:
+        assert histogram.get_percentile(percentile) == pytest.approx(np.percentile(values, percentile), abs=histogram.width), percentile
+
+    edges, counts = histogram.get_bins(10)
+    assert counts.sum() == len(values)
+    assert len(counts) <= 10
+    assert edges[0] <= values.min() and values.max() < edges[-1]
+
+
+def test_histogram_of_equal_values():
+    histogram = Histogram()
+    histogram.add([5] * 10)
+    histogram.add([5])
+    assert histogram.get_percentile(50) == pytest.approx(5)
+
+
+def test_seeded_runs_are_repeatable():
+    rocket = single()
+    dispersions = monte_carlo.get_default_dispersions(rocket)
+    settings_dispersions = {'air density': monte_carlo.DEFAULT_AIR_DENSITY_DISPERSION}
+    tasks = list(monte_carlo.get_tasks(10, dispersions, settings_dispersions, seed=3, chunk_size=4))
+    assert [task[0] for task in tasks] == [4, 4, 2]
+
+    first = monte_carlo.simulate_samples(rocket, get_settings(), tasks[0])
+    again = monte_carlo.simulate_samples(rocket, get_settings(), list(monte_carlo.get_tasks(10, dispersions, settings_dispersions, seed=3, chunk_size=4))[0])
+    other = monte_carlo.simulate_samples(rocket, get_settings(), tasks[1])
+    for key, values in first.items():
+        assert np.array_equal(values, again[key]), key
+    assert not np.array_equal(first['apoapsis'], other['apoapsis'])
@@ -0,0 +1,146 @@
+import numpy as np
+import pytest
+
+import planar
+import rocket_simulator
+from rockets import get_settings, single, small_motor, two_stage
+
+
+def simulate(rocket, settings=None, simulator_class=rocket_simulator.Simulator, **options):
+    simulator = simulator_class(rocket, settings or get_settings(), **options)
+    simulator.simulate()
+    return simulator
+
+
+def assert_same_flight(simulator, expected):
+    assert np.array_equal(simulator.flight_data.get_rows(), expected.flight_data.get_rows())
+    assert simulator.flight_events == expected.flight_events
+    assert [descriptor.part_ids for descriptor in simulator.rocket_at_stage] == [descriptor.part_ids for descriptor in expected.rocket_at_stage]
+
+
+@pytest.mark.parametrize('make_rocket', [two_stage, single, small_motor], ids=['two stage', 'single', 'thrust curve'])
+def test_adaptive_agrees_with_euler(make_rocket):
+    # The adaptive integrator's apoapsis and flight time agree with euler steps of 0.001 s to within 0.1%
+    euler = simulate(make_rocket(), get_settings(time_increment=0.001))
+    adaptive = simulate(make_rocket(), integrator='adaptive')
+
+    euler_altitudes = euler.flight_data['altitude']
+    adaptive_altitudes = adaptive.flight_data['altitude']
+    assert adaptive_altitudes.max() == pytest.approx(euler_altitudes.max(), rel=1e-3)
+    assert adaptive.flight_data['time'][-1] == pytest.approx(euler.flight_data['time'][-1], rel=1e-3)
+
+    assert len(adaptive_altitudes) < len(euler_altitudes)
+    assert adaptive.flight_events['apoapsis'] == int(np.argmax(adaptive_altitudes))
+    apoapsis_time = adaptive.flight_data['time'][adaptive.flight_events['apoapsis']]
+    assert apoapsis_time == pytest.approx(euler.flight_data['time'][euler.flight_events['apoapsis']], rel=1e-3)
+
+
+def test_invalid_options():
+    with pytest.raises(Exception):
+        rocket_simulator.Simulator(single(), get_settings(), integrator='leapfrog')
+    with pytest.raises(Exception):
+        rocket_simulator.Simulator(single(), get_settings(), integrator='adaptive', checkpoint_interval=100)
+
+
+def upper_thrust(thrust):
+    return lambda: two_stage(thrust_upper=thrust)
+
+
+def longer_nose():
+    rocket = two_stage()
+    rocket.parts[0].length = 0.4
+    return rocket
+
+
+RESIMULATE_CASES = [  # (id, rocket simulated first, edited rocket, settings of the edited flight, rows carried on from)
+    ('upper engine', two_stage, upper_thrust(200), {}, 'some'),
+    ('lower engine', two_stage, lambda: two_stage(thrust_lower=420), {}, 'none'),
+    ('nose cone', two_stage, longer_nose, {}, 'none'),
+    ('no change', two_stage, two_stage, {}, 'some'),
+    ('earlier time cutoff', two_stage, two_stage, {'time cutoff': 20}, 'some'),
+    ('higher altitude cutoff', two_stage, two_stage, {'altitude cutoff': 100}, 'none'),
+    ('time increment', two_stage, two_stage, {'time increment': 0.005}, 'none'),
+    ('single stage', single, lambda: single(thrust=120), {}, 'none'),
+]
+
+
+@pytest.mark.parametrize('recording_tolerance', [None, {}], ids=['every row', 'decimated'])
+@pytest.mark.parametrize('case', RESIMULATE_CASES, ids=[case[0] for case in RESIMULATE_CASES])
+def test_resimulate_matches_a_full_run(case, recording_tolerance):
+    _, make_previous, make_rocket, settings, reused = case
+    previous = simulate(make_previous(), checkpoint_interval=500, recording_tolerance=recording_tolerance)
+    assert len(previous.checkpoints) > 1
+
+    simulator = rocket_simulator.Simulator(make_rocket(), get_settings(**settings), checkpoint_interval=500, recording_tolerance=recording_tolerance)
+    steps = simulator.resimulate(previous)
+    expected = simulate(make_rocket(), get_settings(**settings), recording_tolerance=recording_tolerance)
+
+    assert_same_flight(simulator, expected)
+    assert (steps > 0) == (reused == 'some')
+
+
+@pytest.mark.parametrize('options', [{'drag_model': 'mach', 'atmosphere': 'standard'}, {'analytic_coast': True}], ids=['mach drag', 'analytic coast'])
+def test_resimulate_with_options(options):
+    previous = simulate(two_stage(), checkpoint_interval=500, **options)
+    simulator = rocket_simulator.Simulator(two_stage(thrust_upper=200), get_settings(), checkpoint_interval=500, **options)
+
+    assert simulator.resimulate(previous) > 0
+    assert_same_flight(simulator, simulate(two_stage(thrust_upper=200), **options))
+
+
+def test_resimulate_planar():
+    options = {'launch_angle': 5, 'wind': 3}
+    previous = simulate(two_stage(), simulator_class=planar.PlanarSimulator, checkpoint_interval=500, **options)
+    simulator = planar.PlanarSimulator(two_stage(thrust_upper=200), get_settings(), checkpoint_interval=500, **options)
+
+    assert simulator.resimulate(previous) > 0
+    assert_same_flight(simulator, simulate(two_stage(thrust_upper=200), simulator_class=planar.PlanarSimulator, **options))
+
+
+def test_resimulate_chained():
+    first = simulate(two_stage(), checkpoint_interval=300)
+    second = rocket_simulator.Simulator(two_stage(thrust_upper=200), get_settings(), checkpoint_interval=300)
+    second.resimulate(first)
+    third = rocket_simulator.Simulator(two_stage(thrust_upper=250), get_settings(), checkpoint_interval=300)
+
+    assert third.resimulate(second) > 0
+    assert_same_flight(third, simulate(two_stage(thrust_upper=250)))
+
+
+def test_resimulate_after_the_rocket_is_edited_in_place():
+    # The previous flight's stage keys are worked out when it is made, so editing the same rocket afterwards cannot fool the comparison
+    rocket = two_stage()
+    previous = simulate(rocket, checkpoint_interval=500)
+    rocket.parts[0].length = 0.4
+
+    simulator = rocket_simulator.Simulator(rocket, get_settings(), checkpoint_interval=500)
+    assert simulator.resimulate(previous) == 0
+    assert_same_flight(simulator, simulate(rocket))
+
+
+def test_resimulate_needs_the_same_recording():
+    previous = simulate(two_stage(), checkpoint_interval=500, recording_tolerance={'altitude': 0.1})
+    decimated = rocket_simulator.Simulator(two_stage(thrust_upper=200), get_settings(), checkpoint_interval=500, recording_tolerance={})
+    every_row = rocket_simulator.Simulator(two_stage(thrust_upper=200), get_settings(), checkpoint_interval=500)
+
+    assert decimated.resimulate(previous) == 0
+    assert every_row.resimulate(previous) == 0
+
+
+@pytest.mark.parametrize('recording_tolerance', [None, {}], ids=['every row', 'decimated'])
+def test_resimulate_from_flight_checkpoints(recording_tolerance):
+    # Only the flight checkpoints of the previous flight are kept, not its simulator
+    flight_checkpoints = simulate(two_stage(), checkpoint_interval=500, recording_tolerance=recording_tolerance).get_flight_checkpoints()
+    simulator = rocket_simulator.Simulator(two_stage(thrust_upper=200), get_settings(), checkpoint_interval=500, recording_tolerance=recording_tolerance)
+
+    assert simulator.resimulate(flight_checkpoints) > 0
+    assert_same_flight(simulator, simulate(two_stage(thrust_upper=200), recording_tolerance=recording_tolerance))
+
+
+def test_resimulate_from_a_flight_without_checkpoints():
+    previous = simulate(two_stage())
+    assert previous.get_flight_checkpoints() is None
+
+    simulator = rocket_simulator.Simulator(two_stage(thrust_upper=200), get_settings(), checkpoint_interval=500)
+    assert simulator.resimulate(previous) == 0
+    assert_same_flight(simulator, simulate(two_stage(thrust_upper=200)))
@@ -0,0 +1,127 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import simulation_cache
+from rockets import get_settings, single, two_stage
+from simulation_cache import DiskCache, MemoryCache, SimulationCache, get_cache_key, get_entry_size, get_memory_size
+from trajectory import FLIGHT_DATA_DTYPE, MappedTrajectory
+
+
+def get_entry(rows, apoapsis=0):
+    flight_data = np.zeros(rows, dtype=FLIGHT_DATA_DTYPE)
+    flight_data['time'] = np.arange(rows)
+    return flight_data, {'flight events': {'apoapsis': apoapsis}}
+
+
+def test_memory_cache_evicts_least_recently_used():
+    entry_size = get_entry_size(get_entry(10))
+    cache = MemoryCache(max_bytes=entry_size * 3)
+    for key in 'abc':
+        cache.put(key, get_entry(10))
+
+    cache.get('a')
+    cache.put('d', get_entry(10))  # Evicts b, used least recently
+    assert list(cache.entries) == ['c', 'a', 'd']
+    assert cache.get('b') is None
+    assert cache.size == entry_size * 3
+
+    cache.put('a', get_entry(10, apoapsis=1))  # Replacing an entry does not count it twice
+    assert cache.size == entry_size * 3
+    assert cache.get('a')[1]['flight events']['apoapsis'] == 1
+
+    cache.put('e', get_entry(1000))  # Larger than the whole cache, so not kept
+    assert cache.get('e') is None
+    assert len(cache.entries) == 3
+
+
+def test_memory_cache_leaves_trajectory_files_out_of_its_size(tmp_path):
+    # Only the pages of a trajectory file being read are in memory, and the operating system can drop them, so only the results count
+    cache = SimulationCache(memory_max_bytes=1000, db_path=str(tmp_path / 'cache.db'), trajectory_directory=str(tmp_path / 'trajectories'), mapped_min_rows=0)
+    simulator = cache.get_simulator(two_stage(), get_settings())
+    entry = cache.memory.get(get_cache_key(two_stage(), get_settings()))
+
+    assert entry is not None and isinstance(entry[0], MappedTrajectory)
+    assert get_entry_size(entry) > cache.memory.max_bytes
+    assert cache.memory.size == get_memory_size(entry) == len(json.dumps({'flight events': simulator.flight_events}))
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    entry_size = get_entry_size(get_entry(10))
+    cache = DiskCache(str(tmp_path / 'cache.db'), max_bytes=entry_size * 2)
+    cache.put('a', get_entry(10))
+    cache.put('b', get_entry(10))
+    cache.get('a')
+    cache.put('c', get_entry(10))
+
+    # Entries are shared with other connections to the same database
+    cache = DiskCache(str(tmp_path / 'cache.db'), max_bytes=entry_size * 2)
+    assert cache.get('b') is None
+    flight_data, results = cache.get('a')
+    assert np.array_equal(flight_data, get_entry(10)[0])
+    assert results == {'flight events': {'apoapsis': 0}}
+    assert cache.get('c') is not None
+
+    cache.clear()
+    assert cache.get('a') is None
+
+
+def test_disk_cache_deletes_evicted_trajectory_files(tmp_path):
+    cache = SimulationCache(db_path=str(tmp_path / 'cache.db'), trajectory_directory=str(tmp_path / 'trajectories'), mapped_min_rows=0)
+    simulator = cache.get_simulator(single(), get_settings())
+    assert isinstance(simulator.flight_data, MappedTrajectory)
+    path = simulator.flight_data.path
+    assert os.path.exists(path)
+
+    # Evicted by a later entry once the disk cache is too small for both
+    cache.disk.max_bytes = get_entry_size(cache.memory.get(get_cache_key(single(), get_settings()))) + 1
+    cache.disk.put('other', get_entry(10))
+    assert cache.disk.get(get_cache_key(single(), get_settings())) is None
+    assert not os.path.exists(path)
+
+
+def test_cache_key_changes_with_every_input():
+    rocket = two_stage()
+    key = get_cache_key(rocket, get_settings(), integrator='euler')
+
+    renamed = two_stage()
+    renamed.name = 'renamed'
+    assert get_cache_key(renamed, get_settings(), integrator='euler') == key
+
+    heavier = two_stage()
+    heavier.parts[2].mass += 0.01
+    restaged = two_stage()
+    restaged.stages = [[5], [], [3, 2]]
+    changed_keys = [
+        get_cache_key(heavier, get_settings(), integrator='euler'),
+        get_cache_key(restaged, get_settings(), integrator='euler'),
+        get_cache_key(rocket, get_settings(time_increment=0.02), integrator='euler'),
+        get_cache_key(rocket, get_settings(), integrator='adaptive'),
+        get_cache_key(rocket, get_settings()),
+    ]
+    assert len(set(changed_keys + [key])) == len(changed_keys) + 1
+
+
+def test_cache_key_changes_with_the_version(monkeypatch):
+    key = get_cache_key(single(), get_settings())
+    monkeypatch.setattr(simulation_cache, 'CACHE_VERSION', simulation_cache.CACHE_VERSION + 1)
+    assert get_cache_key(single(), get_settings()) != key
+
+
+@pytest.mark.parametrize('mapped_min_rows', [simulation_cache.MAPPED_MIN_ROWS, 0], ids=['in memory', 'trajectory file'])
+def test_cached_simulator_matches_simulating(tmp_path, mapped_min_rows):
+    db_path = str(tmp_path / 'cache.db')
+    trajectory_directory = str(tmp_path / 'trajectories')
+    simulated = SimulationCache(db_path=db_path, trajectory_directory=trajectory_directory, mapped_min_rows=mapped_min_rows).get_simulator(two_stage(), get_settings())
+
+    # A new cache finds the flight on disk, and then in memory
+    cache = SimulationCache(db_path=db_path, trajectory_directory=trajectory_directory, mapped_min_rows=mapped_min_rows)
+    key = get_cache_key(two_stage(), get_settings())
+    assert cache.memory.get(key) is None
+    for _ in range(2):
+        cached = cache.get_simulator(two_stage(), get_settings())
+        assert np.array_equal(cached.flight_data.get_rows(), simulated.flight_data.get_rows())
+        assert cached.flight_events == simulated.flight_events
+        assert cache.memory.get(key) is not None
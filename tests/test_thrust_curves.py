@@ -0,0 +1,73 @@
+import pytest
+
+import thrust_curves
+from part_model import Engine
+from rockets import C6_ENG
+
+
+def test_parse_eng_header_in_si_units():
+    header, times, thrusts = thrust_curves.parse_eng(C6_ENG)
+
+    assert header == {
+        'name': 'C6',
+        'diameter': 0.018,
+        'length': 0.07,
+        'delays': '0-3-5-7',
+        'propellant_mass': 0.0108,
+        'mass': 0.0242,
+        'manufacturer': 'Estes'
+    }
+    assert len(times) == len(thrusts) == 18
+    assert (times[0], thrusts[0]) == (0.031, 0.946)
+    assert (times[-1], thrusts[-1]) == (1.86, 0.0)
+
+
+def test_parse_eng_skips_comments_and_stops_at_the_next_motor():
+    text = 'C6 18 70 0-3-5-7 0.0108 0.0242 Estes  ; trailing comment\n0.5 10 ; point comment\n1.0 0\nD12 24 70 0 0.02 0.04 Estes\n0.5 20\n'
+    header, times, thrusts = thrust_curves.parse_eng(text)
+
+    assert header['manufacturer'] == 'Estes'
+    assert times == [0.5, 1.0]
+    assert thrusts == [10.0, 0.0]
+
+
+def test_parse_eng_manufacturer_with_spaces():
+    header, _, _ = thrust_curves.parse_eng('F50 29 98 4-6-9 0.04 0.08 Aero Tech\n1.0 50\n2.0 0\n')
+    assert header['manufacturer'] == 'Aero Tech'
+
+
+@pytest.mark.parametrize('text', ['', '; only a comment\n', 'C6 18 70 0-3-5-7 0.0108 0.0242 Estes\n', 'C6 18 70\n0.5 10\n'])
+def test_parse_eng_rejects_files_without_a_curve(text):
+    with pytest.raises(Exception):
+        thrust_curves.parse_eng(text)
+
+
+def test_thrust_curve_impulse_and_average_thrust():
+    # A triangle from 0 N at 0 s up to 10 N at 1 s and back down to 0 N at 2 s delivers 10 Ns
+    curve = thrust_curves.ThrustCurve([1, 2], [10, 0])
+
+    assert curve.burn_time == 2
+    assert curve.total_impulse == pytest.approx(10)
+    assert curve.average_thrust == pytest.approx(5)
+    assert curve.get_impulse_fraction(0) == 0
+    assert curve.get_impulse_fraction(0.5) == pytest.approx(0.5)
+    assert curve.get_impulse_fraction(1) == 1
+    assert curve.get_thrust_fraction(0.5) == pytest.approx(2)
+
+
+@pytest.mark.parametrize('times, thrusts', [([1, 1], [5, 0]), ([1, 2], [5, -1]), ([1, 2], [0, 0])])
+def test_thrust_curve_rejects_invalid_curves(times, thrusts):
+    with pytest.raises(Exception):
+        thrust_curves.ThrustCurve(times, thrusts)
+
+
+def test_load_eng_sets_the_motor():
+    engine = Engine()
+    engine.load_eng(C6_ENG)
+    curve = engine.get_thrust_curve()
+
+    assert engine.thrust_curve == C6_ENG
+    assert (engine.diameter, engine.length, engine.mass, engine.propellant_mass) == (0.018, 0.07, 0.0242, 0.0108)
+    assert engine.burn_time == curve.burn_time == 1.86
+    assert engine.average_thrust == curve.average_thrust
+    assert curve is thrust_curves.get_thrust_curve(C6_ENG)  # Shared by every engine using the same file
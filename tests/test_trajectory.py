@@ -0,0 +1,180 @@
+import numpy as np
+import pytest
+
+import rocket_simulator
+from flight_summary import get_crossing_times
+from rockets import get_settings, single, two_stage
+from trajectory import DEFAULT_RECORDING_TOLERANCE, MappedTrajectory, Trajectory, TrajectoryIndex, TrajectoryWriter, write_trajectory
+
+
+def simulate(rocket, **options):
+    simulator = rocket_simulator.Simulator(rocket, get_settings(), **options)
+    simulator.simulate()
+    return simulator
+
+
+def get_brute_force_crossing_times(flight_data, altitude):  # Every pair of rows either side of the altitude, checked one by one
+    altitudes = flight_data['altitude']
+    times = flight_data['time']
+    crossing_times = []
+    for row in range(1, len(altitudes)):
+        if altitudes[row - 1] < altitude <= altitudes[row] or altitudes[row - 1] > altitude >= altitudes[row]:
+            fraction = (altitude - altitudes[row - 1]) / (altitudes[row] - altitudes[row - 1])
+            crossing_times.append(times[row - 1] + (times[row] - times[row - 1]) * fraction)
+
+    return crossing_times
+
+
+def test_trajectory_grows_from_the_first_row():
+    trajectory = Trajectory(capacity=4)
+    assert len(trajectory.data) == 0
+
+    rows = [(step * 0.1, step, 0, 0, 0, 0, 0, 1, 1, 0) for step in range(10)]
+    for row in rows:
+        trajectory.append(row)
+    trajectory.trim()
+
+    assert trajectory['time'].tolist() == [row[0] for row in rows]
+    assert len(trajectory.data) == 10
+
+
+@pytest.mark.parametrize('options', [{}, {'analytic_coast': True}, {'integrator': 'adaptive'}], ids=['euler', 'analytic coast', 'adaptive'])
+@pytest.mark.parametrize('make_rocket', [two_stage, single], ids=['two stage', 'single'])
+def test_decimated_recording(make_rocket, options):
+    full = simulate(make_rocket(), **options)
+    decimated = simulate(make_rocket(), recording_tolerance={}, **options)
+    full_rows = full.flight_data.get_rows()
+    decimated_rows = decimated.flight_data.get_rows()
+
+    assert len(decimated_rows) <= len(full_rows)
+    assert np.isin(decimated_rows['time'], full_rows['time']).all()
+    assert decimated_rows[0].tolist() == full_rows[0].tolist()
+    assert decimated_rows[-1].tolist() == full_rows[-1].tolist()
+
+    # Flight events are kept rows, moved to their place among the kept rows
+    for event, row in full.flight_events.items():
+        assert decimated_rows[decimated.flight_events[event]].tolist() == full_rows[row].tolist(), event
+
+    # Adaptive steps are already few, and land twice on the time of a staging, so rows cannot be told apart by time
+    if options.get('integrator') == 'adaptive':
+        return None
+
+    # Every row left out is within tolerance of the kept rows either side, and the stage is never interpolated
+    assert len(decimated_rows) < len(full_rows) / 4
+    interpolated = decimated.flight_data.interpolate(full_rows['time'])
+    assert np.array_equal(interpolated['stage'], full_rows['stage'])
+    for key, tolerance in DEFAULT_RECORDING_TOLERANCE.items():
+        assert np.abs(interpolated[key] - full_rows[key]).max() <= tolerance * (1 + 1e-9), key
+
+
+def test_decimated_recording_with_a_tolerance():
+    loose = simulate(two_stage(), recording_tolerance={'altitude': 1})
+    strict = simulate(two_stage(), recording_tolerance={})
+    full = simulate(two_stage())
+
+    assert len(loose.flight_data['time']) < len(strict.flight_data['time'])
+    interpolated = loose.flight_data.interpolate(full.flight_data['time'])
+    assert np.abs(interpolated['altitude'] - full.flight_data['altitude']).max() <= 1
+
+    with pytest.raises(Exception):
+        simulate(two_stage(), recording_tolerance={'stage': 1})
+
+
+@pytest.mark.parametrize('recording_tolerance', [None, {}], ids=['every row', 'decimated'])
+def test_trajectory_file_round_trip(tmp_path, recording_tolerance):
+    simulator = simulate(two_stage(), recording_tolerance=recording_tolerance)
+    path = str(tmp_path / 'flight.traj')
+    mapped = write_trajectory(path, simulator.flight_data, simulator.flight_events, 0.01)
+
+    reopened = MappedTrajectory(path)
+    for flight_data in [mapped, reopened]:
+        assert flight_data.dtype == simulator.flight_data.dtype
+        assert flight_data.length == len(simulator.flight_data.get_rows())
+        assert flight_data.time_increment == 0.01
+        assert flight_data.flight_events == simulator.flight_events
+        assert np.array_equal(flight_data.get_rows(), simulator.flight_data.get_rows())
+        for key in flight_data:
+            assert np.array_equal(flight_data[key], simulator.flight_data[key]), key
+
+    times = np.linspace(0, simulator.flight_data['time'][-1], 301)
+    assert np.array_equal(reopened.interpolate(times), simulator.flight_data.interpolate(times))
+
+
+def test_trajectory_writer_in_blocks(tmp_path):
+    rows = simulate(single()).flight_data.get_rows()
+    writer = TrajectoryWriter(str(tmp_path / 'flight.traj'), block_rows=7)
+    for row in rows[:100].tolist():
+        writer.append(row)
+    writer.extend(rows[100:150])
+    for row in rows[150:].tolist():
+        writer.append(row)
+
+    assert np.array_equal(writer.close().get_rows(), rows)
+    assert not (tmp_path / 'flight.traj.rows').exists()
+
+    empty = TrajectoryWriter(str(tmp_path / 'empty.traj')).close()
+    assert empty.length == 0 and len(empty['time']) == 0
+
+    (tmp_path / 'other.traj').write_bytes(b'not a trajectory file')
+    with pytest.raises(Exception):
+        MappedTrajectory(str(tmp_path / 'other.traj'))
+
+
+@pytest.mark.parametrize('options', [{}, {'recording_tolerance': {}}, {'analytic_coast': True}, {'integrator': 'adaptive'}],
+                         ids=['euler', 'decimated', 'analytic coast', 'adaptive'])
+def test_simulating_to_a_trajectory_file(tmp_path, options):
+    in_memory = simulate(two_stage(), **options)
+    to_file = simulate(two_stage(), trajectory_file=str(tmp_path / 'flight.traj'), **options)
+
+    assert isinstance(to_file.flight_data, MappedTrajectory)
+    assert np.array_equal(to_file.flight_data.get_rows(), in_memory.flight_data.get_rows())
+    assert to_file.flight_events == in_memory.flight_events
+    assert MappedTrajectory(str(tmp_path / 'flight.traj')).flight_events == in_memory.flight_events
+
+
+@pytest.mark.parametrize('recording_tolerance', [None, {}], ids=['every row', 'decimated'])
+def test_crossing_times_match_brute_force(recording_tolerance):
+    flight_data = simulate(two_stage(), recording_tolerance=recording_tolerance).flight_data
+    altitudes = flight_data['altitude']
+    crossing_altitudes = np.linspace(altitudes.min(), altitudes.max(), 101)[1:-1].tolist() + [float(altitudes[10])]
+
+    crossing_times = get_crossing_times(flight_data, crossing_altitudes)
+    for altitude in crossing_altitudes:
+        expected = get_brute_force_crossing_times(flight_data, altitude)
+        assert crossing_times[altitude] == pytest.approx(expected), altitude
+    assert len(crossing_times[crossing_altitudes[50]]) == 2  # Up and down
+
+    assert get_crossing_times(flight_data, [altitudes.max() + 1]) == {altitudes.max() + 1: []}
+
+
+def test_index_lookups():
+    flight_data = simulate(two_stage(), recording_tolerance={}).flight_data
+    trajectory_index = TrajectoryIndex(flight_data)
+    times = flight_data['time']
+
+    for key in flight_data:
+        assert trajectory_index.get_max(key) == (flight_data[key].max(), times[np.argmax(flight_data[key])])
+        assert trajectory_index.get_min(key) == (flight_data[key].min(), times[np.argmin(flight_data[key])])
+
+    lookup_times = np.concatenate(([-1, 0, times[-1], times[-1] + 1], times[::7], np.random.default_rng(1).uniform(0, times[-1], 200)))
+    for time in lookup_times:
+        row = trajectory_index.get_row(time)
+        assert row == max(np.flatnonzero(times <= time).tolist() + [0])
+        assert np.array_equal(trajectory_index.interpolate(time), flight_data.interpolate(time))
+
+
+def test_index_updated_while_simulating():
+    # Indexing the rows a few at a time, as the player does while the flight is simulated, ends up the same as indexing them at once
+    flight_data = simulate(two_stage()).flight_data
+    rows = flight_data.get_rows()
+    whole_index = TrajectoryIndex(flight_data)
+
+    trajectory_index = TrajectoryIndex(Trajectory.from_array(rows[:1]))
+    for length in range(1, len(rows) + 500, 500):
+        trajectory_index.update(Trajectory.from_array(rows[:length]))
+
+    assert trajectory_index.length == len(rows)
+    assert trajectory_index.segment_starts == whole_index.segment_starts
+    assert trajectory_index.max_rows == whole_index.max_rows
+    assert trajectory_index.min_rows == whole_index.min_rows
+    assert trajectory_index.get_crossing_times(100) == whole_index.get_crossing_times(100)
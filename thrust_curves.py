@@ -0,0 +1,98 @@
+import functools
+
+import numpy as np
+
+from tables import get_table_value
+
+# Thrust curves of real motors, read from RASP .eng files. Lines starting with ; are comments, then a header line
+# name diameter(mm) length(mm) delays propellant_mass(kg) total_mass(kg) manufacturer
+# is followed by one time (s) and thrust (N) pair per line, the curve starting from no thrust at time 0
+# A curve only sets the shape of the thrust, an engine scales it to its own average_thrust and burn_time. Propellant is burnt in
+# proportion to the impulse delivered
+
+TABLE_SIZE = 1024  # Intervals in the tables over the burn, so thrust and impulse are found by indexing rather than searching the curve
+TABLE_SPACING = 1 / TABLE_SIZE  # Progress of the burn between table values
+
+
+def parse_eng(text):  # Returns (header, times, thrusts) of the first motor in a RASP .eng file, header being a dictionary in SI units
+    header = None
+    times = []
+    thrusts = []
+
+    for line in text.splitlines():
+        values = line.split(';')[0].split()
+        if len(values) == 0:
+            continue
+
+        if header is None:
+            if len(values) < 7:
+                raise Exception(f'Invalid .eng header: {line}')
+            header = {
+                'name': values[0],
+                'diameter': float(values[1]) / 1000,
+                'length': float(values[2]) / 1000,
+                'delays': values[3],
+                'propellant_mass': float(values[4]),
+                'mass': float(values[5]),
+                'manufacturer': ' '.join(values[6:])
+            }
+        elif len(values) == 2:
+            times.append(float(values[0]))
+            thrusts.append(float(values[1]))
+        else:  # Header of the next motor in the file
+            break
+
+    if header is None or len(times) == 0:
+        raise Exception('No thrust curve found in .eng file')
+
+    return header, times, thrusts
+
+
+class ThrustCurve():
+    # Tables of the curve over the progress of the burn, from 0 at ignition to 1 at burnout, made once when the curve is loaded
+    # impulse_fractions is the fraction of the total impulse delivered, thrust_fractions the thrust as a fraction of the average
+    def __init__(self, times, thrusts):
+        times = np.array(times, dtype=float)
+        thrusts = np.array(thrusts, dtype=float)
+        if times[0] > 0:
+            times = np.concatenate(([0], times))
+            thrusts = np.concatenate(([0], thrusts))
+
+        if np.any(np.diff(times) <= 0) or np.any(thrusts < 0):
+            raise Exception('Thrust curve times must increase and thrusts must not be negative')
+
+        # Impulse at each point of the curve, the thrust being linear between points
+        point_impulses = np.concatenate(([0], np.cumsum(np.diff(times) * (thrusts[:-1] + thrusts[1:]) / 2)))
+
+        self.burn_time = float(times[-1])
+        self.total_impulse = float(point_impulses[-1])
+        if self.burn_time <= 0 or self.total_impulse <= 0:
+            raise Exception('Thrust curve delivers no impulse')
+        self.average_thrust = self.total_impulse / self.burn_time
+
+        # Impulse at evenly spaced times, integrating exactly within the segment of the curve each time falls in
+        table_times = np.linspace(0, self.burn_time, TABLE_SIZE + 1)
+        segments = np.clip(np.searchsorted(times, table_times, side='right') - 1, 0, len(times) - 2)
+        elapsed = table_times - times[segments]
+        slopes = (thrusts[segments + 1] - thrusts[segments]) / (times[segments + 1] - times[segments])
+        table_impulses = point_impulses[segments] + thrusts[segments] * elapsed + slopes * elapsed**2 / 2
+
+        self.impulse_fractions = table_impulses / self.total_impulse
+        self.impulse_fractions[0] = 0
+        self.impulse_fractions[-1] = 1
+        self.thrust_fractions = np.interp(table_times, times, thrusts) / self.average_thrust
+
+        self.impulse_fraction_list = self.impulse_fractions.tolist()
+        self.thrust_fraction_list = self.thrust_fractions.tolist()
+
+    def get_impulse_fraction(self, progress):
+        return get_table_value(self.impulse_fraction_list, 0, TABLE_SPACING, TABLE_SIZE, progress)
+
+    def get_thrust_fraction(self, progress):
+        return get_table_value(self.thrust_fraction_list, 0, TABLE_SPACING, TABLE_SIZE, progress)
+
+
+@functools.lru_cache(maxsize=None)
+def get_thrust_curve(text):  # ThrustCurve of a .eng file, made once and shared by every engine using the same file
+    _, times, thrusts = parse_eng(text)
+    return ThrustCurve(times, thrusts)
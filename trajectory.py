@@ -0,0 +1,504 @@
+import bisect
+import collections.abc
+import json
+import math
+import os
+
+import numpy as np
+
+FLIGHT_DATA_DTYPE = np.dtype([
+    ('time', float),
+    ('altitude', float),
+    ('velocity', float),
+    ('acceleration', float),
+    ('g-force', float),
+    ('thrust', float),
+    ('drag', float),
+    ('fuel', float),
+    ('mass', float),
+    ('stage', int)
+])
+
+MAX_INITIAL_CAPACITY = 65536  # Rows allocated up front at most, long flights grow past this geometrically
+
+# A trajectory file is TRAJECTORY_FILE_MAGIC, the length of the header as an 8 byte little endian integer, then the header as JSON
+# {"channels": [[key, dtype], ...], "length": rows, "time increment": s, "flight events": {event: row}}, padded with spaces to a
+# multiple of 8 bytes, then each channel's values one after another in the order of the channels
+TRAJECTORY_FILE_MAGIC = b'RSTRAJ01'
+TRAJECTORY_FILE_BLOCK_ROWS = 65536  # Rows written at a time
+
+# Largest error allowed in each channel when rows are left out of a recording and linearly interpolated back, see Decimator
+DEFAULT_RECORDING_TOLERANCE = {
+    'altitude': 0.01,  # m
+    'velocity': 0.01,  # m/s
+    'acceleration': 0.01,  # m/s^2
+    'g-force': 0.001,  # G's
+    'thrust': 0.01,  # N
+    'drag': 0.01,  # N
+    'fuel': 1e-6,
+    'mass': 1e-6  # kg
+}
+
+
+def get_expected_length(settings):  # Number of steps a flight lasts if it reaches the time cutoff
+    try:
+        return int(settings['time cutoff'] / settings['time increment']) + 2
+    except (KeyError, ZeroDivisionError):
+        return 0
+
+
+def check_recording_tolerance(tolerance, dtype=FLIGHT_DATA_DTYPE):  # Time and stage are never interpolated, so they cannot have one
+    for key in tolerance:
+        if key not in dtype.names or key in ['time', 'stage']:
+            raise Exception(f'No flight data channel called {key} to give a tolerance for')
+
+
+class Trajectory(collections.abc.Mapping):
+    # Columnar store for flight data, one row per recorded step in a preallocated structured array
+    # Indexing by key gives a view of that column, so flight_data['altitude'] works as it did with lists
+    def __init__(self, dtype=FLIGHT_DATA_DTYPE, capacity=1024, max_capacity=None):
+        self.dtype = dtype
+        self.max_capacity = max_capacity  # Capacity the buffer should never need to grow past, if known
+
+        # The buffer is allocated with the first row, so simulators that never record, or take an earlier result, never allocate it
+        self.initial_capacity = max(capacity, 1)
+        self.data = np.empty(0, dtype=self.dtype)
+        self.length = 0
+
+        # Rows after the recorded ones that are only generated once the flight data is read
+        self.tail_length = 0
+        self.get_tail_rows = None
+
+    @classmethod
+    def from_settings(cls, settings, dtype=FLIGHT_DATA_DTYPE):
+        expected_length = get_expected_length(settings)
+        if expected_length == 0:
+            return cls(dtype)
+
+        return cls(dtype, capacity=min(expected_length, MAX_INITIAL_CAPACITY), max_capacity=expected_length)
+
+    @classmethod
+    def from_array(cls, data):  # Trajectory over an existing array of complete rows, such as one loaded from the result cache
+        trajectory = cls(data.dtype, capacity=1)
+        trajectory.data = data
+        trajectory.length = len(data)
+
+        return trajectory
+
+    def __getitem__(self, key):
+        if self.get_tail_rows is not None:
+            self.generate_tail()
+
+        return self.data[key][:self.length]
+
+    def __iter__(self):
+        return iter(self.dtype.names)
+
+    def __len__(self):
+        return len(self.dtype.names)
+
+    def append(self, row):  # row is a tuple of values in the same order as the dtype fields
+        if self.length == len(self.data):
+            self.grow()
+
+        self.data[self.length] = row
+        self.length += 1
+
+    def extend(self, rows):  # rows is an array of rows
+        while self.length + len(rows) > len(self.data):
+            self.grow()
+
+        self.data[self.length:self.length + len(rows)] = rows
+        self.length += len(rows)
+
+    def grow(self):
+        if len(self.data) == 0:
+            self.data = np.empty(self.initial_capacity, dtype=self.dtype)
+            return None
+
+        capacity = 2 * len(self.data)
+        if self.max_capacity is not None and len(self.data) < self.max_capacity:
+            capacity = min(capacity, self.max_capacity)
+
+        new_data = np.empty(capacity, dtype=self.dtype)
+        new_data[:self.length] = self.data[:self.length]
+        self.data = new_data
+
+    def set_tail(self, length, get_tail_rows):  # get_tail_rows(steps) returns the rows for an array of steps 1 to length after the last recorded row
+        self.tail_length = length
+        self.get_tail_rows = get_tail_rows
+
+    def generate_tail(self):
+        get_tail_rows = self.get_tail_rows
+        self.get_tail_rows = None
+
+        new_data = np.empty(self.length + self.tail_length, dtype=self.dtype)
+        new_data[:self.length] = self.data[:self.length]
+        new_data[self.length:] = get_tail_rows(np.arange(1, self.tail_length + 1))
+
+        self.data = new_data
+        self.length += self.tail_length
+        self.tail_length = 0
+
+    def get_rows(self):  # Every row, including the tail
+        if self.get_tail_rows is not None:
+            self.generate_tail()
+
+        return self.data[:self.length]
+
+    def get_recorded(self, key):  # Column of the rows recorded so far, without generating the tail
+        return self.data[key][:self.length]
+
+    def trim(self):  # Releases the unused capacity once no more rows will be added
+        if self.length != len(self.data):
+            self.data = self.data[:self.length].copy()
+
+    def interpolate(self, times):  # Rows at the given time or array of times, see interpolate_trajectory
+        return interpolate_trajectory(self, times)
+
+
+def interpolate_trajectory(trajectory, times, rows=None):  # Rows at the given time or array of times, linearly interpolated between the rows either side
+    # The stage is never interpolated, it is the stage of the row at or before each time. Times outside the flight are clamped to it
+    # Only the rows either side of each time are read, so a MappedTrajectory only reads the parts of the file it needs
+    # rows are the rows at or before each time, if they are already known, see TrajectoryIndex.interpolate
+    scalar = np.ndim(times) == 0
+    times = np.atleast_1d(np.asarray(times, dtype=float))
+    recorded_times = trajectory['time']
+    result = np.empty(len(times), dtype=trajectory.dtype)
+
+    if len(recorded_times) == 1:
+        for key in trajectory.dtype.names:
+            result[key] = trajectory[key][0]
+        return result[0] if scalar else result
+
+    if rows is None:
+        rows = np.searchsorted(recorded_times, times, side='right') - 1
+    before = np.clip(rows, 0, len(recorded_times) - 2)
+    after = before + 1
+    interval = recorded_times[after] - recorded_times[before]
+    weight = np.clip(np.divide(times - recorded_times[before], interval, out=np.ones(len(times)), where=interval > 0), 0, 1)
+
+    for key in trajectory.dtype.names:
+        values = trajectory[key]
+        if key == 'stage':
+            result[key] = np.where(weight >= 1, values[after], values[before])
+        else:
+            result[key] = values[before] + (values[after] - values[before]) * weight
+
+    return result[0] if scalar else result
+
+
+class TrajectoryIndex():
+    # Extremes of every channel and the runs of rows over which the altitude only rises or only falls, worked out once per flight so
+    # lookups while it is played back never scan the whole trajectory. A flight still being simulated is indexed a few rows at a time,
+    # update only reading the rows added since it was last called
+    def __init__(self, trajectory):
+        self.trajectory = trajectory
+        self.length = 0  # Rows indexed
+
+        self.min_rows = {}  # {key: row with the lowest value}
+        self.max_rows = {}
+        self.segment_starts = [0]  # First row of each run of rows the altitude is monotonic over, each run ends at the first row of the next
+        self.direction = 0  # 1 if the altitude of the last run is rising, -1 if falling, 0 if it has not changed yet
+
+        self.update(trajectory)
+
+    def update(self, trajectory):  # trajectory has the same rows as the one indexed so far, with any number of new rows after them
+        self.trajectory = trajectory
+        length = len(trajectory['time'])
+        if length <= self.length:
+            return None
+
+        start = self.length
+        for key in trajectory.dtype.names:
+            values = trajectory[key][start:length]
+            min_row = start + int(np.argmin(values))
+            max_row = start + int(np.argmax(values))
+            if key not in self.min_rows or values[min_row - start] < trajectory[key][self.min_rows[key]]:
+                self.min_rows[key] = min_row
+            if key not in self.max_rows or values[max_row - start] > trajectory[key][self.max_rows[key]]:
+                self.max_rows[key] = max_row
+
+        # Direction of each step between rows, a level step continuing the direction before it, so a new run starts where it reverses
+        altitude = trajectory['altitude'][max(start - 1, 0):length]
+        directions = np.concatenate(([self.direction], np.sign(np.diff(altitude))))
+        last_change = np.maximum.accumulate(np.where(directions != 0, np.arange(len(directions)), 0))
+        directions = directions[last_change]
+        reversals = np.flatnonzero((directions[1:] != directions[:-1]) & (directions[:-1] != 0))
+        self.segment_starts.extend((max(start - 1, 0) + reversals).tolist())
+        self.direction = int(directions[-1])
+
+        self.length = length
+
+    def get_row(self, time):  # Last row at or before a time, clamped to the rows
+        row = int(np.searchsorted(self.trajectory['time'], time, side='right')) - 1
+        return min(max(row, 0), self.length - 1)
+
+    def interpolate(self, time):  # Row at a time, as Trajectory.interpolate, the rows either side found with get_row
+        return interpolate_trajectory(self.trajectory, time, self.get_row(time))
+
+    def get_min(self, key):  # (lowest value of a channel, time of the row it is at)
+        row = self.min_rows[key]
+        return self.trajectory[key][row].item(), self.trajectory['time'][row].item()
+
+    def get_max(self, key):
+        row = self.max_rows[key]
+        return self.trajectory[key][row].item(), self.trajectory['time'][row].item()
+
+    def get_crossing_times(self, altitude):  # Times the rocket passes through an altitude, interpolated between the rows either side
+        altitudes = self.trajectory['altitude']
+        times = self.trajectory['time']
+        ends = self.segment_starts[1:] + [self.length - 1]
+
+        crossing_times = []
+        for start, end in zip(self.segment_starts, ends):
+            low, high = sorted((altitudes[start], altitudes[end]))
+            if not low <= altitude <= high or (len(crossing_times) > 0 and times[start] == crossing_times[-1]):
+                continue
+
+            # Within a run the altitudes are sorted, so the first row at or past the altitude is found by bisection
+            if altitudes[end] >= altitudes[start]:
+                row = start + int(np.searchsorted(altitudes[start:end + 1], altitude, side='left'))
+            else:  # Reversed, the rows at or below the altitude are the first ones
+                row = end + 1 - int(np.searchsorted(altitudes[start:end + 1][::-1], altitude, side='right'))
+
+            if row == start:
+                crossing_times.append(float(times[start]))
+            else:
+                fraction = (altitude - altitudes[row - 1]) / (altitudes[row] - altitudes[row - 1])
+                crossing_times.append(float(times[row - 1] + (times[row] - times[row - 1]) * fraction))
+
+        return crossing_times
+
+
+class TrajectoryWriter():
+    # Writes flight data to a trajectory file as the rows are produced, so it never has to fit in memory. Takes the place of a
+    # Trajectory while simulating: rows are appended a block at a time to a temporary file next to path, and rearranged into
+    # columns by close, which returns the finished file opened as a MappedTrajectory
+    def __init__(self, path, dtype=FLIGHT_DATA_DTYPE, block_rows=TRAJECTORY_FILE_BLOCK_ROWS):
+        self.path = path
+        self.rows_path = path + '.rows'
+        self.dtype = dtype
+        self.rows_file = None  # Opened when the first block is written
+
+        self.block = np.empty(block_rows, dtype=self.dtype)
+        self.block_length = 0
+        self.length = 0
+
+        self.tail_length = 0
+        self.get_tail_rows = None
+
+    def append(self, row):  # row is a tuple of values in the same order as the dtype fields
+        self.block[self.block_length] = row
+        self.block_length += 1
+        self.length += 1
+
+        if self.block_length == len(self.block):
+            self.flush()
+
+    def extend(self, rows):  # rows is an array of rows
+        self.flush()
+        self.get_rows_file().write(np.ascontiguousarray(rows, dtype=self.dtype).tobytes())
+        self.length += len(rows)
+
+    def flush(self):
+        if self.block_length > 0:
+            self.get_rows_file().write(self.block[:self.block_length].tobytes())
+            self.block_length = 0
+
+    def get_rows_file(self):
+        if self.rows_file is None:
+            self.rows_file = open(self.rows_path, 'wb')
+
+        return self.rows_file
+
+    def set_tail(self, length, get_tail_rows):  # As Trajectory.set_tail, the rows are generated when the file is closed
+        self.tail_length = length
+        self.get_tail_rows = get_tail_rows
+
+    def trim(self):  # Nothing is held in memory beyond the current block
+        pass
+
+    def close(self, flight_events=None, time_increment=None):  # Writes the trajectory file and returns it opened as a MappedTrajectory
+        block_rows = len(self.block)
+        for start in range(1, self.tail_length + 1, block_rows):
+            self.extend(self.get_tail_rows(np.arange(start, min(start + block_rows, self.tail_length + 1))))
+        self.tail_length = 0
+        self.get_tail_rows = None
+
+        self.flush()
+        self.get_rows_file().close()
+
+        header = {
+            'channels': [[key, self.dtype[key].str] for key in self.dtype.names],
+            'length': self.length,
+            'time increment': time_increment,
+            'flight events': flight_events if flight_events is not None else {}
+        }
+        header_bytes = json.dumps(header).encode()
+        header_bytes += b' ' * (-len(header_bytes) % 8)
+
+        column_offsets = {}
+        offset = len(TRAJECTORY_FILE_MAGIC) + 8 + len(header_bytes)
+        for key in self.dtype.names:
+            column_offsets[key] = offset
+            offset += self.length * self.dtype[key].itemsize
+
+        with open(self.path, 'wb') as trajectory_file:
+            trajectory_file.write(TRAJECTORY_FILE_MAGIC + len(header_bytes).to_bytes(8, 'little') + header_bytes)
+            trajectory_file.truncate(offset)
+
+            # One pass through the rows, writing each block of rows to every column
+            with open(self.rows_path, 'rb') as rows_file:
+                for start in range(0, self.length, block_rows):
+                    rows = np.frombuffer(rows_file.read(block_rows * self.dtype.itemsize), dtype=self.dtype)
+                    for key in self.dtype.names:
+                        trajectory_file.seek(column_offsets[key] + start * self.dtype[key].itemsize)
+                        trajectory_file.write(np.ascontiguousarray(rows[key]).tobytes())
+
+        os.remove(self.rows_path)
+
+        return MappedTrajectory(self.path)
+
+
+class MappedTrajectory(collections.abc.Mapping):
+    # A trajectory file opened with numpy.memmap, read only. Opening it only reads the header, and each channel is read from the
+    # file as it is used, so flights too long for memory can still be shown and graphed
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as trajectory_file:
+            if trajectory_file.read(len(TRAJECTORY_FILE_MAGIC)) != TRAJECTORY_FILE_MAGIC:
+                raise Exception(f'{path} is not a trajectory file')
+            header_length = int.from_bytes(trajectory_file.read(8), 'little')
+            header = json.loads(trajectory_file.read(header_length))
+
+        self.dtype = np.dtype([(key, dtype) for key, dtype in header['channels']])
+        self.length = header['length']
+        self.time_increment = header['time increment']
+        self.flight_events = header['flight events']
+
+        self.columns = {}
+        offset = len(TRAJECTORY_FILE_MAGIC) + 8 + header_length
+        for key in self.dtype.names:
+            if self.length > 0:
+                self.columns[key] = np.memmap(path, dtype=self.dtype[key], mode='r', offset=offset, shape=(self.length,))
+            else:  # numpy.memmap cannot map nothing
+                self.columns[key] = np.empty(0, dtype=self.dtype[key])
+            offset += self.length * self.dtype[key].itemsize
+
+        self.nbytes = offset  # Size of the file
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __iter__(self):
+        return iter(self.dtype.names)
+
+    def __len__(self):
+        return len(self.dtype.names)
+
+    def get_rows(self):  # Every row as a structured array, which reads the whole file into memory
+        rows = np.empty(self.length, dtype=self.dtype)
+        for key in self.dtype.names:
+            rows[key] = self.columns[key]
+
+        return rows
+
+    def get_recorded(self, key):
+        return self.columns[key]
+
+    def interpolate(self, times):
+        return interpolate_trajectory(self, times)
+
+
+def write_trajectory(path, trajectory, flight_events=None, time_increment=None):  # Writes flight data held in memory to a trajectory file
+    writer = TrajectoryWriter(path, trajectory.dtype)
+    writer.extend(trajectory.get_rows())
+
+    return writer.close(flight_events, time_increment)
+
+
+class Decimator():
+    # Records only the rows needed to linearly interpolate every channel of the flight data back to within its tolerance
+    # Rows are decided on as they arrive (the swing door method): every row since the last kept one must stay within tolerance of a
+    # straight line from it, so each channel keeps the range of slopes that line may have, and a row outside any of them ends the line
+    # The stage is never interpolated, so the rows either side of a change of stage have to be kept, as do any rows marked as events
+    def __init__(self, trajectory, tolerance=DEFAULT_RECORDING_TOLERANCE):
+        tolerance = dict(DEFAULT_RECORDING_TOLERANCE, **tolerance)
+        check_recording_tolerance(tolerance, trajectory.dtype)
+
+        self.trajectory = trajectory
+        self.tolerance = tolerance
+        self.channels = [(trajectory.dtype.names.index(key), tolerance[key]) for key in trajectory.dtype.names if key in tolerance]
+
+        self.steps = []  # Step number of each kept row, used to find the rows of flight events
+        self.anchor = None  # Last kept row, the start of the current line
+        self.pending = None  # (row, step) of the last row added, kept if the line cannot reach the next row
+        self.low_slopes = None
+        self.high_slopes = None
+
+    def add(self, row, step, keep=False, keep_previous=False):  # row is a tuple of values in the same order as the dtype fields
+        if self.anchor is not None and not keep_previous and self.extend_line(row):
+            if keep:
+                self.keep_row(row, step)
+            else:
+                self.pending = (row, step)
+            return None
+
+        # The line cannot reach row, so it ends at the row before
+        if self.pending is not None:
+            self.keep_row(*self.pending)
+
+        if keep or self.anchor is None or not self.extend_line(row):
+            self.keep_row(row, step)
+        else:
+            self.pending = (row, step)
+
+    def extend_line(self, row):  # Narrows the slopes to pass within tolerance of row, if a line from the last kept row still can
+        anchor = self.anchor
+        interval = row[0] - anchor[0]
+        if interval <= 0:
+            return False
+
+        low_slopes = []
+        high_slopes = []
+        for (index, tolerance), low_slope, high_slope in zip(self.channels, self.low_slopes, self.high_slopes):
+            change = row[index] - anchor[index]
+            if change < low_slope * interval or change > high_slope * interval:
+                return False
+
+            slope = (change - tolerance) / interval
+            low_slopes.append(slope if slope > low_slope else low_slope)
+            slope = (change + tolerance) / interval
+            high_slopes.append(slope if slope < high_slope else high_slope)
+
+        self.low_slopes = low_slopes
+        self.high_slopes = high_slopes
+        return True
+
+    def keep_row(self, row, step):
+        self.trajectory.append(row)
+        self.steps.append(step)
+
+        self.anchor = row
+        self.pending = None
+        self.low_slopes = [-math.inf] * len(self.channels)
+        self.high_slopes = [math.inf] * len(self.channels)
+
+    def get_state(self):  # Everything deciding which of the rows still to come are kept, see set_state
+        # The slope lists are replaced rather than changed, so the state can hold on to them without a copy
+        return (self.anchor, self.pending, self.low_slopes, self.high_slopes)
+
+    def set_state(self, state, steps):  # Carries on from the state of a decimator which had kept rows at steps, a list of their step numbers
+        self.anchor, self.pending, self.low_slopes, self.high_slopes = state
+        self.steps = steps
+
+    def finish(self):  # Keeps the last row added, once no more will be
+        if self.pending is not None:
+            self.keep_row(*self.pending)
+
+        self.trajectory.trim()
+
+    def get_row(self, step):  # Index in the kept rows of the row for a step, which must have been kept
+        return bisect.bisect_left(self.steps, step)